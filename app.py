@@ -3,14 +3,33 @@ from flask import Flask, render_template, request, Response
 from backend.matcher import *
 from backend.all_flow import recognize_multi_cards
 import json
-from backend.choice_flow import process_uploaded_image, draw_boxes
-from backend.detection_api import get_roboflow_predictions
+from backend import choice_session
+from backend import jobs
 from flask import session, jsonify
+from backend.feature_store import preload
+from backend.price_batch import iter_price_html, start_prefetch
+from backend.card_info import load as load_card_info
+from backend.index_registry import stats as index_stats
+from backend import result_cache
+from backend import metrics
 
 
 app = Flask(__name__)
 app.secret_key = "tim-secret-123"  # 🔐 Replace with something random in production
 
+# GET /metrics（Prometheus 文字格式）；YGO_SERVER_TIMING=1 時回應附上各階段耗時
+metrics.init_app(app)
+
+# 啟動時預先載入圖庫快取，例如 YGO_PRELOAD=all,effect（未設定時於第一次請求載入）
+preload(c.strip() for c in os.environ.get("YGO_PRELOAD", "").split(",") if c.strip())
+
+# 啟動時解析所有卡片資訊檔（資訊目錄變動時查詢端會自動重新載入）
+load_card_info()
+
+# 背景替最常辨識出的卡片預先查價（YGO_PRICE_PREFETCH=1 時啟用）
+if os.environ.get("YGO_PRICE_PREFETCH") == "1":
+    start_prefetch()
+
 
 def get_css_files():
     css_folder = os.path.join(app.static_folder, 'css')
@@ -36,16 +55,14 @@ def all():
 @app.route('/choice')
 def choice():
     try:
-        image_path = os.path.join(os.path.dirname(__file__), "uploads", "choice_temp.jpg")
-        output_dir = os.path.join(os.path.dirname(__file__), "uploads")
-
-        # ✅ Step 1: Get predictions
-        predictions = get_roboflow_predictions(image_path)
+        sess = choice_session.get(session.get("choice_token"))
+        if sess is None:
+            return Response("<p>❌ 請先上傳一張圖檔</p>", status=400, mimetype='text/html; charset=utf-8')
 
-        # ✅ Step 2: Process image with predictions
-        boxed_path, cropped_paths = process_uploaded_image(image_path, predictions, output_dir)
+        # ✅ Step 1: Get predictions（同一次上傳只偵測一次）
+        predictions = sess.detect()
 
-        # ✅ Step 3: Serialize prediction boxes to JSON
+        # ✅ Step 2: Serialize prediction boxes to JSON
         boxes_json = json.dumps(predictions)
 
         print("Predictions:", predictions)
@@ -53,7 +70,8 @@ def choice():
         return render_template(
             'choice.html',
             css_files=get_css_files(), 
-            image_data=boxed_path,
+            image_data=f"/choice/{sess.token}/boxed.jpg",
+            crop_prefix=f"/choice/{sess.token}/crop/",
             boxes_json=boxes_json,
             page_class='page-choice',
         )
@@ -73,7 +91,6 @@ def match_one():
         return jsonify({"error": "❌ 請正確上傳一張圖檔"}), 400
 
     img_data = file.read()
-    temp_path = os.path.join("uploads", "temp.jpg")
 
     try:
         result = process_image(img_data)
@@ -95,11 +112,6 @@ def match_one():
         import traceback
         traceback.print_exc()
         return jsonify({"error": f"處理錯誤：{str(e)}"}), 500
-    finally:
-        try:
-            os.remove(temp_path)
-        except Exception as e:
-            print(f"⚠️ 無法刪除上傳圖檔: {e}")
 
 @app.route('/get_price', methods=['POST'])
 def get_price():
@@ -112,6 +124,25 @@ def get_price():
     price_html = get_price_html(card_name_jp)
     return jsonify({"price_html": price_html})
 
+@app.route('/get_prices', methods=['POST'])
+def get_prices():
+    """ 批次查價：以 NDJSON 串流回傳，每完成一張卡回傳一行 {card_name_jp, price_html} """
+    data = request.get_json(silent=True) or {}
+    names = data.get("card_names_jp") or []
+    if not isinstance(names, list):
+        return jsonify({"error": "card_names_jp 必須是清單"}), 400
+
+    def generate():
+        for card_name_jp, price_html in iter_price_html(str(n) for n in names):
+            yield json.dumps({"card_name_jp": card_name_jp, "price_html": price_html}, ensure_ascii=False) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson; charset=utf-8')
+
+@app.route('/cache_stats')
+def cache_stats():
+    """ 辨識結果快取的命中率、索引常駐狀態與背景工作佇列 """
+    return jsonify({"result_cache": result_cache.stats(), "index": index_stats(), "jobs": jobs.stats()})
+
 # ----------- 多卡辨識 -----------
 @app.route('/match_all', methods=['POST'])
 def match_all():
@@ -120,23 +151,68 @@ def match_all():
         print("❌ 沒有收到圖片")
         return Response("<p>❌ 請正確上傳一張圖檔</p>", status=400, mimetype='text/html; charset=utf-8')
 
-    upload_dir = os.path.join(os.path.dirname(__file__), "uploads")
-    os.makedirs(upload_dir, exist_ok=True)
-    image_path = os.path.join(upload_dir, "multi_temp.jpg")
-    file.save(image_path)
-
     try:
-        result_html = recognize_multi_cards(image_path)
+        result_html = recognize_multi_cards(file.read())
         return Response(result_html, mimetype='text/html; charset=utf-8')
     except Exception as e:
         import traceback
         traceback.print_exc()
         return Response(f"<p>處理錯誤：{str(e)}</p>", status=500, mimetype='text/html; charset=utf-8')
-    finally:
-        try:
-            os.remove(image_path)
-        except Exception as e:
-            print(f"⚠️ 無法刪除上傳圖檔: {e}")
+
+# ----------- 多卡辨識（背景工作） -----------
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    file = request.files.get("image")
+    if not file:
+        print("❌ 沒有收到圖片")
+        return jsonify({"error": "❌ 請正確上傳一張圖檔"}), 400
+
+    try:
+        job = jobs.submit(file.read())
+    except jobs.QueueFull as e:
+        response = jsonify({"error": str(e)})
+        response.status_code = 429
+        response.headers["Retry-After"] = "5"
+        return response
+
+    return jsonify({
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "stream_url": f"/jobs/{job.id}/stream",
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.snapshot(request.args.get("since", 0, type=int)))
+
+@app.route('/jobs/<job_id>/stream')
+def job_stream(job_id):
+    """ Server-Sent Events：每筆進度一個 progress 事件，結束時送出 done 或 error 事件 """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def generate():
+        since = 0
+        while True:
+            snap = job.wait(since, timeout=15)
+            for event in snap["events"]:
+                yield f"event: progress\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            since = snap["next"]
+            if snap["status"] == "done":
+                yield f"event: done\ndata: {json.dumps({'result_html': snap['result_html']}, ensure_ascii=False)}\n\n"
+                return
+            if snap["status"] == "error":
+                yield f"event: error\ndata: {json.dumps({'error': snap['error']}, ensure_ascii=False)}\n\n"
+                return
+            if not snap["events"]:
+                yield ": keep-alive\n\n"
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # ----------- 分類模式 -----------
 @app.route('/upload_choice_image', methods=['POST'])
@@ -146,13 +222,35 @@ def upload_choice_image():
         print("❌ 沒有收到圖片")
         return Response("<p>❌ 請正確上傳一張圖檔</p>", status=400, mimetype='text/html; charset=utf-8')
 
-    upload_dir = os.path.join(os.path.dirname(__file__), "uploads")
-    os.makedirs(upload_dir, exist_ok=True)
-    image_path = os.path.join(upload_dir, "choice_temp.jpg")
-    file.save(image_path)
+    # 每次上傳建立新的工作區（圖片保留在記憶體），並移除同一使用者上一次的工作區
+    try:
+        session["choice_token"] = choice_session.create(file.read(), replace=session.get("choice_token"))
+    except FileNotFoundError as e:
+        return Response(f"<p>{e}</p>", status=400, mimetype='text/html; charset=utf-8')
 
     return render_template('choice.html', css_files=get_css_files())
 
+def _own_choice_session(token):
+    """ 只允許存取自己 session 的工作區 """
+    if token != session.get("choice_token"):
+        return None
+    return choice_session.get(token)
+
+@app.route('/choice/<token>/boxed.jpg')
+def choice_boxed_image(token):
+    sess = _own_choice_session(token)
+    if sess is None:
+        return Response(status=404)
+    return Response(sess.boxed_image(), mimetype='image/jpeg')
+
+@app.route('/choice/<token>/crop/<int:index>.jpg')
+def choice_crop_image(token, index):
+    sess = _own_choice_session(token)
+    data = sess.crop_image(index) if sess is not None else None
+    if data is None:
+        return Response(status=404)
+    return Response(data, mimetype='image/jpeg')
+
 from backend.crop import *
 import json
 
@@ -160,12 +258,15 @@ import json
 @app.route("/match_choice", methods=["POST"])
 def match_choice():
     try:
-        index = request.json.get("index")
-        crop_path = f"./uploads/crop_{index}.jpg"
-        if not os.path.exists(crop_path):
+        index = int(request.json.get("index"))
+        sess = choice_session.get(session.get("choice_token"))
+        if sess is None:
+            return jsonify({"error": "Crop image not found"}), 404
+
+        # 同一張卡重複點選時直接使用工作區中的結果
+        result = sess.match(index)
+        if result is None:
             return jsonify({"error": "Crop image not found"}), 404
-        
-        result = process_image_file(crop_path)
 
         if isinstance(result, str):
             return jsonify({
@@ -2,4 +2,7 @@ import os
 import sys
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-sys.path.insert(0, BASE_DIR)
\ No newline at end of file
+sys.path.insert(0, BASE_DIR)
+
+# 資料目錄（圖庫、快取、卡片資訊），可用 YGO_DATA_DIR 指到其他位置（例如效能測試的工作區）
+DATA_DIR = os.environ.get("YGO_DATA_DIR", os.path.join(os.path.dirname(BASE_DIR), "data"))
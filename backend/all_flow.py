@@ -1,26 +1,24 @@
-import os
-from backend.crop import process_roboflow_detections
-from backend.multi_matcher import run_multi_match_from_crops
+from backend.crop import detect_and_crop
+from backend.multi_matcher import process_multi_image
+from backend.prescale import resize_for_sift
 
-UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
+def recognize_multi_cards(image, on_progress=None):
+    """
+    image 可為上傳的圖片位元組或圖檔路徑。
+    on_progress(event) 會在偵測完成（stage="detected"）與每張裁切圖辨識完成（stage="crop"）時呼叫
+    """
 
-def recognize_multi_cards(image_path):
-
-    # 1. 利用 Roboflow 偵測並裁切卡片圖
-    crop_paths = process_roboflow_detections(image_path, output_crop_dir=UPLOAD_DIR)
+    # 1. 利用 Roboflow 偵測並裁切卡片圖（偵測期間同時解碼原圖）
+    crops = detect_and_crop(image)
+    if on_progress is not None:
+        on_progress({"stage": "detected", "total": len(crops)})
 
     # 2. 若無偵測到卡片，直接回傳訊息
-    if not crop_paths:
+    if not crops:
         return "<p>❌ 沒有偵測到任何卡片</p>"
 
-    # 3. 執行多卡辨識
-    result_html = run_multi_match_from_crops(crop_paths)
-
-    # 4. 辨識後刪除所有裁切圖
-    for path in crop_paths:
-        try:
-            os.remove(path)
-        except Exception as e:
-            print(f"⚠️ 無法刪除裁切檔案 {path}: {e}")
-
-    return result_html
+    # 3. 執行多卡辨識：裁切圖縮到圖庫卡圖的高度後直接送入特徵擷取，不經過暫存檔
+    on_crop = None
+    if on_progress is not None:
+        on_crop = lambda event: on_progress({"stage": "crop", **event})
+    return process_multi_image([resize_for_sift(crop) for _, crop in crops], on_crop=on_crop)
@@ -0,0 +1,108 @@
+"""
+卡片資訊索引：以 8 碼卡號查詢 data/cards_info 的資訊檔。
+
+所有 .txt 只在第一次查詢（或 app 啟動時呼叫 load）解析一次，存成預先轉義好的
+text_html / images_html 與日文名。資訊目錄的 mtime 改變時（新增、刪除、改名）
+重新掃描，只有內容改變的檔案會重新解析。
+"""
+import os
+import re
+import html
+import time
+import threading
+from collections import namedtuple
+from backend import DATA_DIR
+
+INFO_DIR = os.path.join(DATA_DIR, "cards_info")
+# 兩次檢查資訊目錄 mtime 的最短間隔（秒）
+CHECK_INTERVAL = 2.0
+
+CardInfo = namedtuple("CardInfo", "card_id text_html images_html image_urls card_name_jp path mtime_ns")
+
+_cards = {}
+_dir_mtime = None
+_last_check = 0.0
+_lock = threading.Lock()
+
+_IMG_TAG = r'<img src="[^"]+" alt="圖片" />'
+
+
+def parse_info_file(path, card_id=None):
+    """ 解析一個資訊檔，轉成結果頁使用的 HTML 片段 """
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()
+
+    card_name_jp = ""
+    for line in lines:
+        if line.startswith("日文名:"):
+            card_name_jp = line.replace("日文名:", "").strip()
+            break
+
+    info = "".join(lines)
+    info = html.escape(info, quote=False).replace("圖片 URL:", "")
+    info = info.replace("\n", " <br>")
+    info = re.sub(r"(https?://[^\s]+)", r'<img src="\1" alt="圖片" />', info)
+
+    image_html_list = re.findall(_IMG_TAG, info)
+    return CardInfo(
+        card_id=card_id or os.path.basename(path)[:8],
+        text_html=re.sub(_IMG_TAG, '', info),
+        images_html="".join(image_html_list),
+        image_urls=re.findall(r'<img src="([^"]+)"', "".join(image_html_list)),
+        card_name_jp=card_name_jp,
+        path=path,
+        mtime_ns=os.stat(path).st_mtime_ns,
+    )
+
+
+def _scan(info_dir):
+    """ 卡號 → 資訊檔路徑；同一卡號有多個檔案時取檔名排序第一個 """
+    files = {}
+    for fname in sorted(os.listdir(info_dir)):
+        if fname.lower().endswith(".txt"):
+            files.setdefault(fname[:8], os.path.join(info_dir, fname))
+    return files
+
+
+def load(info_dir=INFO_DIR):
+    """ 掃描資訊目錄並解析所有資訊檔（沿用未改變檔案的解析結果），回傳卡片數 """
+    global _cards, _dir_mtime, _last_check
+    with _lock:
+        if not os.path.isdir(info_dir):
+            print(f"⚠️ 找不到卡片資訊目錄：{info_dir}")
+            return 0
+        dir_mtime = os.stat(info_dir).st_mtime_ns
+        cards = {}
+        for card_id, path in _scan(info_dir).items():
+            old = _cards.get(card_id)
+            try:
+                if old is not None and old.path == path and old.mtime_ns == os.stat(path).st_mtime_ns:
+                    cards[card_id] = old
+                else:
+                    cards[card_id] = parse_info_file(path, card_id)
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"⚠️ 無法讀取資訊檔 {path}: {e}")
+        _cards, _dir_mtime, _last_check = cards, dir_mtime, time.monotonic()
+        print(f"✅ 已載入卡片資訊：{len(cards)} 筆")
+        return len(cards)
+
+
+def _refresh_if_changed(info_dir):
+    global _last_check
+    now = time.monotonic()
+    if _dir_mtime is not None and now - _last_check < CHECK_INTERVAL:
+        return
+    try:
+        dir_mtime = os.stat(info_dir).st_mtime_ns
+    except OSError:
+        return
+    if dir_mtime != _dir_mtime:
+        load(info_dir)
+    else:
+        _last_check = now
+
+
+def lookup(card_id, info_dir=INFO_DIR):
+    """ 8 碼卡號 → CardInfo；沒有資訊檔時回傳 None """
+    _refresh_if_changed(info_dir)
+    return _cards.get(str(card_id).zfill(8))
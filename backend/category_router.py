@@ -0,0 +1,188 @@
+"""
+多類別分流搜尋：卡框分類不確定時，同時搜尋前幾名候選類別的索引並合併結果，
+不必為了避免分類錯誤而改搜尋很大的 all 索引。
+
+    ranked = [("effect", 0.55), ("normal", 0.35), ("fusion", 0.10)]
+    match = route(ranked, kp, des)   # Match(category, image_idx, candidates, gallery, score, searched) 或 None
+
+- 第一名信心 >= ROUTER_CONFIDENT（或只有一個候選）時只搜尋該類別，與原本的單一類別流程相同
+- 否則取信心 >= ROUTER_MIN_CONFIDENCE 的前 ROUTER_TOP_K 個類別，依信心高低送進執行緒池平行搜尋
+  （FAISS search 與 OpenCV RANSAC 執行時會釋放 GIL）
+- 各類別的票數除以該次搜尋通過 ratio test 的描述子數後才比較（圖庫大小不同，原始票數的尺度不同）；
+  通過幾何驗證的候選優先
+- 任一類別出現決定性的結果（通過幾何驗證；未啟用驗證時票數達 DECISIVE_MIN_VOTES
+  且為第二名的 DECISIVE_MARGIN 倍以上）即取消其餘尚未完成的類別
+"""
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from backend.feature_store import get_gallery
+from backend.index_registry import get_index
+from backend.voting import vote, ratio_mask
+from backend.verification import GEOMETRIC_VERIFY, MIN_INLIERS, verify_candidates, keypoint_coords
+from backend import metrics
+
+# 第一名信心達此值時只搜尋一個類別
+ROUTER_CONFIDENT = float(os.environ.get("YGO_ROUTER_CONFIDENT", "0.9"))
+# 最多同時搜尋的類別數，與列入搜尋的最低信心
+ROUTER_TOP_K = int(os.environ.get("YGO_ROUTER_TOP_K", "3"))
+ROUTER_MIN_CONFIDENCE = float(os.environ.get("YGO_ROUTER_MIN_CONFIDENCE", "0.1"))
+ROUTER_WORKERS = int(os.environ.get("YGO_ROUTER_WORKERS", str(min(ROUTER_TOP_K, os.cpu_count() or 1))))
+# 未啟用幾何驗證時的決定性結果：票數下限與領先第二名的倍數
+DECISIVE_MIN_VOTES = 10
+DECISIVE_MARGIN = 2.0
+
+Shard = namedtuple("Shard", "category candidates gallery passed")
+# searched 為這次實際搜尋完成、參與比較的類別（結果快取以它們的簽章判斷是否過期）
+Match = namedtuple("Match", "category image_idx candidates gallery score searched")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _thread_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=ROUTER_WORKERS, thread_name_prefix="router")
+        return _pool
+
+
+def combine(*rankings):
+    """ 多個分類結果 [(類別, 信心), ...] → 平均信心（空的結果不計），依信心由高到低排列 """
+    rankings = [r for r in rankings if r]
+    totals = {}
+    for ranking in rankings:
+        for category, confidence in ranking:
+            totals[category] = totals.get(category, 0.0) + confidence / len(rankings)
+    return sorted(totals.items(), key=lambda item: -item[1])
+
+
+def select(ranked, top_k=ROUTER_TOP_K, confident=ROUTER_CONFIDENT, min_confidence=ROUTER_MIN_CONFIDENCE):
+    """ 要搜尋的類別（依信心由高到低）；第一名夠確定時只取第一名 """
+    if not ranked:
+        return []
+    if ranked[0][1] >= confident:
+        return [ranked[0][0]]
+    selected = [category for category, confidence in ranked[:top_k] if confidence >= min_confidence]
+    return selected or [ranked[0][0]]
+
+
+def search_category(category, query_pts, des, cancelled=None):
+    """
+    在單一類別的圖庫中搜尋、投票並驗證，回傳 Shard；
+    類別沒有圖庫或無法載入時回傳 None，cancelled 已設定時在下一個階段開始前放棄並回傳 None
+    """
+    if cancelled is not None and cancelled.is_set():
+        return None
+    with metrics.stage("gallery_load"):
+        try:
+            gallery = get_gallery(category)
+        except FileNotFoundError as e:
+            # 信心較低的候選類別可能根本沒有圖庫，略過即可
+            print(f"⚠️ 略過沒有圖庫的類別：{category}（{e}）")
+            return None
+        if gallery is None:
+            print(f"⚠️ 無法載入快取：{category}")
+            return None
+        if cancelled is not None and cancelled.is_set():
+            return None
+        index = get_index(category, gallery.all_desc, gallery.live_ids)
+
+    if cancelled is not None and cancelled.is_set():
+        return None
+    with metrics.stage("index_search"):
+        D, I = index.search(des, 2)
+    with metrics.stage("voting"):
+        candidates = vote(D, I, gallery.image_ids, len(gallery.names))
+    passed = int(ratio_mask(D, I).sum())
+
+    if candidates and GEOMETRIC_VERIFY and query_pts is not None:
+        if cancelled is not None and cancelled.is_set():
+            return None
+        with metrics.stage("verify"):
+            candidates = verify_candidates(query_pts, D, I, candidates, gallery)
+    return Shard(category, candidates, gallery, passed)
+
+
+def _verified(candidate):
+    return len(candidate) > 2 and candidate[2] >= MIN_INLIERS
+
+
+def is_decisive(shard):
+    """ 此類別的第一名是否足以直接採用（不必等其他類別） """
+    if shard is None or not shard.candidates:
+        return False
+    best = shard.candidates[0]
+    if GEOMETRIC_VERIFY:
+        return _verified(best)
+    runner_up = shard.candidates[1][1] if len(shard.candidates) > 1 else 0
+    return best[1] >= DECISIVE_MIN_VOTES and best[1] >= DECISIVE_MARGIN * runner_up
+
+
+def _score(shard):
+    """ 第一名的正規化分數：票數 / 通過 ratio test 的描述子數 """
+    return shard.candidates[0][1] / max(shard.passed, 1)
+
+
+def merge(shards, searched=()):
+    """ 各類別的結果 → 最佳的 Match（通過驗證者優先，其次比正規化分數）；都沒有候選時回傳 None """
+    best, best_key = None, None
+    for rank, shard in enumerate(shards):
+        if shard is None or not shard.candidates:
+            continue
+        key = (_verified(shard.candidates[0]), _score(shard), -rank)
+        if best_key is None or key > best_key:
+            best, best_key = shard, key
+    if best is None:
+        return None
+    return Match(best.category, best.candidates[0][0], best.candidates, best.gallery, _score(best),
+                 tuple(searched) or (best.category,))
+
+
+def route(ranked, kp, des):
+    """
+    依候選類別 [(類別, 信心), ...] 搜尋並回傳最佳的 Match，沒有任何候選時回傳 None；
+    所有類別的圖庫都無法載入時丟出 ValueError
+    """
+    categories = select(ranked)
+    if not categories:
+        raise ValueError("❌ 沒有可搜尋的類別")
+    query_pts = keypoint_coords(kp) if GEOMETRIC_VERIFY else None
+    des = np.ascontiguousarray(des, dtype='float32')
+
+    if len(categories) == 1:
+        shards = [search_category(categories[0], query_pts, des)]
+        outcome = "single"
+    else:
+        shards, outcome = _fan_out(categories, query_pts, des)
+    metrics.count("router", result=outcome)
+    metrics.observe("router_shards", sum(s is not None for s in shards))
+
+    if all(s is None for s in shards):
+        raise ValueError(f"❌ 無法載入快取：{', '.join(categories)}")
+    return merge(shards, [category for category, shard in zip(categories, shards) if shard is not None])
+
+
+def _fan_out(categories, query_pts, des):
+    """ 平行搜尋多個類別；出現決定性結果時取消其餘類別。回傳 (依類別順序的 Shard 清單, 結果) """
+    cancelled = threading.Event()
+    search = metrics.bind(search_category)
+    pool = _thread_pool()
+    futures = {pool.submit(search, category, query_pts, des, cancelled): i
+               for i, category in enumerate(categories)}
+
+    shards = [None] * len(categories)
+    outcome = "merged"
+    for future in as_completed(futures):
+        shard = future.result()
+        shards[futures[future]] = shard
+        if is_decisive(shard):
+            cancelled.set()
+            for other in futures:
+                other.cancel()
+            outcome = "decisive"
+            break
+    return shards, outcome
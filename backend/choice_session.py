@@ -0,0 +1,191 @@
+"""
+自行選擇模式的工作區：每次上傳一個，以 Flask session 中的代號查詢。
+
+工作區保存解碼後的原圖、偵測框（本機偵測或 Roboflow），以及點選時才計算的每張裁切圖
+特徵、類別與辨識結果；重複點選同一張卡直接回傳記憶體中的結果。
+裁切圖與單卡上傳共用辨識結果快取（result_cache.image_results）。
+框選預覽圖與裁切圖也由記憶體編碼後直接回應，不寫入 uploads/。
+
+工作區存在目前的行程中（多行程部署時需要 sticky session），
+數量以 MAX_SESSIONS 為上限（LRU），閒置超過 SESSION_TTL 秒即移除。
+"""
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+from backend.crop import detect_cards
+from backend.local_detector import rectify
+from backend.prescale import decode, resize_for_sift, DECODE_MIN_SIDE
+from backend.matcher import classify_and_extract, match_and_cache
+from backend.result_cache import image_results, image_key
+from backend.price_service import record_recognition
+
+MAX_SESSIONS = int(os.environ.get("YGO_CHOICE_SESSIONS", "128"))
+SESSION_TTL = int(os.environ.get("YGO_CHOICE_TTL", "1800"))
+PREVIEW_JPEG_QUALITY = 90
+
+_sessions = OrderedDict()  # token → ChoiceSession
+_lock = threading.Lock()
+
+
+class ChoiceSession:
+    def __init__(self, token, image_data):
+        self.token = token
+        self.image_data = image_data
+        self.image, self.decode_factor = decode(image_data, DECODE_MIN_SIDE)
+        if self.image is None:
+            raise FileNotFoundError("❌ 無法讀取圖像")
+        self.predictions = None
+        self.boxed_jpeg = None
+        self.crop_jpegs = {}
+        self.features = {}     # 框編號 → (快取鍵, kp, des)
+        self.categories = {}   # 框編號 → 候選類別 [(類別, 信心), ...]
+        self.results = {}      # 框編號 → 辨識結果
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+        self._crop_locks = {}
+
+    def detect(self):
+        """
+        偵測框（只偵測一次，座標為 self.image 的座標）：先做本機偵測，
+        信心不足時送縮小版本給 Roboflow
+        """
+        with self._lock:
+            if self.predictions is None:
+                self.predictions = detect_cards(self.image, self.image_data, self.decode_factor)
+            return self.predictions
+
+    def crop(self, index):
+        """
+        第 index 個偵測框的裁切圖（本機偵測的框透視校正成圖庫解析度，其餘為原圖的切片）；
+        框不存在或為空時回傳 None
+        """
+        preds = self.detect().get("predictions", [])
+        if not 0 <= index < len(preds):
+            return None
+        pred = preds[index]
+        if "corners" in pred:
+            return rectify(self.image, pred["corners"])
+        height, width = self.image.shape[:2]
+        x, y, w, h = int(pred["x"]), int(pred["y"]), int(pred["width"]), int(pred["height"])
+        x1, y1 = max(x - w // 2, 0), max(y - h // 2, 0)
+        x2, y2 = min(x + w // 2, width), min(y + h // 2, height)
+        crop = self.image[y1:y2, x1:x2]
+        return crop if crop.size else None
+
+    def boxed_image(self):
+        """ 畫上偵測框與編號的預覽圖（JPEG 位元組，只繪製一次） """
+        preds = self.detect().get("predictions", [])
+        with self._lock:
+            if self.boxed_jpeg is None:
+                img = self.image.copy()
+                for i, pred in enumerate(preds):
+                    x, y, w, h = int(pred["x"]), int(pred["y"]), int(pred["width"]), int(pred["height"])
+                    x1, y1 = x - w // 2, y - h // 2
+                    x2, y2 = x + w // 2, y + h // 2
+                    if "corners" in pred:
+                        cv2.polylines(img, [np.int32(pred["corners"])], True, (0, 255, 0), 2)
+                    else:
+                        cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                    cv2.putText(img, str(i + 1), (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+                self.boxed_jpeg = _encode(img)
+            return self.boxed_jpeg
+
+    def crop_image(self, index):
+        """ 裁切圖的 JPEG 位元組（懸停預覽用） """
+        with self._lock:
+            if index in self.crop_jpegs:
+                return self.crop_jpegs[index]
+        crop = self.crop(index)
+        if crop is None:
+            return None
+        data = _encode(crop)
+        with self._lock:
+            self.crop_jpegs[index] = data
+        return data
+
+    def _crop_lock(self, index):
+        with self._lock:
+            return self._crop_locks.setdefault(index, threading.Lock())
+
+    def match(self, index):
+        """
+        辨識第 index 張卡：先查詢辨識結果快取，未命中時特徵與類別第一次點選時才計算並保留，
+        同一張卡的重複點選直接回傳先前的結果；框不存在時回傳 None
+        """
+        with self._crop_lock(index):
+            if index in self.results:
+                result = self.results[index]
+                if not isinstance(result, str):
+                    record_recognition(result[1])
+                return result
+
+            crop = self.crop(index)
+            if crop is None:
+                return None
+            if index not in self.features:
+                img = resize_for_sift(crop)
+                key = image_key(img)
+                cached = image_results.get(key)
+                if cached is not None:
+                    record_recognition(cached[1])
+                    self.results[index] = cached
+                    return cached
+                # 裁切圖已是整張卡片（本機偵測時已透視校正），直接分類外框
+                categories, kp, des = classify_and_extract(img, is_card=True)
+                self.features[index] = (key, kp, des)
+                self.categories[index] = categories
+            key, kp, des = self.features[index]
+            result = match_and_cache(key, self.categories[index], kp, des)
+            self.results[index] = result
+            return result
+
+
+def _encode(img):
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_JPEG_QUALITY])
+    if not ok:
+        raise ValueError("❌ 無法編碼圖片")
+    return buf.tobytes()
+
+
+def _expire_locked(now):
+    while _sessions:
+        token, sess = next(iter(_sessions.items()))
+        if len(_sessions) > MAX_SESSIONS or now - sess.last_used > SESSION_TTL:
+            del _sessions[token]
+        else:
+            break
+
+
+def create(image_data, replace=None):
+    """ 建立新的工作區並回傳代號；replace 為同一使用者上一次的代號（一併移除） """
+    token = uuid.uuid4().hex
+    sess = ChoiceSession(token, image_data)
+    with _lock:
+        if replace:
+            _sessions.pop(replace, None)
+        _sessions[token] = sess
+        _expire_locked(time.monotonic())
+    return token
+
+
+def get(token):
+    """ 代號 → ChoiceSession；不存在或已過期時回傳 None """
+    if not token:
+        return None
+    now = time.monotonic()
+    with _lock:
+        _expire_locked(now)
+        sess = _sessions.get(token)
+        if sess is not None:
+            sess.last_used = now
+            _sessions.move_to_end(token)
+        return sess
+
+
+def stats():
+    with _lock:
+        return {"sessions": len(_sessions), "max_sessions": MAX_SESSIONS, "ttl": SESSION_TTL}
@@ -1,29 +1,36 @@
-import requests
+from backend.inference_client import infer
+from backend import metrics
 
-# --- Roboflow API Config ---
+# --- Roboflow API Config ---（API_KEY 留空時使用環境變數 ROBOFLOW_API_KEY）
 API_KEY = ""
 
 MODEL_ID = "color-zagok/4"
 CONFIDENCE = 0.18
 
-def get_card_class(image_path):
+def get_card_classes(image, model_id=MODEL_ID):
+    """ 所有預測類別 [(類別, 信心), ...]（信心由高到低）；失敗或沒有預測時回傳空清單 """
     try:
-        url = f"https://detect.roboflow.com/{MODEL_ID}?api_key={API_KEY}&confidence={CONFIDENCE}&overlap=0.3"
-        with open(image_path, "rb") as f:
-            response = requests.post(url, files={"file": f})
+        with metrics.stage("classify"):
+            result = infer(model_id, image, CONFIDENCE, api_key=API_KEY)
+        if result is None:
+            return []
 
-        if response.status_code != 200:
-            print("❌ Roboflow error:", response.text)
-            return None
-
-        result = response.json()
         predictions = result.get("predictions", [])
-        if predictions:
-            return predictions[0].get("class")
-        else:
+        if not predictions:
             print("❌ No predictions found.")
-            return None
+            return []
+        ranked = {}
+        for prediction in predictions:
+            category = prediction.get("class")
+            if category:
+                ranked[category] = max(ranked.get(category, 0.0), float(prediction.get("confidence", 0.0)))
+        return sorted(ranked.items(), key=lambda item: -item[1])
 
     except Exception as e:
         print("❌ Error during Roboflow call:", e)
-        return None
+        return []
+
+def get_card_class(image, model_id=MODEL_ID):
+    """ image 可為圖檔路徑、JPEG 位元組或 ndarray；回傳信心最高的類別 """
+    ranked = get_card_classes(image, model_id)
+    return ranked[0][0] if ranked else None
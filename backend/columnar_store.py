@@ -0,0 +1,219 @@
+"""
+欄式特徵快取（data/cache/{category}.store/）：
+
+    meta.json        描述子數量、維度與型別（最後寫入，讀取端以它判斷版本）
+    descriptors.bin  所有描述子連續存放，(N, dim) uint8 或 float32
+    keypoints.bin    扁平關鍵點陣列（KEYPOINT_DTYPE）
+    image_ids.bin    描述子列 → 圖片編號（int32）
+    offsets.npy      每張圖片描述子的起始列（長度為圖片數 + 1）
+    names.npy        檔名表
+    paths.npy        圖檔路徑表
+
+大型陣列以 np.memmap 開啟，不需解壓縮也不需 allow_pickle。
+舊的 .npz / .npy 快取可轉換：
+
+    python -m backend.columnar_store convert effect all
+"""
+import os
+import json
+import argparse
+import numpy as np
+from backend import DATA_DIR
+
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+
+KEYPOINT_DTYPE = np.dtype([("x", "<f4"), ("y", "<f4"), ("size", "<f4"), ("angle", "<f4")])
+# SIFT 描述子為 0~255 的整數，以 uint8 儲存不失真；RootSIFT 等浮點描述子改用 float32
+DESCRIPTOR_DTYPE = os.environ.get("YGO_DESCRIPTOR_DTYPE", "uint8")
+FORMAT_VERSION = 1
+
+
+def store_dir(category):
+    return os.path.join(CACHE_DIR, f"{category}.store")
+
+
+def meta_path(category):
+    return os.path.join(store_dir(category), "meta.json")
+
+
+def store_exists(category):
+    return os.path.exists(meta_path(category))
+
+
+def read_meta(category):
+    with open(meta_path(category), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_meta(category, meta):
+    path = meta_path(category)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(path + ".tmp", path)
+
+
+def _save_npy(path, array):
+    np.save(path + ".tmp.npy", array)
+    os.replace(path + ".tmp.npy", path)
+
+
+def _pick_dtype(descs, dtype):
+    dtype = dtype or DESCRIPTOR_DTYPE
+    if dtype == "uint8":
+        for des in descs:
+            if des.min() < 0 or des.max() > 255 or not np.array_equal(des, np.round(des)):
+                print("⚠️ 描述子不是 0~255 的整數，改以 float32 儲存")
+                return "float32"
+    return dtype
+
+
+def _keypoint_rows(kp_attrs):
+    """ [(x, y, size, angle), ...] → KEYPOINT_DTYPE 陣列 """
+    rows = np.asarray(kp_attrs, dtype="<f4").reshape(-1, 4)
+    return np.ascontiguousarray(rows).view(KEYPOINT_DTYPE).reshape(-1)
+
+
+COLUMN_FILES = ("descriptors.bin", "keypoints.bin", "image_ids.bin")
+
+
+def _write_columns(files, dtype, kp_attrs, descs, first_image):
+    """ 依序寫入描述子、關鍵點與圖片編號；files 為 COLUMN_FILES 對應的已開啟檔案 """
+    fd, fk, fi = files
+    for i, (attrs, des) in enumerate(zip(kp_attrs, descs)):
+        fd.write(np.ascontiguousarray(des, dtype=dtype).tobytes())
+        fk.write(_keypoint_rows(attrs).tobytes())
+        fi.write(np.full(len(des), first_image + i, dtype="<i4").tobytes())
+    return sum(len(des) for des in descs)
+
+
+def _append_arrays(category, meta, kp_attrs, descs, first_image):
+    """
+    把描述子、關鍵點與圖片編號附加到 .bin 檔尾端（先截掉超出 meta 的殘留資料）。
+    只動到 meta 記錄的範圍之後，執行中的伺服器以舊 meta 開啟的 memmap 不受影響
+    """
+    root = store_dir(category)
+    dtype = np.dtype(meta["dtype"])
+    count = meta["count"]
+    columns = [
+        ("descriptors.bin", count * meta["dim"] * dtype.itemsize),
+        ("keypoints.bin", count * KEYPOINT_DTYPE.itemsize),
+        ("image_ids.bin", count * 4),
+    ]
+    for fname, size in columns:
+        with open(os.path.join(root, fname), "ab") as f:
+            f.truncate(size)
+
+    with open(os.path.join(root, "descriptors.bin"), "ab") as fd, \
+            open(os.path.join(root, "keypoints.bin"), "ab") as fk, \
+            open(os.path.join(root, "image_ids.bin"), "ab") as fi:
+        return _write_columns((fd, fk, fi), dtype, kp_attrs, descs, first_image)
+
+
+def write_store(category, paths, names, kp_attrs, descs, dtype=None, extra=None):
+    """
+    以欄式格式寫入完整快取；extra 為額外記錄在 meta.json 的擷取設定。
+    各檔先寫入 .tmp 再以 os.replace 取代（meta.json 最後），
+    執行中的伺服器 memmap 的舊檔不會被截斷
+    """
+    root = store_dir(category)
+    os.makedirs(root, exist_ok=True)
+    meta = {
+        **(extra or {}),
+        "format": FORMAT_VERSION,
+        "dtype": _pick_dtype(descs, dtype),
+        "dim": int(descs[0].shape[1]),
+        "count": 0,
+        "images": 0,
+    }
+    tmp_paths = [os.path.join(root, fname + ".tmp") for fname in COLUMN_FILES]
+    with open(tmp_paths[0], "wb") as fd, open(tmp_paths[1], "wb") as fk, open(tmp_paths[2], "wb") as fi:
+        count = _write_columns((fd, fk, fi), np.dtype(meta["dtype"]), kp_attrs, descs, 0)
+    for fname, tmp in zip(COLUMN_FILES, tmp_paths):
+        os.replace(tmp, os.path.join(root, fname))
+    offsets = np.concatenate([[0], np.cumsum([len(d) for d in descs])]).astype("int64")
+    _save_npy(os.path.join(root, "offsets.npy"), offsets)
+    _save_npy(os.path.join(root, "names.npy"), np.array(names))
+    _save_npy(os.path.join(root, "paths.npy"), np.array(paths))
+    meta.update(count=count, images=len(names))
+    _write_meta(category, meta)
+
+
+def append_store(category, paths, names, kp_attrs, descs):
+    """
+    附加新圖片到既有快取（既有描述子列號不變），回傳新描述子的起始列。
+    新描述子無法以快取的型別儲存時（例如 uint8 快取加入浮點描述子）丟出 ValueError，需重建快取
+    """
+    root = store_dir(category)
+    meta = read_meta(category)
+    first_row = meta["count"]
+    if not descs:
+        return first_row
+
+    dtype = _pick_dtype(descs, meta["dtype"])
+    if dtype != meta["dtype"]:
+        raise ValueError(f"❌ 新描述子需以 {dtype} 儲存，與快取的 {meta['dtype']} 不同，請重建快取：{category}")
+    count = _append_arrays(category, meta, kp_attrs, descs, meta["images"])
+    offsets = np.load(os.path.join(root, "offsets.npy"))[:meta["images"] + 1]
+    offsets = np.concatenate([offsets, first_row + np.cumsum([len(d) for d in descs])]).astype("int64")
+    old_names = np.load(os.path.join(root, "names.npy")).tolist()[:meta["images"]]
+    old_paths = np.load(os.path.join(root, "paths.npy")).tolist()[:meta["images"]]
+    _save_npy(os.path.join(root, "offsets.npy"), offsets)
+    _save_npy(os.path.join(root, "names.npy"), np.array(old_names + list(names)))
+    _save_npy(os.path.join(root, "paths.npy"), np.array(old_paths + list(paths)))
+    meta.update(count=first_row + count, images=meta["images"] + len(names))
+    _write_meta(category, meta)
+    return first_row
+
+
+def open_store(category):
+    """
+    以 memmap 開啟欄式快取，回傳 dict：
+    paths、names、descriptors、keypoints、image_ids、offsets、meta
+    """
+    root = store_dir(category)
+    meta = read_meta(category)
+    count, images = meta["count"], meta["images"]
+    return {
+        "meta": meta,
+        "paths": np.load(os.path.join(root, "paths.npy")).tolist()[:images],
+        "names": np.load(os.path.join(root, "names.npy")).tolist()[:images],
+        "offsets": np.load(os.path.join(root, "offsets.npy"))[:images + 1],
+        "descriptors": np.memmap(os.path.join(root, "descriptors.bin"), dtype=meta["dtype"],
+                                 mode="r", shape=(count, meta["dim"])),
+        "keypoints": np.memmap(os.path.join(root, "keypoints.bin"), dtype=KEYPOINT_DTYPE,
+                               mode="r", shape=(count,)),
+        "image_ids": np.memmap(os.path.join(root, "image_ids.bin"), dtype="<i4",
+                               mode="r", shape=(count,)),
+    }
+
+
+def convert_npz_cache(category, dtype=None):
+    """ 將舊的 {category}.npz 轉換成欄式快取（不需重新擷取特徵） """
+    cache_file = os.path.join(CACHE_DIR, f"{category}.npz")
+    if not os.path.exists(cache_file):
+        raise FileNotFoundError(f"❌ 找不到舊快取：{cache_file}")
+
+    print(f"🔁 轉換舊快取：{category}")
+    npz = np.load(cache_file, allow_pickle=True)
+    names = npz['names'].tolist()
+    descs = [npz[f'des{i}'] for i in range(len(names))]
+    write_store(category, npz['paths'].tolist(), names, list(npz['kp_attrs']), descs, dtype)
+
+    old_size = os.path.getsize(cache_file)
+    desc_file = os.path.join(CACHE_DIR, f"{category}.npy")
+    if os.path.exists(desc_file):
+        old_size += os.path.getsize(desc_file)
+    root = store_dir(category)
+    new_size = sum(os.path.getsize(os.path.join(root, f)) for f in os.listdir(root))
+    print(f"✅ 轉換完成：{category}（{old_size / 1e6:.1f} MB → {new_size / 1e6:.1f} MB）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="欄式特徵快取工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="將舊的 .npz 快取轉換成欄式快取")
+    convert.add_argument("categories", nargs="+")
+    convert.add_argument("--dtype", choices=["uint8", "float32"], default=None)
+    args = parser.parse_args()
+    for category in args.categories:
+        convert_npz_cache(category, args.dtype)
@@ -1,22 +1,36 @@
 import os
 import cv2
-import uuid
+import numpy as np
 from backend.detection_api import get_roboflow_predictions
+from backend.inference_client import submit
+from backend import metrics
+from backend import local_detector
+from backend.prescale import decode, detection_copy, scale_predictions, DECODE_MIN_SIDE
 
-def process_roboflow_detections(image_path, output_crop_dir="uploads"):
+# 先以本機 OpenCV 偵測卡片，信心不足時才呼叫 Roboflow（YGO_LOCAL_DETECT=0 時一律使用 Roboflow）
+LOCAL_DETECT = os.environ.get("YGO_LOCAL_DETECT", "1") == "1"
+
+def decode_image(image):
+    """ 圖檔路徑、編碼後的位元組或 ndarray → BGR ndarray（無法解碼時回傳 None） """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(image)
+
+
+def crop_predictions(img, predictions):
     """
-    使用 Roboflow 偵測卡片，根據結果裁切圖片，回傳所有裁切後圖檔路徑
+    依偵測結果裁切圖片，回傳 [(框編號, 裁切圖), ...]；
+    有角點（本機偵測）的框透視校正成圖庫解析度，其餘為原圖的切片（不複製像素）
     """
-    os.makedirs(output_crop_dir, exist_ok=True)
-    img = cv2.imread(image_path)
-    if img is None:
-        raise FileNotFoundError(f"❌ 無法載入圖片：{image_path}")
-
     height, width = img.shape[:2]
-    roboflow_result = get_roboflow_predictions(image_path)
-    results = []
+    crops = []
 
-    for i, pred in enumerate(roboflow_result.get("predictions", [])):
+    for i, pred in enumerate(predictions.get("predictions", [])):
+        if "corners" in pred:
+            crops.append((i, local_detector.rectify(img, pred["corners"])))
+            continue
         x, y, w, h = int(pred['x']), int(pred['y']), int(pred['width']), int(pred['height'])
         x1 = max(x - w // 2, 0)
         y1 = max(y - h // 2, 0)
@@ -32,9 +46,59 @@ def process_roboflow_detections(image_path, output_crop_dir="uploads"):
             print(f"⚠️ Skipped too-small crop #{i}: shape={crop.shape}")
             continue
 
-        unique_id = uuid.uuid4().hex[:8]
-        crop_path = os.path.join(output_crop_dir, f"crop_{i}_{unique_id}.jpg")
-        cv2.imwrite(crop_path, crop)
-        results.append(crop_path)
+        crops.append((i, crop))
+
+    return crops
+
+
+def detect_scaled(image):
+    """
+    送縮小後的版本給 Roboflow 偵測，回傳 (偵測結果, factor)；
+    偵測框座標乘上 factor 即為原圖座標
+    """
+    small, factor = detection_copy(image)
+    return get_roboflow_predictions(small), factor
+
+
+def detect_boxes(image, decode_factor=1.0):
+    """ 偵測框換算到以 decode_factor 縮小解碼的圖片座標 """
+    predictions, factor = detect_scaled(image)
+    return scale_predictions(predictions, factor / decode_factor)
+
+
+def detect_cards(img, image=None, decode_factor=1.0):
+    """
+    已解碼的圖 img → 偵測結果（img 的座標）。先做本機偵測，信心不足時改送 Roboflow；
+    image 為上傳的原始位元組（送 Roboflow 時優先使用），decode_factor 為 img 的縮小倍率
+    """
+    if LOCAL_DETECT:
+        predictions = local_detector.detect(img)
+        if local_detector.is_confident(predictions):
+            return predictions
+    if image is None:
+        image, decode_factor = img, 1.0
+    return detect_boxes(image, decode_factor)
 
-    return results
+
+def detect_and_crop(image):
+    """
+    image 可為圖檔路徑或上傳的圖片位元組，回傳 [(框編號, 裁切圖), ...]。
+    啟用本機偵測時先解碼再偵測（信心不足才呼叫 Roboflow）；
+    否則 Roboflow 偵測在背景執行，等待回應的同時在本機解碼圖片（大圖以縮小解碼）
+    """
+    if LOCAL_DETECT:
+        with metrics.stage("decode"):
+            img, decode_factor = decode(image, DECODE_MIN_SIDE)
+        if img is None:
+            raise FileNotFoundError("❌ 無法載入圖片" + (f"：{image}" if isinstance(image, str) else ""))
+        return crop_predictions(img, detect_cards(img, image, decode_factor))
+
+    detection = submit(detect_scaled, image)
+    with metrics.stage("decode"):
+        img, decode_factor = decode(image, DECODE_MIN_SIDE)
+    if img is None:
+        detection.cancel()
+        raise FileNotFoundError("❌ 無法載入圖片" + (f"：{image}" if isinstance(image, str) else ""))
+    with metrics.stage("detect_wait"):
+        predictions, factor = detection.result()
+    return crop_predictions(img, scale_predictions(predictions, factor / decode_factor))
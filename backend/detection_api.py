@@ -1,27 +1,23 @@
-import os
-import requests
+from backend.inference_client import infer
+from backend import metrics
 
-# Roboflow API 設定
+# Roboflow API 設定（API_KEY 留空時使用環境變數 ROBOFLOW_API_KEY）
 API_KEY = ""
 MODEL_ID = "my-first-project-hcdmk/10"
 CONFIDENCE = 0.18
 UPLOAD_FOLDER = "static/uploads"
 
-def get_roboflow_predictions(image_path):
+def get_roboflow_predictions(image):
     """
-    使用 Roboflow API 的 HTTP POST 方式，偵測圖片中的卡片位置，並回傳裁切資訊。
+    使用 Roboflow API 偵測圖片中的卡片位置，並回傳裁切資訊。
+    image 可為圖檔路徑、JPEG 位元組或 ndarray。
     """
     try:
-        url = f"https://detect.roboflow.com/{MODEL_ID}?api_key={API_KEY}&confidence={CONFIDENCE}&overlap=0.3"
-
-        with open(image_path, "rb") as f:
-            response = requests.post(url, files={"file": f})
-
-        if response.status_code != 200:
-            print(f"Roboflow API 呼叫失敗: {response.text}")
+        with metrics.stage("detect"):
+            result = infer(MODEL_ID, image, CONFIDENCE, api_key=API_KEY)
+        if result is None:
             return {"predictions": []}
 
-        result = response.json()
         preds = result.get("predictions", [])
         clean_preds = [
             {"x": p["x"], "y": p["y"], "width": p["width"], "height": p["height"]}
@@ -0,0 +1,166 @@
+import os
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import cv2
+import numpy as np
+from tqdm import tqdm
+from backend import metrics
+
+# 預設工作數：請求路徑用執行緒池，離線建快取用行程池
+EXTRACT_WORKERS = int(os.environ.get("YGO_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+BUILD_WORKERS = int(os.environ.get("YGO_BUILD_WORKERS", str(os.cpu_count() or 1)))
+
+# 關鍵點預算（依 response 取前 N 個，0 表示不限制），建快取與查詢分開設定
+GALLERY_MAX_KEYPOINTS = int(os.environ.get("YGO_GALLERY_MAX_KP", "0"))
+QUERY_MAX_KEYPOINTS = int(os.environ.get("YGO_QUERY_MAX_KP", "0"))
+# 將圖片切成 N x N 格平均分配預算，讓卡圖各區域都有關鍵點（0 表示不分格）
+KEYPOINT_GRID = int(os.environ.get("YGO_KP_GRID", "0"))
+# RootSIFT：L1 正規化後開根號；圖庫與查詢必須一致
+ROOT_SIFT = os.environ.get("YGO_ROOT_SIFT", "0") == "1"
+
+_local = threading.local()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sift():
+    """ 每個執行緒 / 行程各自重複使用一個 SIFT 物件 """
+    sift = getattr(_local, "sift", None)
+    if sift is None:
+        sift = _local.sift = cv2.SIFT_create()
+    return sift
+
+
+def select_keypoints(kp, des, max_keypoints, shape, grid=KEYPOINT_GRID):
+    """
+    依 response 保留最多 max_keypoints 個關鍵點。
+    grid > 0 時先在每格各取配額內的最強點，剩餘名額再依 response 補足。
+    """
+    if not max_keypoints or des is None or len(kp) <= max_keypoints:
+        return kp, des
+
+    responses = np.array([p.response for p in kp], dtype=np.float32)
+    order = np.argsort(-responses, kind="stable")
+    if grid > 0:
+        pts = cv2.KeyPoint_convert(kp).reshape(-1, 2)
+        h, w = shape[:2]
+        cols = np.clip((pts[:, 0] * grid / w).astype(int), 0, grid - 1)
+        rows = np.clip((pts[:, 1] * grid / h).astype(int), 0, grid - 1)
+        cell = (rows * grid + cols)[order]
+        quota = max(1, max_keypoints // (grid * grid))
+        # 依 response 排序後，每個點在自己格子中的名次
+        rank = np.empty(len(order), dtype=int)
+        for c in np.unique(cell):
+            in_cell = np.nonzero(cell == c)[0]
+            rank[in_cell] = np.arange(len(in_cell))
+        first = order[rank < quota]
+        rest = order[rank >= quota]
+        order = np.concatenate([first, rest])
+    keep = np.sort(order[:max_keypoints])
+    return [kp[i] for i in keep], des[keep]
+
+
+def root_sift(des, eps=1e-7):
+    """ RootSIFT：L1 正規化後開根號（歐氏距離等同 Hellinger 核） """
+    des = des.astype(np.float32)
+    des /= des.sum(axis=1, keepdims=True) + eps
+    return np.sqrt(des)
+
+
+def postprocess(kp, des, shape, max_keypoints, grid=KEYPOINT_GRID, use_root_sift=ROOT_SIFT):
+    """ 套用關鍵點預算與 RootSIFT """
+    if des is None:
+        return kp, des
+    kp, des = select_keypoints(kp, des, max_keypoints, shape, grid)
+    if use_root_sift:
+        des = root_sift(des)
+    return kp, des
+
+
+def detect_and_compute(image, max_keypoints=None):
+    """
+    image 可為已解碼的 ndarray 或編碼後的圖片位元組，回傳 (kp, des)。
+    max_keypoints 預設為查詢端預算 QUERY_MAX_KEYPOINTS。
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None, None
+    with metrics.stage("sift"):
+        kp, des = get_sift().detectAndCompute(image, None)
+        max_keypoints = QUERY_MAX_KEYPOINTS if max_keypoints is None else max_keypoints
+        kp, des = postprocess(kp, des, image.shape, max_keypoints)
+    metrics.observe("keypoints", len(kp), kind="query")
+    return kp, des
+
+
+def _thread_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix="sift")
+        return _pool
+
+
+def submit_many(images):
+    """ 將每張圖的特徵擷取送進共用執行緒池，立即回傳 Future 清單（順序與輸入相同） """
+    pool = _thread_pool()
+    extract = metrics.bind(detect_and_compute)
+    return [pool.submit(extract, img) for img in images]
+
+
+def extract_many(images, workers=None):
+    """
+    請求路徑：平行擷取多張圖（例如同一次上傳的所有裁切圖）。
+    OpenCV 計算時會釋放 GIL，因此使用共用的執行緒池；回傳順序與輸入相同。
+    """
+    images = list(images)
+    workers = EXTRACT_WORKERS if workers is None else workers
+    if workers <= 1 or len(images) <= 1:
+        return [detect_and_compute(img) for img in images]
+    if workers == EXTRACT_WORKERS:
+        return [f.result() for f in submit_many(images)]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sift") as pool:
+        return list(pool.map(detect_and_compute, images))
+
+
+def _init_build_worker():
+    # 每個行程只跑一個 SIFT，避免 OpenCV 內部執行緒與行程數互相搶核心
+    cv2.setNumThreads(1)
+
+
+def _extract_path(image_path, max_keypoints=None, grid=KEYPOINT_GRID, use_root_sift=ROOT_SIFT):
+    img = cv2.imread(image_path)
+    if img is None:
+        print(f"⚠️ 無法讀取圖片：{image_path}")
+        return None, None
+    kp, des = get_sift().detectAndCompute(img, None)
+    max_keypoints = GALLERY_MAX_KEYPOINTS if max_keypoints is None else max_keypoints
+    kp, des = postprocess(kp, des, img.shape, max_keypoints, grid, use_root_sift)
+    # cv2.KeyPoint 無法跨行程傳遞，只回傳建快取需要的屬性
+    return [(p.pt[0], p.pt[1], p.size, p.angle) for p in kp], des
+
+
+def extract_paths(image_paths, workers=None, use_processes=True, desc=None,
+                  max_keypoints=None, grid=KEYPOINT_GRID, use_root_sift=ROOT_SIFT):
+    """
+    離線建快取：平行擷取圖檔特徵，回傳 [(kp_attrs, des), ...]，順序與輸入相同。
+    讀取失敗的圖片回傳 (None, None)。max_keypoints 預設為圖庫端預算 GALLERY_MAX_KEYPOINTS。
+    """
+    image_paths = list(image_paths)
+    workers = BUILD_WORKERS if workers is None else workers
+    extract = partial(_extract_path, max_keypoints=max_keypoints, grid=grid, use_root_sift=use_root_sift)
+    if workers <= 1:
+        return [extract(p) for p in tqdm(image_paths, desc=desc, unit="張")]
+
+    if use_processes:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_build_worker)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sift-build")
+    chunksize = max(1, len(image_paths) // (workers * 16)) if use_processes else 1
+    with executor:
+        return list(tqdm(
+            executor.map(extract, image_paths, chunksize=chunksize),
+            total=len(image_paths), desc=desc, unit="張",
+        ))
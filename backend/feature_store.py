@@ -0,0 +1,128 @@
+import os
+import threading
+import numpy as np
+from backend.image_processing import load_or_build_cache, load_manifest, manifest_path
+from backend.columnar_store import meta_path
+from backend.feature_extractor import ROOT_SIFT
+
+# 行程內常駐的圖庫快取：每個類別只載入一次，所有請求共用
+_galleries = {}
+_category_locks = {}
+_lock = threading.Lock()
+_version_counter = 0
+
+
+class Gallery:
+    """ 單一類別的圖庫特徵（memmap 唯讀，重新載入時整個替換） """
+
+    def __init__(self, category, store, signature, version, manifest=None):
+        self.category = category
+        self.paths = store["paths"]
+        self.names = store["names"]
+        # 所有描述子連續存放，offsets[i]:offsets[i + 1] 為第 i 張圖的列
+        self.all_desc = store["descriptors"]
+        self.keypoints = store["keypoints"]
+        self.offsets = store["offsets"]
+        # 描述子列 → 圖片編號，供向量化投票使用
+        self.image_ids = store["image_ids"]
+        self.signature = signature
+        self.version = version
+        # 快取清單的版本號（增量更新時遞增）
+        self.cache_version = manifest.get("version", 0) if manifest else 0
+        self.live_ids = _live_ids(self.offsets, manifest)
+
+    def descriptors_of(self, image_idx):
+        return self.all_desc[self.offsets[image_idx]:self.offsets[image_idx + 1]]
+
+    def keypoints_of(self, image_idx):
+        return self.keypoints[self.offsets[image_idx]:self.offsets[image_idx + 1]]
+
+
+def _live_ids(offsets, manifest):
+    """
+    增量更新後被刪除或取代的圖片仍留在快取中（描述子列號不變），
+    回傳仍有效的描述子列號；全部有效時回傳 None。
+    """
+    if not manifest:
+        return None
+    live = sorted(entry["image_idx"] for entry in manifest["files"].values())
+    if len(live) == len(offsets) - 1:
+        return None
+    return np.concatenate(
+        [np.arange(offsets[i], offsets[i + 1]) for i in live]
+    ).astype('int64') if live else np.empty(0, dtype='int64')
+
+
+def _signature(category):
+    """ 以快取檔的 mtime 與大小作為版本指紋，檔案不存在時回傳 None """
+    try:
+        st = os.stat(meta_path(category))
+    except FileNotFoundError:
+        return None
+    sig = [(st.st_mtime_ns, st.st_size)]
+    try:
+        st = os.stat(manifest_path(category))
+        sig.append((st.st_mtime_ns, st.st_size))
+    except FileNotFoundError:
+        sig.append(None)
+    return tuple(sig)
+
+
+def _category_lock(category):
+    with _lock:
+        lock = _category_locks.get(category)
+        if lock is None:
+            lock = _category_locks[category] = threading.Lock()
+        return lock
+
+
+def _load(category):
+    global _version_counter
+    signature = _signature(category)
+    store = load_or_build_cache(category)
+    if store is None:
+        return None
+    if store["meta"].get("root_sift", False) != ROOT_SIFT:
+        # RootSIFT 與一般 SIFT 描述子無法互相比對，不載入（比對結果只會是錯的）
+        print(f"❌ 快取的 RootSIFT 設定與查詢端不一致（YGO_ROOT_SIFT），請重新建立快取：{category}")
+        return None
+    if signature is None:
+        signature = _signature(category)
+    with _lock:
+        _version_counter += 1
+        version = _version_counter
+    return Gallery(category, store, signature, version, load_manifest(category))
+
+
+def get_gallery(category):
+    """
+    取得類別的常駐圖庫；第一次使用時載入，快取檔在磁碟上變動時自動重新載入。
+    回傳 Gallery，無法建立快取時回傳 None。
+    """
+    gallery = _galleries.get(category)
+    if gallery is not None and gallery.signature == _signature(category):
+        return gallery
+
+    with _category_lock(category):
+        # 等待鎖的期間可能已由其他執行緒載入完成
+        gallery = _galleries.get(category)
+        if gallery is not None and gallery.signature == _signature(category):
+            return gallery
+        if gallery is not None:
+            print(f"🔄 快取檔已變更，重新載入：{category}")
+        gallery = _load(category)
+        if gallery is not None:
+            _galleries[category] = gallery
+        return gallery
+
+
+def preload(categories):
+    """ 啟動時預先載入指定類別 """
+    for category in categories:
+        get_gallery(category)
+
+
+def evict(category):
+    """ 從記憶體移除類別（下次使用時重新載入） """
+    with _category_lock(category):
+        _galleries.pop(category, None)
@@ -1,28 +1,18 @@
 import os
-import numpy as np
-import cv2
-from tqdm import tqdm
+import json
+import hashlib
+from backend.feature_extractor import (
+    extract_paths, GALLERY_MAX_KEYPOINTS, KEYPOINT_GRID, ROOT_SIFT,
+)
+from backend.columnar_store import CACHE_DIR, store_exists, write_store, open_store, convert_npz_cache
+from backend import DATA_DIR, metrics
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-CACHE_DIR = os.path.join(BASE_DIR, "data", "cache")
-GALLERY_DIR = os.path.join(BASE_DIR, "data", "gallery")
-
-def extract_features(image_path):
-    """ 提取單張圖片的 SIFT 特徵 """
-    sift = cv2.SIFT_create()
-    img = cv2.imread(image_path)
-    if img is None:
-        print(f"⚠️ 無法讀取圖片：{image_path}")
-        return None, None
-
-    kp, des = sift.detectAndCompute(img, None)
-    return kp, des
+GALLERY_DIR = os.path.join(DATA_DIR, "gallery")
 
+@metrics.timed("build_cache")
 def build_cache(category):
     """ 建立快取 """
     gallery_path = os.path.join(GALLERY_DIR, category)
-    cache_file = os.path.join(CACHE_DIR, f"{category}.npz")
-    desc_file = os.path.join(CACHE_DIR, f"{category}.npy")
 
     if not os.path.exists(gallery_path):
         raise FileNotFoundError(f"圖片目錄不存在：{gallery_path}")
@@ -30,56 +20,83 @@ def build_cache(category):
     print(f"🔨 正在建立快取：{category}")
 
     paths, names, kp_attrs, descs = [], [], [], []
-    sift = cv2.SIFT_create()
 
     file_list = os.listdir(gallery_path)
-    for fname in tqdm(file_list, desc=f"提取特徵中 ({category})", unit="張"):
-        img_path = os.path.join(gallery_path, fname)
-        kp, des = extract_features(img_path)
+    img_paths = [os.path.join(gallery_path, fname) for fname in file_list]
+    results = extract_paths(img_paths, desc=f"提取特徵中 ({category})")
+    for fname, img_path, (attrs, des) in zip(file_list, img_paths, results):
         if des is not None:
             paths.append(img_path)
             names.append(fname)
-            kp_attrs.append([(p.pt[0], p.pt[1], p.size, p.angle) for p in kp])
+            kp_attrs.append(attrs)
             descs.append(des)
 
-    # 儲存快取文件
-    print("💾 儲存壓縮快取 (.npz)...")
-    savez = {
-        'paths': np.array(paths),
-        'names': np.array(names),
-        'kp_attrs': np.array(kp_attrs, dtype=object)
-    }
-    for i, des in enumerate(descs):
-        savez[f'des{i}'] = des
-    np.savez_compressed(cache_file, **savez)
-
-    if descs:
-        print("💾 儲存所有描述子 (.npy)...")
-        np.save(desc_file, np.vstack(descs).astype('float32'))
-        print(f"✅ 快取構建完成：{category}")
-    else:
+    if not descs:
         print(f"⚠️ 無法建立快取：{category} 沒有有效的圖像數據")
+        return
 
-def load_or_build_cache(category):
-    """ 讀取或構建快取 """
-    cache_file = os.path.join(CACHE_DIR, f"{category}.npz")
-    desc_file = os.path.join(CACHE_DIR, f"{category}.npy")
+    print("💾 儲存欄式快取...")
+    write_store(category, paths, names, kp_attrs, descs,
+                dtype="float32" if ROOT_SIFT else None,
+                extra={"max_keypoints": GALLERY_MAX_KEYPOINTS, "grid": KEYPOINT_GRID, "root_sift": ROOT_SIFT})
+    print(f"✅ 快取構建完成：{category}")
+
+    # 重新建立快取：所有圖片都是有效的，版本號 +1
+    previous = load_manifest(category) or {}
+    save_manifest(category, {
+        "version": previous.get("version", 0) + 1,
+        "files": {
+            name: {**file_fingerprint(path), "image_idx": i}
+            for i, (name, path) in enumerate(zip(names, paths))
+        },
+    })
+
+def manifest_path(category):
+    return os.path.join(CACHE_DIR, f"{category}.manifest.json")
+
+def file_fingerprint(path):
+    """ 圖庫檔案的指紋：大小、修改時間與 SHA-1 """
+    st = os.stat(path)
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": sha1.hexdigest()}
 
-    if os.path.exists(cache_file) and os.path.exists(desc_file):
+def load_manifest(category):
+    """
+    讀取快取清單：{"version": int, "files": {檔名: {size, mtime_ns, sha1, image_idx}}}
+    image_idx 指向快取中的圖片編號；不在清單中的快取圖片視為已刪除。
+    """
+    path = manifest_path(category)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(category, manifest):
+    path = manifest_path(category)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+def load_or_build_cache(category):
+    """
+    讀取或構建快取，回傳 columnar_store.open_store 的 dict；
+    只有舊的 .npz 快取時先轉換成欄式格式。
+    """
+    if store_exists(category):
         print(f"✅ 已加載快取：{category}")
-        npz = np.load(cache_file, allow_pickle=True)
-        paths = npz['paths'].tolist()
-        names = npz['names'].tolist()
-        kp_attrs = npz['kp_attrs']
-        descs = [npz[f'des{i}'] for i in range(len(names))]
-        all_desc = np.load(desc_file)
-        return paths, names, kp_attrs, descs, all_desc
-
-    print(f"⚠️ 快取不存在，開始構建：{category}")
-    build_cache(category)
-
-    if os.path.exists(cache_file) and os.path.exists(desc_file):
+        return open_store(category)
+
+    if os.path.exists(os.path.join(CACHE_DIR, f"{category}.npz")):
+        convert_npz_cache(category)
+    else:
+        print(f"⚠️ 快取不存在，開始構建：{category}")
+        build_cache(category)
+
+    if store_exists(category):
         return load_or_build_cache(category)
 
     print(f"❌ 無法建立快取：{category}")
-    return None, None, None, None, None
+    return None
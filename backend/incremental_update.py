@@ -0,0 +1,197 @@
+"""
+增量更新圖庫快取與索引：
+
+    python -m backend.incremental_update effect
+
+比對 data/gallery/{category} 與快取清單（檔名、大小、修改時間、SHA-1），
+只擷取新增或變更的圖片，附加到欄式快取尾端，並直接 add / remove_ids 到已訓練的索引
+（限 IVF 或 IndexIDMap；其他索引類型刪除後於下次請求時重新建立）。
+被刪除或取代的圖片仍留在快取中（描述子列號不變），只從索引與清單中移除。
+新圖片以快取 meta.json 記錄的擷取設定（關鍵點預算、網格、RootSIFT）擷取，
+與目前環境變數不同時也不會混用；新描述子無法存入快取時改為完整重建。
+"""
+import os
+import argparse
+import numpy as np
+import faiss
+from backend.image_processing import (
+    CACHE_DIR, GALLERY_DIR, build_cache, file_fingerprint, load_manifest, save_manifest,
+)
+from backend.columnar_store import store_exists, open_store, append_store, convert_npz_cache
+from backend.feature_extractor import extract_paths, ROOT_SIFT
+from backend.index_registry import index_path
+
+
+def _bootstrap_manifest(category, paths, names):
+    """ 舊快取沒有清單時，假設快取與目前的圖庫檔案一致 """
+    print(f"📝 建立快取清單：{category}")
+    files = {}
+    for i, (name, path) in enumerate(zip(names, paths)):
+        if os.path.exists(path):
+            files[name] = {**file_fingerprint(path), "image_idx": i}
+    return {"version": 0, "files": files}
+
+
+def diff_gallery(category, manifest):
+    """
+    回傳 (added, changed, removed, touched)：
+    touched 為只有修改時間改變、內容相同的檔案 {檔名: 新指紋}。
+    """
+    gallery_path = os.path.join(GALLERY_DIR, category)
+    files = manifest["files"]
+    current = [
+        fname for fname in os.listdir(gallery_path)
+        if os.path.isfile(os.path.join(gallery_path, fname))
+    ]
+
+    added, changed, touched = [], [], {}
+    for fname in current:
+        path = os.path.join(gallery_path, fname)
+        old = files.get(fname)
+        if old is None:
+            added.append(fname)
+            continue
+        st = os.stat(path)
+        if st.st_size == old["size"] and st.st_mtime_ns == old["mtime_ns"]:
+            continue
+        fingerprint = file_fingerprint(path)
+        if fingerprint["sha1"] == old["sha1"]:
+            touched[fname] = fingerprint
+        else:
+            changed.append(fname)
+
+    current = set(current)
+    removed = [fname for fname in files if fname not in current]
+    return added, changed, removed, touched
+
+
+def extraction_settings(meta):
+    """ 快取建立時的擷取設定 → extract_paths 的參數（舊快取沒有記錄時為未啟用這些功能前的預設） """
+    return {
+        "max_keypoints": meta.get("max_keypoints", 0),
+        "grid": meta.get("grid", 0),
+        "use_root_sift": meta.get("root_sift", False),
+    }
+
+
+def _rebuild(category):
+    """ 以目前的設定完整重建快取，並刪除舊索引（下次請求時重新建立） """
+    build_cache(category)
+    if os.path.exists(index_path(category)):
+        os.remove(index_path(category))
+    return (load_manifest(category) or {}).get("version", 0)
+
+
+def update_category(category):
+    """ 增量更新類別的快取、索引與清單，回傳新的快取版本號 """
+    if not store_exists(category):
+        if os.path.exists(os.path.join(CACHE_DIR, f"{category}.npz")):
+            convert_npz_cache(category)
+        else:
+            print(f"⚠️ 快取不存在，改為完整建立：{category}")
+            build_cache(category)
+            return (load_manifest(category) or {}).get("version", 0)
+
+    store = open_store(category)
+    paths, names, offsets = store["paths"], store["names"], store["offsets"]
+    manifest = load_manifest(category)
+    if manifest is None:
+        manifest = _bootstrap_manifest(category, paths, names)
+        save_manifest(category, manifest)
+    files = manifest["files"]
+
+    added, changed, removed, touched = diff_gallery(category, manifest)
+    print(f"📋 新增 {len(added)}、變更 {len(changed)}、刪除 {len(removed)}：{category}")
+    if not (added or changed or removed or touched):
+        print(f"✅ 快取已是最新：{category}")
+        return manifest["version"]
+
+    stale = [files[fname]["image_idx"] for fname in changed + removed]
+
+    # 只擷取新增 / 變更的圖片，附加在快取尾端
+    gallery_path = os.path.join(GALLERY_DIR, category)
+    new_names = added + changed
+    new_paths = [os.path.join(gallery_path, fname) for fname in new_names]
+    settings = extraction_settings(store["meta"])
+    if settings["use_root_sift"] != ROOT_SIFT:
+        print(f"⚠️ 快取的 RootSIFT 設定與目前的 YGO_ROOT_SIFT 不同，沿用快取的設定：{category}")
+    results = extract_paths(new_paths, desc=f"提取新增特徵 ({category})", **settings)
+
+    next_image = len(names)
+    added_paths, added_names, added_attrs, new_descs = [], [], [], []
+    for fname in removed:
+        files.pop(fname)
+    for fname, path, (attrs, des) in zip(new_names, new_paths, results):
+        files.pop(fname, None)
+        if des is None:
+            continue
+        files[fname] = {**file_fingerprint(path), "image_idx": next_image + len(added_names)}
+        added_paths.append(path)
+        added_names.append(fname)
+        added_attrs.append(attrs)
+        new_descs.append(des)
+    for fname, fingerprint in touched.items():
+        files[fname].update(fingerprint)
+
+    if new_descs or stale:
+        try:
+            first_row = append_store(category, added_paths, added_names, added_attrs, new_descs)
+        except ValueError as e:
+            print(f"{e}\n⚠️ 改為完整建立：{category}")
+            return _rebuild(category)
+        _update_index(category, offsets, stale, new_descs, first_row)
+        manifest["version"] += 1
+    # 只有修改時間改變時只更新指紋，版本不變（已快取的辨識結果仍有效）
+    save_manifest(category, manifest)
+    print(f"✅ 增量更新完成：{category}（版本 {manifest['version']}）")
+    return manifest["version"]
+
+
+def _keeps_ids(index):
+    """ 索引是否以明確的 id 保存描述子列號（IVF 或 IndexIDMap），移除部分 id 後其餘不變 """
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return True
+    try:
+        faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return False
+    return True
+
+
+def _update_index(category, offsets, stale, new_descs, first_row):
+    """ 在已訓練的索引上移除過期圖片的描述子並加入新描述子（列號即索引 id） """
+    path = index_path(category)
+    if not os.path.exists(path):
+        # 尚未建立索引：下次請求時由 index_registry 以有效的描述子建立
+        return
+
+    index = faiss.read_index(path)
+    if not _keeps_ids(index):
+        # Flat / HNSW 等索引的 id 即儲存順序，remove_ids 會讓其後的描述子重新編號而對應到錯的圖片
+        print(f"⚠️ 此索引未保存描述子列號，將重新建立：{category}")
+        os.remove(path)
+        return
+    try:
+        for image_idx in stale:
+            index.remove_ids(faiss.IDSelectorRange(int(offsets[image_idx]), int(offsets[image_idx + 1])))
+        if new_descs:
+            vectors = np.vstack(new_descs).astype('float32')
+            ids = np.arange(first_row, first_row + len(vectors), dtype='int64')
+            index.add_with_ids(vectors, ids)
+    except RuntimeError as e:
+        # 例如 HNSW 不支援 remove_ids：刪除索引，下次請求時依設定重新建立
+        print(f"⚠️ 此索引類型無法增量更新，將重新建立：{e}")
+        os.remove(path)
+        return
+
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    print(f"✅ 索引已更新：{category}（共 {index.ntotal} 筆）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="增量更新圖庫快取與索引")
+    parser.add_argument("categories", nargs="+", help="類別名稱，例如 effect all")
+    args = parser.parse_args()
+    for category in args.categories:
+        update_category(category)
@@ -0,0 +1,184 @@
+"""
+建立索引並以保留的裁切圖測試不同索引設定的準確率與延遲：
+
+    python -m backend.index_builder build effect --factory IVF1024,SQ8 --param nprobe=8
+    python -m backend.index_builder sweep effect --heldout data/heldout/effect \\
+        --factory IVF500,PQ32x8 --factory IVF1024,SQ8 --factory HNSW32 \\
+        --factory OPQ32,IVF1024,PQ32 --nprobe 1,2,4,8,16 --ef-search 16,32,64,128 --write
+
+保留集的檔名以卡號開頭（例如 12345678_photo1.jpg）。選定的設定寫入
+data/cache/{category}.index.json，matcher 透過 index_registry 載入。
+"""
+import os
+import time
+import json
+import argparse
+import numpy as np
+import faiss
+from backend.feature_store import get_gallery
+from backend.feature_extractor import extract_paths, QUERY_MAX_KEYPOINTS
+from backend.index_registry import (
+    DEFAULT_FACTORY, create_index, apply_search_params, build_index,
+    load_index_config, save_index_config,
+)
+from backend.voting import vote
+from backend.verification import GEOMETRIC_VERIFY, verify_candidates
+
+# 準確率與最佳設定相差在此範圍內時，選擇延遲較低者
+ACCURACY_TOLERANCE = 0.01
+
+
+def card_id_of(fname):
+    """ 檔名 → 8 碼卡號（12345678.jpg、12345678_photo1.jpg） """
+    return os.path.splitext(os.path.basename(fname))[0].split("_")[0].zfill(8)
+
+
+def load_queries(heldout_dir, workers=None):
+    """ 擷取保留集的特徵，回傳 [(卡號, 關鍵點座標, 描述子), ...] """
+    fnames = sorted(
+        f for f in os.listdir(heldout_dir)
+        if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+    )
+    paths = [os.path.join(heldout_dir, f) for f in fnames]
+    queries = []
+    results = extract_paths(paths, workers, desc="擷取保留集特徵", max_keypoints=QUERY_MAX_KEYPOINTS)
+    for fname, (attrs, des) in zip(fnames, results):
+        if des is None or len(des) == 0:
+            continue
+        pts = np.asarray(attrs, dtype=np.float32).reshape(-1, 4)[:, :2].copy()
+        queries.append((card_id_of(fname), pts, des.astype("float32")))
+    return queries
+
+
+def evaluate(index, gallery, queries):
+    """ 以目前的搜尋參數計算卡片層級的 top-1 準確率與每次查詢延遲（搜尋 + 投票 + 驗證） """
+    correct, latencies = 0, []
+    card_ids = [card_id_of(name) for name in gallery.names]
+    for label, pts, des in queries:
+        t0 = time.perf_counter()
+        D, I = index.search(des, 2)
+        candidates = vote(D, I, gallery.image_ids, len(gallery.names))
+        if GEOMETRIC_VERIFY:
+            candidates = verify_candidates(pts, D, I, candidates, gallery)
+        latencies.append(time.perf_counter() - t0)
+        if candidates and card_ids[candidates[0][0]] == label:
+            correct += 1
+    latencies = np.array(latencies) * 1000
+    return {
+        "accuracy": correct / len(queries) if queries else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        "p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+    }
+
+
+def param_grid(factory, nprobes, ef_searches):
+    """ IVF 類索引掃 nprobe，純 HNSW 掃 efSearch，其餘（Flat 等）不需參數 """
+    if "IVF" in factory:
+        return [{"nprobe": v} for v in nprobes]
+    if "HNSW" in factory:
+        return [{"efSearch": v} for v in ef_searches]
+    return [{}]
+
+
+def choose(results, tolerance=ACCURACY_TOLERANCE):
+    """ 在準確率接近最佳的設定中選擇 p50 延遲最低者 """
+    best = max(r["accuracy"] for r in results)
+    eligible = [r for r in results if r["accuracy"] >= best - tolerance]
+    return min(eligible, key=lambda r: r["p50_ms"])
+
+
+def sweep(category, heldout_dir, factories, nprobes, ef_searches, max_train=None, write=False):
+    gallery = get_gallery(category)
+    if gallery is None:
+        raise ValueError(f"❌ 無法載入快取：{category}")
+    queries = load_queries(heldout_dir)
+    if not queries:
+        raise ValueError(f"❌ 保留集沒有可用的圖片：{heldout_dir}")
+
+    ids = gallery.live_ids
+    vectors = np.ascontiguousarray(
+        gallery.all_desc if ids is None else gallery.all_desc[ids], dtype="float32")
+
+    results = []
+    for factory in factories:
+        print(f"🔨 建立索引：{factory}")
+        t0 = time.perf_counter()
+        index = create_index(factory, vectors, ids, max_train)
+        build_s = time.perf_counter() - t0
+        size_bytes = int(faiss.serialize_index(index).nbytes)
+        for params in param_grid(factory, nprobes, ef_searches):
+            apply_search_params(index, params)
+            result = {"factory": factory, "params": params, "build_s": round(build_s, 2),
+                      "size_bytes": size_bytes, **evaluate(index, gallery, queries)}
+            results.append(result)
+            print(f"  {json.dumps(params)}: top-1 {result['accuracy']:.3f}，"
+                  f"p50 {result['p50_ms']:.2f} ms，p95 {result['p95_ms']:.2f} ms")
+        del index
+
+    chosen = choose(results)
+    print(f"✅ 選定：{chosen['factory']} {json.dumps(chosen['params'])}"
+          f"（top-1 {chosen['accuracy']:.3f}，p50 {chosen['p50_ms']:.2f} ms）")
+
+    if write:
+        save_index_config(category, {
+            "factory": chosen["factory"],
+            "params": chosen["params"],
+            "max_train": max_train,
+            "accuracy": chosen["accuracy"],
+            "p50_ms": chosen["p50_ms"],
+            "heldout": os.path.abspath(heldout_dir),
+            "queries": len(queries),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "sweep": results,
+        })
+        build_index(category, gallery.all_desc, ids)
+    return chosen, results
+
+
+def _parse_ints(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def _parse_param(text):
+    name, value = text.split("=", 1)
+    return name, float(value) if "." in value else int(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="建立索引與索引設定掃描")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="以指定設定建立索引並寫入設定檔")
+    build.add_argument("category")
+    build.add_argument("--factory", default=None, help=f"faiss factory 字串，預設 {DEFAULT_FACTORY}")
+    build.add_argument("--param", action="append", default=[], help="搜尋參數，例如 nprobe=8")
+    build.add_argument("--max-train", type=int, default=None)
+
+    sw = sub.add_parser("sweep", help="掃描索引設定並回報準確率 / 延遲")
+    sw.add_argument("category")
+    sw.add_argument("--heldout", required=True, help="保留集裁切圖目錄")
+    sw.add_argument("--factory", action="append", default=None)
+    sw.add_argument("--nprobe", type=_parse_ints, default=[1, 2, 4, 8, 16])
+    sw.add_argument("--ef-search", type=_parse_ints, default=[16, 32, 64, 128])
+    sw.add_argument("--max-train", type=int, default=None)
+    sw.add_argument("--output", default=None, help="將掃描結果另存為 JSON")
+    sw.add_argument("--write", action="store_true", help="寫入選定的設定並重建索引")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        config = load_index_config(args.category)
+        if args.factory:
+            config = {"factory": args.factory, "params": {}}
+        config["params"].update(dict(_parse_param(p) for p in args.param))
+        config["max_train"] = args.max_train
+        save_index_config(args.category, config)
+        gallery = get_gallery(args.category)
+        build_index(args.category, gallery.all_desc, gallery.live_ids)
+    else:
+        chosen, results = sweep(
+            args.category, args.heldout, args.factory or [DEFAULT_FACTORY],
+            args.nprobe, args.ef_search, args.max_train, args.write,
+        )
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"chosen": chosen, "results": results}, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,211 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+import faiss
+import numpy as np
+from backend.image_processing import CACHE_DIR
+from backend import metrics
+
+# 預設 IVFPQ 參數（PQ 的 M 必須整除 SIFT 維度 128）；
+# 可由 backend.index_builder 寫入的 {category}.index.json 覆寫
+NLIST = 500
+PQ_M = 32
+PQ_NBITS = 8
+NPROBE = 1
+DEFAULT_FACTORY = f"IVF{NLIST},PQ{PQ_M}x{PQ_NBITS}"
+DEFAULT_PARAMS = {"nprobe": NPROBE}
+
+# 常駐索引的記憶體上限（MB），超過時以 LRU 淘汰
+INDEX_MEMORY_BUDGET_MB = int(os.environ.get("YGO_INDEX_BUDGET_MB", "2048"))
+# 以 mmap 載入索引，讓多個 gunicorn worker 共用同一份頁面
+INDEX_USE_MMAP = os.environ.get("YGO_INDEX_MMAP", "0") == "1"
+
+_indexes = OrderedDict()  # category -> (index, nbytes, signature)
+_category_locks = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def index_path(category):
+    return os.path.join(CACHE_DIR, f"{category}.index")
+
+
+def config_path(category):
+    return os.path.join(CACHE_DIR, f"{category}.index.json")
+
+
+def load_index_config(category):
+    """ 讀取索引設定：{"factory": faiss factory 字串, "params": 搜尋參數} """
+    path = config_path(category)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"factory": DEFAULT_FACTORY, "params": dict(DEFAULT_PARAMS)}
+
+
+def save_index_config(category, config):
+    path = config_path(category)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _signature(path, category):
+    """ 索引檔與設定檔的 mtime / 大小；索引檔不存在時回傳 None """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    try:
+        cfg = os.stat(config_path(category))
+        cfg = (cfg.st_mtime_ns, cfg.st_size)
+    except FileNotFoundError:
+        cfg = None
+    return st.st_mtime_ns, st.st_size, cfg
+
+
+def _category_lock(category):
+    with _lock:
+        lock = _category_locks.get(category)
+        if lock is None:
+            lock = _category_locks[category] = threading.Lock()
+        return lock
+
+
+def create_index(factory, vectors, ids=None, max_train=None):
+    """
+    以 faiss factory 字串（例如 IVF500,PQ32x8、IVF1024,SQ8、HNSW32、OPQ32,IVF1024,PQ32）
+    建立並訓練索引。ids 為描述子列號；不支援 add_with_ids 的索引外包 IndexIDMap。
+    max_train 限制訓練用的樣本數（大型圖庫隨機抽樣）。
+    """
+    index = faiss.index_factory(vectors.shape[1], factory)
+    if max_train and len(vectors) > max_train:
+        sample = np.random.default_rng(0).choice(len(vectors), max_train, replace=False)
+        index.train(vectors[np.sort(sample)])
+    else:
+        index.train(vectors)
+    if ids is None:
+        index.add(vectors)
+        return index
+    try:
+        faiss.extract_index_ivf(index)
+    except RuntimeError:
+        index = faiss.IndexIDMap(index)
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+def apply_search_params(index, params):
+    """ 套用搜尋參數（nprobe、efSearch 等），對 OPQ 等前處理包裝的索引同樣有效 """
+    space = faiss.ParameterSpace()
+    for name, value in params.items():
+        space.set_index_parameter(index, name, value)
+
+
+@metrics.timed("build_index")
+def build_index(category, all_desc, ids=None):
+    """
+    依類別的索引設定訓練索引並寫入磁碟。
+    ids 為要收錄的描述子列號（增量更新後排除已刪除的圖片），None 表示全部。
+    """
+    config = load_index_config(category)
+    # 快取中的描述子可能是 uint8 memmap，訓練前轉成連續的 float32
+    if ids is None:
+        vectors = np.ascontiguousarray(all_desc, dtype='float32')
+    else:
+        vectors = np.ascontiguousarray(all_desc[ids], dtype='float32')
+    index = create_index(config["factory"], vectors, ids, config.get("max_train"))
+    path = index_path(category)
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    print(f"✅ 建立新索引完成：{category}（{config['factory']}）")
+
+
+def _read_index(path):
+    if INDEX_USE_MMAP:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    return faiss.read_index(path)
+
+
+def _evict_over_budget(keep):
+    budget = INDEX_MEMORY_BUDGET_MB * 1024 * 1024
+    total = sum(nbytes for _, nbytes, _ in _indexes.values())
+    for category in list(_indexes):
+        if total <= budget:
+            break
+        if category == keep:
+            continue
+        _, nbytes, _ = _indexes.pop(category)
+        total -= nbytes
+        _stats["evictions"] += 1
+        print(f"♻️ 淘汰索引：{category}")
+
+
+def get_index(category, all_desc=None, ids=None):
+    """
+    取得類別的常駐 FAISS 索引；索引檔不存在時以 all_desc（限 ids 列）建立。
+    索引檔在磁碟上變動時自動重新載入。
+    """
+    path = index_path(category)
+    sig = _signature(path, category)
+    with _lock:
+        entry = _indexes.get(category)
+        if entry is not None and sig is not None and entry[2] == sig:
+            _indexes.move_to_end(category)
+            _stats["hits"] += 1
+            metrics.count("index_cache", category=category, result="hit")
+            return entry[0]
+
+    with _category_lock(category):
+        sig = _signature(path, category)
+        with _lock:
+            entry = _indexes.get(category)
+            if entry is not None and sig is not None and entry[2] == sig:
+                _indexes.move_to_end(category)
+                _stats["hits"] += 1
+                metrics.count("index_cache", category=category, result="hit")
+                return entry[0]
+            _stats["misses"] += 1
+            metrics.count("index_cache", category=category, result="miss")
+
+        if sig is None:
+            if all_desc is None:
+                raise FileNotFoundError(f"❌ 索引不存在：{path}")
+            build_index(category, all_desc, ids)
+            sig = _signature(path, category)
+
+        index = _read_index(path)
+        apply_search_params(index, load_index_config(category).get("params", {}))
+        # mmap 載入時倒排表與其他行程共用，仍以檔案大小計入預算（保守估計）
+        nbytes = sig[1]
+
+        with _lock:
+            _indexes[category] = (index, nbytes, sig)
+            _indexes.move_to_end(category)
+            _evict_over_budget(keep=category)
+        return index
+
+
+def index_signature(category):
+    """ 磁碟上索引檔與設定檔目前的簽章（重建索引或改設定後會改變） """
+    return _signature(index_path(category), category)
+
+
+def evict(category):
+    """ 從記憶體移除類別索引 """
+    with _lock:
+        if _indexes.pop(category, None) is not None:
+            _stats["evictions"] += 1
+
+
+def stats():
+    """ 回傳命中 / 未命中 / 淘汰次數與目前常駐的索引 """
+    with _lock:
+        return {
+            **_stats,
+            "resident": list(_indexes),
+            "resident_bytes": sum(nbytes for _, nbytes, _ in _indexes.values()),
+            "budget_bytes": INDEX_MEMORY_BUDGET_MB * 1024 * 1024,
+            "mmap": INDEX_USE_MMAP,
+        }
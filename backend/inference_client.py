@@ -0,0 +1,108 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from backend import metrics
+
+# Roboflow 推論服務設定（ROBOFLOW_URL 可指向本機 stub server 測試）
+ROBOFLOW_URL = os.environ.get("ROBOFLOW_URL", "https://detect.roboflow.com")
+API_KEY = os.environ.get("ROBOFLOW_API_KEY", "")
+CONNECT_TIMEOUT = float(os.environ.get("ROBOFLOW_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.environ.get("ROBOFLOW_READ_TIMEOUT", "20"))
+MAX_RETRIES = int(os.environ.get("ROBOFLOW_MAX_RETRIES", "2"))
+BACKOFF_FACTOR = 0.3
+POOL_SIZE = 16
+JPEG_QUALITY = 90
+
+_session = None
+_session_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def configure(base_url=None, api_key=None, connect_timeout=None, read_timeout=None, max_retries=None):
+    """ 修改連線設定並重建連線池（例如測試時改連本機 stub server） """
+    global ROBOFLOW_URL, API_KEY, CONNECT_TIMEOUT, READ_TIMEOUT, MAX_RETRIES, _session
+    with _session_lock:
+        if base_url is not None:
+            ROBOFLOW_URL = base_url.rstrip("/")
+        if api_key is not None:
+            API_KEY = api_key
+        if connect_timeout is not None:
+            CONNECT_TIMEOUT = connect_timeout
+        if read_timeout is not None:
+            READ_TIMEOUT = read_timeout
+        if max_retries is not None:
+            MAX_RETRIES = max_retries
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_session():
+    """ 共用的 keep-alive 連線池，連線錯誤與 429 / 5xx 會以指數退避重試 """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=MAX_RETRIES,
+                backoff_factor=BACKOFF_FACTOR,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({"POST"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def to_jpeg_bytes(image):
+    """ 圖檔路徑、已編碼的位元組或 BGR ndarray → JPEG 位元組 """
+    if isinstance(image, np.ndarray):
+        ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        if not ok:
+            raise ValueError("❌ 無法編碼圖片")
+        return buf.tobytes()
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    with open(image, "rb") as f:
+        return f.read()
+
+
+def infer(model_id, image, confidence, overlap=0.3, api_key=None):
+    """
+    呼叫 Roboflow 推論 API，回傳 JSON 結果；HTTP 錯誤時回傳 None，
+    重試後仍連線失敗或逾時時丟出 requests.RequestException。
+    image 可為圖檔路徑、JPEG 位元組或 ndarray。
+    """
+    with metrics.in_flight("roboflow_in_flight"):
+        response = get_session().post(
+            f"{ROBOFLOW_URL}/{model_id}",
+            params={"api_key": api_key or API_KEY, "confidence": confidence, "overlap": overlap},
+            files={"file": ("image.jpg", to_jpeg_bytes(image), "image/jpeg")},
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        )
+    metrics.count("roboflow_requests", model=model_id, status=response.status_code)
+    if response.status_code != 200:
+        print(f"❌ Roboflow error ({model_id}):", response.text)
+        return None
+    return response.json()
+
+
+def submit(fn, *args, **kwargs):
+    """
+    在網路呼叫專用的執行緒池中執行 fn，回傳 Future；
+    呼叫端可在等待 Roboflow 回應的同時進行本機的解碼與特徵擷取。
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="roboflow")
+    return _executor.submit(metrics.bind(fn), *args, **kwargs)
@@ -0,0 +1,159 @@
+"""
+多卡辨識的背景工作佇列（本機執行緒池，不需要外部 broker）：
+
+    POST /jobs                上傳圖片，回傳工作代號（佇列已滿時回應 429）
+    GET  /jobs/<id>           查詢狀態與進度（?since=n 只回傳第 n 筆之後的進度）
+    GET  /jobs/<id>/stream    以 Server-Sent Events 串流進度與最終結果
+
+工作由 recognize_multi_cards 執行，每張裁切圖完成時記錄一筆進度。
+完成的工作保留 JOB_TTL 秒供查詢。
+"""
+import os
+import time
+import uuid
+import queue
+import threading
+from collections import OrderedDict
+from backend.all_flow import recognize_multi_cards
+from backend import metrics
+
+JOB_WORKERS = int(os.environ.get("YGO_JOB_WORKERS", "2"))
+# 等待中的工作上限（不含執行中的工作），超過時拒絕新工作
+MAX_QUEUED_JOBS = int(os.environ.get("YGO_JOB_QUEUE", "16"))
+JOB_TTL = int(os.environ.get("YGO_JOB_TTL", "600"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, image_data):
+        self.id = uuid.uuid4().hex
+        self.image_data = image_data
+        self.status = "queued"  # queued → running → done / error
+        self.events = []
+        self.result_html = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._cond = threading.Condition()
+
+    def _add_event(self, event):
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def _start(self):
+        with self._cond:
+            self.status = "running"
+            self._cond.notify_all()
+
+    def _finish(self, status, result_html=None, error=None):
+        with self._cond:
+            self.status = status
+            self.result_html = result_html
+            self.error = error
+            self.finished = time.time()
+            self.image_data = None
+            self._cond.notify_all()
+
+    @property
+    def done(self):
+        return self.status in ("done", "error")
+
+    def snapshot(self, since=0):
+        with self._cond:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "events": self.events[since:],
+                "next": len(self.events),
+                "result_html": self.result_html,
+                "error": self.error,
+            }
+
+    def wait(self, since, timeout):
+        """ 等到有第 since 筆之後的進度或工作結束（最多 timeout 秒），回傳 snapshot(since) """
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.events) > since or self.done, timeout)
+        return self.snapshot(since)
+
+
+_queue = queue.Queue(maxsize=MAX_QUEUED_JOBS)
+_jobs = OrderedDict()  # job_id → Job
+_lock = threading.Lock()
+_workers = []
+
+
+def _run(job):
+    job._start()
+    metrics.observe("job_queue_seconds", time.time() - job.created, metrics.TIME_BUCKETS)
+    try:
+        with metrics.in_flight("jobs_running"), metrics.stage("job"):
+            result_html = recognize_multi_cards(job.image_data, on_progress=job._add_event)
+        job._finish("done", result_html=result_html)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        job._finish("error", error=f"處理錯誤：{str(e)}")
+    metrics.count("jobs", status=job.status)
+
+
+def _worker():
+    while True:
+        job = _queue.get()
+        try:
+            _run(job)
+        finally:
+            _queue.task_done()
+
+
+def _start_workers():
+    with _lock:
+        while len(_workers) < JOB_WORKERS:
+            t = threading.Thread(target=_worker, name=f"job-worker-{len(_workers)}", daemon=True)
+            t.start()
+            _workers.append(t)
+
+
+def _expire_locked(now):
+    for job_id in [j.id for j in _jobs.values() if j.done and now - j.finished > JOB_TTL]:
+        del _jobs[job_id]
+
+
+def submit(image_data):
+    """ 加入一個多卡辨識工作並回傳 Job；等待中的工作已達上限時丟出 QueueFull """
+    _start_workers()
+    job = Job(image_data)
+    with _lock:
+        _expire_locked(time.time())
+        _jobs[job.id] = job
+        try:
+            _queue.put_nowait(job)
+        except queue.Full:
+            del _jobs[job.id]
+            metrics.count("jobs", status="rejected")
+            raise QueueFull(f"❌ 目前排隊的工作已達上限（{MAX_QUEUED_JOBS}），請稍後再試")
+    return job
+
+
+def get(job_id):
+    """ 取得工作；不存在或已超過保留期限時回傳 None """
+    with _lock:
+        _expire_locked(time.time())
+        return _jobs.get(job_id)
+
+
+def stats():
+    """ 工作佇列的狀態（/cache_stats 使用） """
+    with _lock:
+        statuses = [j.status for j in _jobs.values()]
+    return {
+        "workers": JOB_WORKERS,
+        "queued": _queue.qsize(),
+        "max_queued": MAX_QUEUED_JOBS,
+        "running": statuses.count("running"),
+        "done": statuses.count("done"),
+        "error": statuses.count("error"),
+    }
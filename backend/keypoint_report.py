@@ -0,0 +1,126 @@
+"""
+比較不同關鍵點預算對索引大小、查詢延遲與準確率的影響：
+
+    python -m backend.keypoint_report all --heldout data/heldout/all \\
+        --gallery-budgets 0,1000,500 --query-budgets 0,1000 --grid 0,4 --root-sift 0,1
+
+每組圖庫設定會重新擷取圖庫特徵並以目前的索引設定（{category}.index.json）建立索引，
+第一組設定為比較基準。結果以表格列印，並可用 --output 另存 JSON。
+"""
+import os
+import time
+import json
+import argparse
+from types import SimpleNamespace
+import numpy as np
+import faiss
+from backend.image_processing import GALLERY_DIR
+from backend.columnar_store import KEYPOINT_DTYPE
+from backend.feature_extractor import extract_paths
+from backend.index_registry import create_index, apply_search_params, load_index_config
+from backend.index_builder import evaluate, card_id_of
+
+
+def _gallery_features(category, max_keypoints, grid, use_root_sift):
+    gallery_path = os.path.join(GALLERY_DIR, category)
+    fnames = sorted(os.listdir(gallery_path))
+    paths = [os.path.join(gallery_path, f) for f in fnames]
+    results = extract_paths(paths, desc=f"擷取圖庫特徵 (預算 {max_keypoints or '不限'})",
+                            max_keypoints=max_keypoints, grid=grid, use_root_sift=use_root_sift)
+    names, attrs_list, descs = [], [], []
+    for fname, (attrs, des) in zip(fnames, results):
+        if des is not None and len(des):
+            names.append(fname)
+            attrs_list.append(attrs)
+            descs.append(des)
+    counts = [len(d) for d in descs]
+    keypoints = np.ascontiguousarray(
+        np.concatenate([np.asarray(a, dtype="<f4").reshape(-1, 4) for a in attrs_list])
+    ).view(KEYPOINT_DTYPE).reshape(-1)
+    gallery = SimpleNamespace(
+        names=names,
+        image_ids=np.repeat(np.arange(len(names), dtype=np.int32), counts),
+        keypoints=keypoints,
+    )
+    return gallery, np.vstack(descs).astype("float32")
+
+
+def _query_features(heldout_dir, max_keypoints, grid, use_root_sift):
+    fnames = sorted(
+        f for f in os.listdir(heldout_dir)
+        if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+    )
+    paths = [os.path.join(heldout_dir, f) for f in fnames]
+    results = extract_paths(paths, desc="擷取保留集特徵",
+                            max_keypoints=max_keypoints, grid=grid, use_root_sift=use_root_sift)
+    return [
+        (card_id_of(fname), np.asarray(attrs, dtype=np.float32).reshape(-1, 4)[:, :2].copy(),
+         des.astype("float32"))
+        for fname, (attrs, des) in zip(fnames, results)
+        if des is not None and len(des)
+    ]
+
+
+def run_report(category, heldout_dir, gallery_budgets, query_budgets, grids, root_sift_options):
+    config = load_index_config(category)
+    rows = []
+    for use_root_sift in root_sift_options:
+        for grid in grids:
+            queries = {qb: _query_features(heldout_dir, qb, grid, use_root_sift) for qb in query_budgets}
+            for gallery_budget in gallery_budgets:
+                gallery, vectors = _gallery_features(category, gallery_budget, grid, use_root_sift)
+                t0 = time.perf_counter()
+                index = create_index(config["factory"], vectors, None, config.get("max_train"))
+                build_s = time.perf_counter() - t0
+                apply_search_params(index, config.get("params", {}))
+                index_bytes = int(faiss.serialize_index(index).nbytes)
+                for query_budget in query_budgets:
+                    result = evaluate(index, gallery, queries[query_budget])
+                    rows.append({
+                        "root_sift": bool(use_root_sift), "grid": grid,
+                        "gallery_budget": gallery_budget, "query_budget": query_budget,
+                        "descriptors": int(len(vectors)), "index_bytes": index_bytes,
+                        "build_s": round(build_s, 2),
+                        "avg_query_kp": float(np.mean([len(q[2]) for q in queries[query_budget]])),
+                        **result,
+                    })
+                del index
+
+    base = rows[0]
+    for row in rows:
+        row["index_saving"] = 1 - row["index_bytes"] / base["index_bytes"]
+        row["latency_saving"] = 1 - row["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 0.0
+        row["accuracy_delta"] = row["accuracy"] - base["accuracy"]
+    return rows
+
+
+def print_report(rows):
+    print("RootSIFT  格  圖庫預算  查詢預算  描述子數    索引MB  省空間   p50ms  省延遲  top-1   Δtop-1")
+    for r in rows:
+        print(f"{'是' if r['root_sift'] else '否':>8}  {r['grid']:>2}  {r['gallery_budget'] or '不限':>8}"
+              f"  {r['query_budget'] or '不限':>8}  {r['descriptors']:>8}  {r['index_bytes'] / 1e6:>8.1f}"
+              f"  {r['index_saving']:>6.1%}  {r['p50_ms']:>6.2f}  {r['latency_saving']:>6.1%}"
+              f"  {r['accuracy']:.3f}  {r['accuracy_delta']:+.3f}")
+
+
+def _parse_ints(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="關鍵點預算報告")
+    parser.add_argument("category")
+    parser.add_argument("--heldout", required=True, help="保留集裁切圖目錄")
+    parser.add_argument("--gallery-budgets", type=_parse_ints, default=[0, 2000, 1000, 500])
+    parser.add_argument("--query-budgets", type=_parse_ints, default=[0, 1000])
+    parser.add_argument("--grid", type=_parse_ints, default=[0])
+    parser.add_argument("--root-sift", type=_parse_ints, default=[0])
+    parser.add_argument("--output", default=None, help="將結果另存為 JSON")
+    args = parser.parse_args()
+
+    rows = run_report(args.category, args.heldout, args.gallery_budgets, args.query_budgets,
+                      args.grid, args.root_sift)
+    print_report(rows)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,323 @@
+"""
+本機卡框顏色分類（取代大部分的 Roboflow 分類呼叫）：
+
+    python -m backend.local_classifier train --holdout 0.1
+    python -m backend.local_classifier compare data/heldout/labeled --output compare.json
+
+卡框顏色（通常 / 效果 / 融合 / 同步 / 超量 / 連結 / 魔法 / 陷阱…）只需要卡片外框的顏色就能判斷：
+取卡圖上緣、左右與下緣的外框區域，把像素量化成 HSV 色彩直方圖（有彩度的像素依色相 x 飽和度，
+接近黑 / 白 / 灰的像素色相不可靠，只依明度分組），
+以 data/gallery/{category} 的卡圖為訓練資料做加權 k-NN。模型存在 data/cache/local_classifier.npz。
+
+classify() 回傳 (類別, 信心)；matcher 在信心低於 LOCAL_CLASSIFY_MIN_CONFIDENCE 或沒有模型時
+才呼叫 Roboflow。compare 以標註好的資料夾（{目錄}/{類別}/*.jpg）比較本機與 Roboflow 的準確率與延遲。
+以合成資料重現的比較：python -m benchmarks.classify（結果見 benchmarks/results/local_classifier.json）。
+"""
+import os
+import time
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from backend import metrics
+from backend.image_processing import CACHE_DIR, GALLERY_DIR
+from backend.local_detector import detect as detect_cards, is_confident, rectify
+from backend.prescale import downscale
+
+LOCAL_CLASSIFY = os.environ.get("YGO_LOCAL_CLASSIFY", "1") == "1"
+# 信心低於此值時改用 Roboflow 分類
+LOCAL_CLASSIFY_MIN_CONFIDENCE = float(os.environ.get("YGO_LOCAL_CLASSIFY_CONF", "0.8"))
+# 單卡照片先縮到此長邊再找卡片外框（只需要外框顏色，不需要精確的角點）
+PHOTO_DETECT_SIDE = int(os.environ.get("YGO_LOCAL_CLASSIFY_DETECT_SIDE", "160"))
+MODEL_PATH = os.path.join(CACHE_DIR, "local_classifier.npz")
+# 不參與訓練的圖庫目錄（all 為所有類別的聯集）
+EXCLUDED_CATEGORIES = {"all"}
+
+K_NEIGHBORS = 7
+FEATURE_SIZE = (84, 123)  # 擷取特徵前把卡片縮到此大小（寬, 高），約為卡圖的 1/5
+H_BINS, S_BINS, V_BINS = 18, 3, 6
+# 飽和度或明度低於此值的像素視為無彩色（超量的黑框、同步的白框）
+MIN_SATURATION, MIN_VALUE = 48, 40
+# 外框區域（以卡片寬高的比例表示）：上緣含卡名列，左右兩側，下緣
+TOP_BAND, SIDE_BAND, BOTTOM_BAND = 0.15, 0.08, 0.06
+
+_model = None
+_model_mtime = None
+_model_lock = threading.Lock()
+
+
+def _border_mask(size=FEATURE_SIZE):
+    width, height = size
+    mask = np.zeros((height, width), np.uint8)
+    mask[:int(height * TOP_BAND)] = 255
+    mask[int(height * (1 - BOTTOM_BAND)):] = 255
+    mask[:, :int(width * SIDE_BAND)] = 255
+    mask[:, int(width * (1 - SIDE_BAND)):] = 255
+    return mask
+
+
+_MASK = _border_mask() > 0
+
+
+def border_features(card):
+    """ 直立的卡片圖 → 外框顏色特徵（L1 正規化後開根號，歐氏距離近似 Bhattacharyya 距離） """
+    small = cv2.resize(card, FEATURE_SIZE, interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)[_MASK].astype(np.int32)
+    h, s, v = hsv[:, 0], hsv[:, 1], hsv[:, 2]
+    chromatic = (s >= MIN_SATURATION) & (v >= MIN_VALUE)
+    hue_bin = np.minimum(h * H_BINS // 180, H_BINS - 1)
+    sat_bin = np.minimum((s - MIN_SATURATION) * S_BINS // (256 - MIN_SATURATION), S_BINS - 1)
+    value_bin = np.minimum(v * V_BINS // 256, V_BINS - 1)
+    bins = np.where(chromatic, hue_bin * S_BINS + sat_bin, H_BINS * S_BINS + value_bin)
+    hist = np.bincount(bins, minlength=H_BINS * S_BINS + V_BINS).astype(np.float32)
+    return np.sqrt(hist / max(hist.sum(), 1.0))
+
+
+# ---------- 模型 ----------
+
+def _gallery_categories(gallery_dir):
+    return sorted(
+        d for d in os.listdir(gallery_dir)
+        if os.path.isdir(os.path.join(gallery_dir, d)) and d not in EXCLUDED_CATEGORIES
+    )
+
+
+def _read_card(path):
+    # 卡圖約 421x614，縮小解碼已足夠計算顏色直方圖
+    img = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_4)
+    return img if img is not None else cv2.imread(path)
+
+
+def _extract(paths, workers=None):
+    def one(path):
+        img = _read_card(path)
+        return None if img is None else border_features(img)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        return list(pool.map(one, paths))
+
+
+def labeled_images(root, categories=None, per_category=None, seed=0):
+    """ {root}/{類別}/*.jpg → [(路徑, 類別), ...]；per_category 限制每個類別抽樣的張數 """
+    rng = np.random.default_rng(seed)
+    items = []
+    for category in categories or _gallery_categories(root):
+        folder = os.path.join(root, category)
+        files = sorted(
+            f for f in os.listdir(folder) if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+        )
+        if per_category and len(files) > per_category:
+            files = [files[i] for i in sorted(rng.choice(len(files), per_category, replace=False))]
+        items.extend((os.path.join(folder, f), category) for f in files)
+    return items
+
+
+def train(gallery_dir=GALLERY_DIR, per_category=None, holdout=0.0, seed=0, model_path=MODEL_PATH):
+    """
+    以 data/gallery/{category} 的卡圖訓練並寫入模型；holdout > 0 時保留該比例不參與訓練，
+    回傳保留集的準確率（沒有保留集時為 None）
+    """
+    categories = _gallery_categories(gallery_dir)
+    if not categories:
+        raise FileNotFoundError(f"❌ 找不到任何類別目錄：{gallery_dir}")
+    items = labeled_images(gallery_dir, categories, per_category, seed)
+    print(f"🔨 擷取外框特徵：{len(items)} 張，{len(categories)} 個類別")
+    features = _extract([path for path, _ in items])
+    keep = [i for i, f in enumerate(features) if f is not None]
+    X = np.stack([features[i] for i in keep])
+    y = np.array([categories.index(items[i][1]) for i in keep], dtype=np.int32)
+
+    rng = np.random.default_rng(seed)
+    test = rng.random(len(y)) < holdout
+    accuracy = None
+    if test.any():
+        model = {"features": X[~test], "labels": y[~test], "categories": np.array(categories)}
+        predicted = [_knn(model, x)[0] for x in X[test]]
+        accuracy = float(np.mean([p == categories[t] for p, t in zip(predicted, y[test])]))
+        print(f"📊 保留集準確率：{accuracy:.3f}（{int(test.sum())} 張）")
+
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    tmp = model_path + ".tmp.npz"
+    np.savez(tmp, features=X[~test], labels=y[~test], categories=np.array(categories))
+    os.replace(tmp, model_path)
+    print(f"✅ 模型已寫入：{model_path}")
+    return accuracy
+
+
+def load_model(model_path=MODEL_PATH):
+    """ 讀取模型（檔案更新時重新載入）；沒有模型時回傳 None """
+    global _model, _model_mtime
+    try:
+        mtime = os.stat(model_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _model_lock:
+        if _model is None or _model_mtime != mtime:
+            with np.load(model_path) as data:
+                _model = {k: data[k] for k in ("features", "labels", "categories")}
+            _model_mtime = mtime
+        return _model
+
+
+def _shares(model, x, k=K_NEIGHBORS):
+    """ 加權 k-NN：各類別的權重占比（總和為 1） """
+    d = np.sum((model["features"] - x) ** 2, axis=1)
+    k = min(k, len(d))
+    nearest = np.argpartition(d, k - 1)[:k]
+    weights = 1.0 / (np.sqrt(d[nearest]) + 1e-3)
+    votes = np.bincount(model["labels"][nearest], weights=weights, minlength=len(model["categories"]))
+    return votes / votes.sum()
+
+
+def _knn(model, x, k=K_NEIGHBORS):
+    """ 加權 k-NN：回傳 (類別, 信心)，信心為最高類別的權重占比 """
+    shares = _shares(model, x, k)
+    best = int(np.argmax(shares))
+    return str(model["categories"][best]), float(shares[best])
+
+
+def rank(card, top_k=3):
+    """ 直立的卡片圖 → 前 top_k 名 [(類別, 信心), ...]（信心由高到低，不含信心為 0 者）；沒有模型時回傳 None """
+    model = load_model()
+    if model is None:
+        return None
+    with metrics.stage("local_classify"):
+        shares = _shares(model, border_features(card))
+    order = np.argsort(-shares, kind="stable")[:top_k]
+    return [(str(model["categories"][i]), float(shares[i])) for i in order if shares[i] > 0]
+
+
+def classify(card):
+    """ 直立的卡片圖 → (類別, 信心)；沒有模型時回傳 None """
+    ranked = rank(card, 1)
+    return ranked[0] if ranked else None
+
+
+def rank_card(card, top_k=3):
+    """
+    已經是整張卡片的圖（例如自行選擇模式的裁切圖）→ 前 top_k 名 [(類別, 信心), ...]，
+    不再做卡片偵測；停用或沒有模型時回傳 None
+    """
+    if not LOCAL_CLASSIFY:
+        return None
+    ranked = rank(card, top_k)
+    if not ranked:
+        return None
+    metrics.count("local_classify",
+                  result="accepted" if ranked[0][1] >= LOCAL_CLASSIFY_MIN_CONFIDENCE else "fallback")
+    return ranked
+
+
+def rank_photo(img, top_k=3):
+    """
+    上傳的單卡照片 → 前 top_k 名 [(類別, 信心), ...]。在長邊 PHOTO_DETECT_SIDE 的縮圖上找到卡片，
+    直接透視校正成特徵大小，只取外框；找不到卡片時回傳 None
+    （整張照片的外圍多半是背景，分類不可靠，交給 Roboflow）
+    """
+    if not LOCAL_CLASSIFY or load_model() is None:
+        return None
+    small, _ = downscale(img, max_side=PHOTO_DETECT_SIDE, interpolation=cv2.INTER_LINEAR)
+    predictions = detect_cards(small)
+    if not is_confident(predictions):
+        metrics.count("local_classify", result="no_card")
+        return None
+    largest = max(predictions["predictions"], key=lambda p: p["width"] * p["height"])
+    return rank_card(rectify(small, largest["corners"], FEATURE_SIZE), top_k)
+
+
+def classify_photo(img):
+    """ 上傳的單卡照片 → (類別, 信心)；找不到卡片或沒有模型時回傳 None """
+    ranked = rank_photo(img, 1)
+    return ranked[0] if ranked else None
+
+
+# ---------- 與 Roboflow 比較 ----------
+
+def _latency(values):
+    return {
+        "p50_ms": float(np.percentile(values, 50)) if values else None,
+        "p95_ms": float(np.percentile(values, 95)) if values else None,
+    }
+
+
+def compare(labeled_dir, per_category=None, remote=True, threshold=LOCAL_CLASSIFY_MIN_CONFIDENCE):
+    """
+    以標註資料夾比較本機分類與 Roboflow：各自的準確率與延遲、兩者一致率，
+    以及混合策略（本機信心 >= threshold 時採用本機，否則呼叫 Roboflow）的準確率與呼叫比例
+    """
+    from backend.classified_api import get_card_class
+
+    items = labeled_images(labeled_dir, per_category=per_category)
+    rows = []
+    for path, label in items:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        start = time.perf_counter()
+        local = classify_photo(img) or (None, 0.0)
+        local_ms = (time.perf_counter() - start) * 1000
+        row = {"path": path, "label": label, "local": local[0], "confidence": local[1], "local_ms": local_ms}
+        if remote:
+            start = time.perf_counter()
+            row["remote"] = get_card_class(path)
+            row["remote_ms"] = (time.perf_counter() - start) * 1000
+        rows.append(row)
+
+    if not rows:
+        raise FileNotFoundError(f"❌ 找不到標註圖片：{labeled_dir}")
+    confident = [r for r in rows if r["confidence"] >= threshold]
+    report = {
+        "images": len(rows),
+        "threshold": threshold,
+        "local": {
+            "accuracy": float(np.mean([r["local"] == r["label"] for r in rows])),
+            "confident_share": len(confident) / len(rows),
+            "confident_accuracy": float(np.mean([r["local"] == r["label"] for r in confident])) if confident else None,
+            **_latency([r["local_ms"] for r in rows]),
+        },
+    }
+    if remote:
+        hybrid = [r["local"] if r["confidence"] >= threshold else r["remote"] for r in rows]
+        report["remote"] = {
+            "accuracy": float(np.mean([r["remote"] == r["label"] for r in rows])),
+            **_latency([r["remote_ms"] for r in rows]),
+        }
+        report["agreement"] = float(np.mean([r["local"] == r["remote"] for r in rows]))
+        report["hybrid"] = {
+            "accuracy": float(np.mean([h == r["label"] for h, r in zip(hybrid, rows)])),
+            "remote_calls": 1 - len(confident) / len(rows),
+        }
+    categories = sorted({r["label"] for r in rows})
+    report["per_category"] = {
+        c: float(np.mean([r["local"] == c for r in rows if r["label"] == c])) for c in categories
+    }
+    return report, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本機卡框顏色分類：訓練與 Roboflow 比較")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    tr = sub.add_parser("train", help="以 data/gallery/{category} 訓練並寫入模型")
+    tr.add_argument("--gallery", default=GALLERY_DIR)
+    tr.add_argument("--per-category", type=int, default=None, help="每個類別最多使用的張數")
+    tr.add_argument("--holdout", type=float, default=0.0, help="保留不訓練、用來評估的比例")
+    tr.add_argument("--seed", type=int, default=0)
+
+    cmp_ = sub.add_parser("compare", help="以標註資料夾（{目錄}/{類別}/*.jpg）比較本機與 Roboflow")
+    cmp_.add_argument("labeled_dir")
+    cmp_.add_argument("--per-category", type=int, default=None)
+    cmp_.add_argument("--threshold", type=float, default=LOCAL_CLASSIFY_MIN_CONFIDENCE)
+    cmp_.add_argument("--no-remote", action="store_true", help="只評估本機分類（不呼叫 Roboflow）")
+    cmp_.add_argument("--output", default=None, help="將逐張結果與摘要另存為 JSON")
+
+    args = parser.parse_args()
+    if args.command == "train":
+        train(args.gallery, args.per_category, args.holdout, args.seed)
+    else:
+        report, rows = compare(args.labeled_dir, args.per_category, not args.no_remote, args.threshold)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"summary": report, "rows": rows}, f, ensure_ascii=False, indent=2)
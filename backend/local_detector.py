@@ -0,0 +1,187 @@
+"""
+本機卡片偵測（只用 OpenCV，不經網路）：適用於卡片放在素色桌面或卡冊內頁的常見情況。
+
+    predictions = detect(img)
+    predictions["confidence"] >= LOCAL_DETECT_MIN_CONFIDENCE → 直接使用，否則改用 Roboflow
+
+流程：縮小 → 邊緣偵測 → 輪廓 → 四邊形擬合（approxPolyDP，失敗時用最小外接矩形），
+以「輪廓面積 / 四邊形面積」與「長寬比接近卡片」計分，去除重疊與內層的框；
+同一張照片中的卡片大小相近，大小差異懸殊的結果（多半是卡圖內的方框）會降低整體信心。
+回傳與 Roboflow 相同的 predictions 格式（x, y, width, height 為四邊形的外接矩形），
+另外附上四個角點 corners（左上、右上、右下、左下），rectify() 依角點把卡片拉正成圖庫解析度。
+"""
+import os
+import cv2
+import numpy as np
+from backend import metrics
+from backend.prescale import downscale
+
+# 本機偵測結果的整體信心低於此值時改用 Roboflow
+LOCAL_DETECT_MIN_CONFIDENCE = float(os.environ.get("YGO_LOCAL_DETECT_CONF", "0.6"))
+# 偵測用縮圖的長邊（輪廓偵測不需要高解析度）
+LOCAL_DETECT_MAX_SIDE = int(os.environ.get("YGO_LOCAL_DETECT_MAX_SIDE", "1024"))
+# 圖庫卡圖解析度（寬, 高）；rectify 輸出此大小
+CARD_SIZE = (421, 614)
+CARD_ASPECT = CARD_SIZE[0] / CARD_SIZE[1]  # 短邊 / 長邊（實體卡 59 x 86 mm）
+
+MIN_AREA_RATIO = 0.01    # 卡片面積下限（相對整張圖）
+MAX_AREA_RATIO = 0.95    # 超過時視為整張照片的邊框
+ASPECT_TOLERANCE = 0.35  # 長寬比的相對誤差容許值（透視變形會改變長寬比）
+MIN_CARD_SCORE = 0.5     # 單一候選框的最低分數
+NMS_IOU = 0.5
+
+
+def order_corners(pts):
+    """ 四個點 → 左上、右上、右下、左下（以質心角度排序） """
+    pts = np.asarray(pts, dtype=np.float32).reshape(4, 2)
+    center = pts.mean(axis=0)
+    angles = np.arctan2(pts[:, 1] - center[1], pts[:, 0] - center[0])
+    pts = pts[np.argsort(angles)]  # 由左上開始順時針（影像座標 y 向下）
+    start = np.argmin(pts.sum(axis=1))
+    return np.roll(pts, -start, axis=0)
+
+
+def _side_lengths(quad):
+    return np.linalg.norm(quad - np.roll(quad, -1, axis=0), axis=1)
+
+
+def _score(contour, quad):
+    """ 四邊形像一張卡片的程度（0~1）：填滿程度 × 長寬比 """
+    quad_area = cv2.contourArea(quad)
+    if quad_area <= 0:
+        return 0.0
+    fill = min(cv2.contourArea(contour) / quad_area, 1.0)
+    sides = _side_lengths(quad)
+    a, b = (sides[0] + sides[2]) / 2, (sides[1] + sides[3]) / 2
+    aspect = min(a, b) / max(a, b)
+    aspect_score = max(0.0, 1.0 - abs(aspect - CARD_ASPECT) / CARD_ASPECT / ASPECT_TOLERANCE)
+    return fill * aspect_score
+
+
+def _fit_quad(contour):
+    peri = cv2.arcLength(contour, True)
+    approx = cv2.approxPolyDP(contour, 0.02 * peri, True)
+    if len(approx) == 4 and cv2.isContourConvex(approx):
+        return order_corners(approx)
+    return order_corners(cv2.boxPoints(cv2.minAreaRect(contour)))
+
+
+def _edges(gray):
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    median = float(np.median(blurred))
+    edges = cv2.Canny(blurred, int(max(0, 0.66 * median)), int(min(255, 1.33 * median)))
+    # 補上卡片邊緣的小缺口（反光、牌套邊）
+    return cv2.dilate(edges, np.ones((3, 3), np.uint8), iterations=2)
+
+
+def _bbox(quad):
+    x1, y1 = quad.min(axis=0)
+    x2, y2 = quad.max(axis=0)
+    return x1, y1, x2, y2
+
+
+def _iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _contains(outer, inner, margin=2.0):
+    return (outer[0] - margin <= inner[0] and outer[1] - margin <= inner[1]
+            and inner[2] <= outer[2] + margin and inner[3] <= outer[3] + margin)
+
+
+def _candidates(img):
+    """ 縮圖座標的候選框 [(分數, 四邊形), ...] """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    area = gray.shape[0] * gray.shape[1]
+    contours, _ = cv2.findContours(_edges(gray), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+    found = []
+    for contour in contours:
+        contour_area = cv2.contourArea(contour)
+        if not MIN_AREA_RATIO * area <= contour_area <= MAX_AREA_RATIO * area:
+            continue
+        quad = _fit_quad(contour)
+        score = _score(contour, quad)
+        if score >= MIN_CARD_SCORE:
+            found.append((score, quad))
+    return found
+
+
+def _select(found):
+    """ 去除重疊框；包住兩張以上卡片的框（卡冊內頁、整疊卡）捨棄，卡片內層的框（插圖框）捨棄 """
+    boxes = [_bbox(q) for _, q in found]
+    contained = [
+        [j for j in range(len(found)) if j != i and _contains(boxes[i], boxes[j])]
+        for i in range(len(found))
+    ]
+    # 包住兩個以上互不重疊的候選框者為容器
+    containers = {
+        i for i, inner in enumerate(contained)
+        if any(_iou(boxes[a], boxes[b]) < 0.1 for a in inner for b in inner if a < b)
+    }
+    order = sorted(
+        (i for i in range(len(found)) if i not in containers),
+        key=lambda i: (-(boxes[i][2] - boxes[i][0]) * (boxes[i][3] - boxes[i][1]), -found[i][0]),
+    )
+    kept = []
+    for i in order:
+        if any(_iou(boxes[i], boxes[k]) > NMS_IOU or _contains(boxes[k], boxes[i]) for k in kept):
+            continue
+        kept.append(i)
+    return [found[i] for i in kept]
+
+
+def detect(img):
+    """
+    BGR ndarray → {"predictions": [...], "confidence": 整體信心, "source": "local"}。
+    每個偵測框含 x, y, width, height（外接矩形中心與寬高）、confidence 與 corners，
+    座標皆為 img 的座標。整體信心為各框分數的平均乘上大小一致的比例，沒有偵測到卡片時為 0。
+    """
+    with metrics.stage("local_detect"):
+        small, factor = downscale(img, max_side=LOCAL_DETECT_MAX_SIDE)
+        cards = _select(_candidates(small))
+
+    predictions = []
+    for score, quad in cards:
+        quad = quad * factor
+        x1, y1, x2, y2 = _bbox(quad)
+        predictions.append({
+            "x": float((x1 + x2) / 2), "y": float((y1 + y2) / 2),
+            "width": float(x2 - x1), "height": float(y2 - y1),
+            "confidence": round(float(score), 3),
+            "corners": [[round(float(x), 1), round(float(y), 1)] for x, y in quad],
+        })
+    # 由上而下、由左而右排列，與人閱讀卡冊的順序一致
+    row = max((p["height"] for p in predictions), default=1) / 2
+    predictions.sort(key=lambda p: (round(p["y"] / row), p["x"]))
+
+    confidence = 0.0
+    if predictions:
+        areas = np.array([p["width"] * p["height"] for p in predictions])
+        median = np.median(areas)
+        consistent = np.mean((areas >= 0.5 * median) & (areas <= 2.0 * median))
+        confidence = float(np.mean([p["confidence"] for p in predictions]) * consistent)
+    metrics.count("local_detect", result="accepted" if confidence >= LOCAL_DETECT_MIN_CONFIDENCE else "fallback")
+    return {"predictions": predictions, "confidence": confidence, "source": "local"}
+
+
+def is_confident(predictions):
+    """ 本機偵測結果是否可以直接使用（至少一張卡且整體信心達門檻） """
+    return bool(predictions["predictions"]) and predictions["confidence"] >= LOCAL_DETECT_MIN_CONFIDENCE
+
+
+def rectify(img, corners, size=CARD_SIZE):
+    """ 依四個角點把卡片透視校正成直立的 size（寬, 高）圖；橫放的卡片轉成直立 """
+    quad = order_corners(corners)
+    sides = _side_lengths(quad)
+    if (sides[0] + sides[2]) > (sides[1] + sides[3]):
+        # 上下邊較長 → 卡片橫放，改以右上角為起點（順時針轉 90 度）
+        quad = np.roll(quad, -1, axis=0)
+    width, height = size
+    dst = np.float32([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]])
+    M = cv2.getPerspectiveTransform(quad, dst)
+    return cv2.warpPerspective(img, M, (width, height), flags=cv2.INTER_LINEAR)
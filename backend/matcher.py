@@ -1,111 +1,102 @@
-import os
-import numpy as np
-import cv2
-import faiss
-import re
-import html
-from backend.image_processing import load_or_build_cache
-from backend.classified_api import get_card_class
+from backend.category_router import route, combine, ROUTER_TOP_K
+from backend.feature_extractor import detect_and_compute
+from backend.classified_api import get_card_classes
+from backend.local_classifier import rank_card, rank_photo, LOCAL_CLASSIFY_MIN_CONFIDENCE
+from backend.inference_client import submit
+from backend.price_service import record_recognition
+from backend.card_info import lookup as lookup_card
+from backend import metrics
+from backend.result_cache import image_results, image_key, gallery_tags
+from backend.prescale import decode, resize_for_sift, image_size, CARD_HEIGHT, DETECT_MAX_SIDE
 from backend.avg_price import get_average_price, to_fullwidth, convert_jpy_to_twd
 
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-INFO_DIR = os.path.join(BASE_DIR, "data", "cards_info")
-
 def process_image(img_data):
-    # 1. 儲存圖片至暫存檔（分類器需要路徑）
-    upload_dir = os.path.join(BASE_DIR, "uploads")
-    os.makedirs(upload_dir, exist_ok=True)
-    temp_path = os.path.join(upload_dir, "temp.jpg")
-    with open(temp_path, "wb") as f:
-        f.write(img_data)
-        
-    # 2. 執行 Roboflow 分類
-    category = get_card_class(temp_path)
-    if not category:
-        raise ValueError("❌ Roboflow 分類失敗，無法辨識類別")
-
-    # 3. 擷取特徵
-    sift = cv2.SIFT_create()
-    img = cv2.imdecode(np.frombuffer(img_data, np.uint8), cv2.IMREAD_COLOR)
-    if img is None:
-        raise FileNotFoundError("❌ 無法讀取圖像")
+    # 0. 解碼（大圖直接縮小解碼，再縮到圖庫卡圖高度）並查詢辨識結果快取
+    with metrics.stage("decode"):
+        img, _ = decode(img_data, CARD_HEIGHT)
+        if img is None:
+            raise FileNotFoundError("❌ 無法讀取圖像")
+        img = resize_for_sift(img)
+        key = image_key(img, img_data)
+    cached = image_results.get(key)
+    if cached is not None:
+        record_recognition(cached[1])
+        return cached
+
+    # 分類只需要小圖：原檔夠小時直接上傳原始位元組，否則上傳縮小後的 img
+    size = image_size(img_data)
+    upload = img_data if size is not None and max(size) <= DETECT_MAX_SIDE else None
+    categories, kp1, des1 = classify_and_extract(img, upload)
+    return match_and_cache(key, categories, kp1, des1)
+
+def classify_and_extract(img, upload=None, is_card=False):
+    """
+    先以本機卡框顏色分類；信心不足（或沒有模型）時背景執行 Roboflow 分類
+    （upload 為要上傳的縮小版本，未提供時上傳 img），等待回應的同時在本機擷取特徵。
+    is_card 表示 img 已是裁切好的整張卡片，直接分類不再偵測卡片。
+    回傳 (候選類別 [(類別, 信心), ...]（信心由高到低）, kp, des)
+    """
+    local = rank_card(img, ROUTER_TOP_K) if is_card else rank_photo(img, ROUTER_TOP_K)
+    category_future = None
+    if not local or local[0][1] < LOCAL_CLASSIFY_MIN_CONFIDENCE:
+        category_future = submit(get_card_classes, img if upload is None else upload)
 
-    kp1, des1 = sift.detectAndCompute(img, None)
+    kp1, des1 = detect_and_compute(img)
     if des1 is None or len(kp1) == 0:
+        if category_future is not None:
+            category_future.cancel()
         raise ValueError("❌ 找不到特徵點")
-    d = des1.shape[1]
 
-    # 4. 載入快取
-    paths, names, kp_attrs, descs, all_desc = load_or_build_cache(category)
+    if category_future is None:
+        return local, kp1, des1
 
-    # 5. 建立 / 載入索引
-    index_path = os.path.join(os.path.dirname(INFO_DIR), "cache", f"{category}.index")
-    if os.path.exists(index_path):
-        index = faiss.read_index(index_path)
-    else:
-        quantizer = faiss.IndexFlatL2(d)
-        index = faiss.IndexIVFPQ(quantizer, d, 500, 24, 8)
-        index.train(all_desc)
-        index.add(all_desc)
-        faiss.write_index(index, index_path)
-
-    index.nprobe = 1
-
-    # 6. 搜尋比對
-    D, I = index.search(des1.astype('float32'), 2)
-    good_per_img = [[] for _ in descs]
-    boundaries = np.cumsum([len(d) for d in descs])
-    for qi in range(len(des1)):
-        d0, d1 = D[qi]
-        if d0 < 0.9 * d1:
-            tr = int(I[qi, 0])
-            idx = np.searchsorted(boundaries, tr, side='right')
-            start = boundaries[idx - 1] if idx > 0 else 0
-            local = tr - start
-            good_per_img[idx].append(cv2.DMatch(qi, local, d0))
-
-    best_idx = max(range(len(good_per_img)), key=lambda i: len(good_per_img[i]), default=None)
-    if best_idx is None or len(good_per_img[best_idx]) <= 1:
-        return "<p>❌ 沒有找到匹配的卡片</p>"
-
-    matched_name = names[best_idx]
+    # 擷取特徵後仍需等待分類結果的時間（網路延遲未被本機計算遮蔽的部分）
+    with metrics.stage("classify_wait"):
+        remote = category_future.result()
+    if not remote and not local:
+        raise ValueError("❌ Roboflow 分類失敗，無法辨識類別")
+    # 本機分類不確定時與 Roboflow 的結果平均，讓分流搜尋涵蓋兩者的候選
+    return combine(remote, local), kp1, des1
+
+def match_features(categories, kp1, des1):
+    """
+    以已擷取的特徵比對，回傳 ((images_html, text_html), card_name_jp) 或錯誤訊息 HTML。
+    categories 為類別名稱或候選類別 [(類別, 信心), ...]；分類不確定時由 category_router 同時搜尋前幾名類別
+    """
+    return _match_features(categories, kp1, des1)[0]
+
+def match_and_cache(key, categories, kp1, des1):
+    """ 同 match_features，並把成功的結果以 key（result_cache.image_key）寫入 image_results """
+    result, searched = _match_features(categories, kp1, des1)
+    if not isinstance(result, str):
+        image_results.put(key, result, gallery_tags(searched))
+    return result
+
+def _match_features(categories, kp1, des1):
+    """ 同 match_features，另外回傳這次搜尋過的類別 """
+    if isinstance(categories, str):
+        categories = [(categories, 1.0)]
+
+    # 4~7. 載入常駐圖庫與索引、搜尋、投票與幾何驗證（category_router）
+    match = route(categories, kp1, des1)
+    if match is None:
+        return "<p>❌ 沒有找到匹配的卡片</p>", ()
+
+    matched_name = match.gallery.names[match.image_idx]
     card_id = matched_name[:8].zfill(8)
 
-    # 7. 模糊匹配 txt 檔案
-    matches = [
-        fname for fname in os.listdir(INFO_DIR)
-        if fname.startswith(card_id) and fname.lower().endswith(".txt")
-    ]
-
-    if not matches:
-        return f"<p>⚠️ 找到相似卡片 {matched_name}，但缺少對應資訊檔</p>"
-
-    info_file = os.path.join(INFO_DIR, matches[0])
-    print(f"🔍 匹配資訊檔案：{info_file}")
-
-    
-    with open(info_file, encoding="utf-8") as f:
-        lines = f.readlines()
-
-    info = "".join(lines)
-    info = html.escape(info, quote=False).replace("圖片 URL:", "")
-    info = info.replace("\n", " <br>")
-    info = re.sub(r"(https?://[^\s]+)", r'<img src="\1" alt="圖片" />', info)
-    
-    image_html_list = re.findall(r'<img src="[^"]+" alt="圖片" />', info)
-    images_html = "".join(image_html_list)
-    text_html = re.sub(r'<img src="[^"]+" alt="圖片" />', '', info)
-
-    # Get average price using correct Japanese name
-    card_name_jp = ""
-    for line in lines:
-        if line.startswith("日文名:"):
-            card_name_jp = line.replace("日文名:", "").strip()
-            break
-    
-    
-    return (images_html, text_html), card_name_jp
+    # 8. 查詢卡片資訊索引
+    with metrics.stage("info_lookup"):
+        info = lookup_card(card_id)
+    if info is None:
+        return f"<p>⚠️ 找到相似卡片 {matched_name}，但缺少對應資訊檔</p>", match.searched
+    print(f"🔍 匹配資訊檔案：{info.path}")
+
+    images_html, text_html, card_name_jp = info.images_html, info.text_html, info.card_name_jp
+    record_recognition(card_name_jp)
+
+    return ((images_html, text_html), card_name_jp), match.searched
 
 def get_price_html(card_name_jp):
     fullwidth_name = to_fullwidth(card_name_jp)
@@ -120,12 +111,3 @@ def get_price_html(card_name_jp):
             return f"<br><b>平均價格:</b> {average_price} 円 (TWD轉換失敗)"
     else:
         return "<br><b>平均價格:</b> 價格未找到"
-
-#choice
-def process_image_file(image_path):
-    """
-    給定圖像路徑（例如 crop_0.jpg），直接辨識。
-    """
-    with open(image_path, "rb") as f:
-        img_data = f.read()
-    return process_image(img_data)
\ No newline at end of file
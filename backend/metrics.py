@@ -0,0 +1,297 @@
+"""
+輕量的行程內遙測：各階段耗時直方圖、計數器與進行中數量，以 Prometheus 文字格式輸出。
+
+    with metrics.stage("sift"):            # ygo_stage_seconds{stage="sift"}
+        kp, des = detect_and_compute(img)
+    metrics.count("result_cache", cache="image", result="hit")   # ygo_result_cache_total
+    metrics.observe("keypoints", len(kp), kind="query")           # ygo_keypoints
+    with metrics.in_flight("roboflow_in_flight"):                 # ygo_roboflow_in_flight（gauge）
+
+- GET /metrics 回傳所有指標（init_app 同時記錄每個路由的延遲與進行中的請求數）
+- YGO_SERVER_TIMING=1 時，回應加上 Server-Timing 標頭列出本次請求各階段的耗時
+- YGO_METRICS=0 時所有函式直接返回（stage / in_flight 回傳共用的空 context manager）
+
+在 inference_client / feature_extractor 的執行緒池中執行的階段，會透過 bind()
+記入送出工作的請求。
+"""
+import os
+import time
+import bisect
+import threading
+import contextvars
+from collections import defaultdict
+
+METRICS_ENABLED = os.environ.get("YGO_METRICS", "1") == "1"
+SERVER_TIMING = METRICS_ENABLED and os.environ.get("YGO_SERVER_TIMING", "0") == "1"
+
+# 秒數用的直方圖區間（SIFT / FAISS 約數十 ms，Roboflow / Selenium 可能數秒）
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 數量用的直方圖區間（每次請求的裁切圖數、每張圖的特徵點數、分流搜尋的類別數）
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+PREFIX = "ygo_"
+HELP = {
+    "stage_seconds": "Time spent in each pipeline stage",
+    "request_seconds": "HTTP request latency by route",
+    "requests_in_flight": "HTTP requests currently being handled",
+    "crops": "Cards cropped per multi-card request",
+    "keypoints": "SIFT keypoints per image",
+    "result_cache_total": "Recognition result cache lookups",
+    "index_cache_total": "Resident FAISS index lookups",
+    "price_cache_total": "Price cache lookups",
+    "roboflow_requests_total": "Roboflow inference calls",
+    "roboflow_in_flight": "Roboflow inference calls in progress",
+    "price_fetch_in_flight": "Selenium price lookups in progress",
+    "stage_errors_total": "Pipeline stages that raised an exception",
+    "local_detect_total": "Local card detections used directly or handed to Roboflow",
+    "local_classify_total": "Local frame classifications used directly or handed to Roboflow",
+    "router_total": "Category router searches by outcome (single, decisive, merged)",
+    "router_shards": "Category indexes searched per routed query",
+    "jobs_total": "Multi-card background jobs by final status",
+    "jobs_running": "Multi-card background jobs being processed",
+    "job_queue_seconds": "Time multi-card jobs waited in the queue",
+}
+
+_lock = threading.Lock()
+_counters = defaultdict(float)   # (名稱, labels) → 累計值
+_gauges = defaultdict(float)     # (名稱, labels) → 目前值
+_histograms = {}                 # (名稱, labels) → _Histogram
+# 目前請求的階段耗時清單（Server-Timing 使用）；不在請求中時為 None
+_request_timings = contextvars.ContextVar("ygo_request_timings", default=None)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullContext()
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def count(name, amount=1, **labels):
+    """ 計數器 ygo_{name}_total 加上 amount """
+    if not METRICS_ENABLED:
+        return
+    key = (f"{name}_total", _labels(labels))
+    with _lock:
+        _counters[key] += amount
+
+
+def observe(name, value, buckets=SIZE_BUCKETS, **labels):
+    """ 在直方圖 ygo_{name} 記錄一筆數值 """
+    if not METRICS_ENABLED:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = _Histogram(buckets)
+        hist.observe(value)
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        observe("stage_seconds", elapsed, TIME_BUCKETS, stage=self.name)
+        if exc_type is not None:
+            count("stage_errors", stage=self.name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+def stage(name):
+    """ 計時 context manager：耗時記入 ygo_stage_seconds{stage=name} 與本次請求的 Server-Timing """
+    return _Stage(name) if METRICS_ENABLED else _NULL
+
+
+def timed(name):
+    """ 以 stage(name) 包裝整個函式的裝飾器 """
+    def decorator(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        def wrapper(*args, **kwargs):
+            with _Stage(name):
+                return fn(*args, **kwargs)
+        wrapper.__name__, wrapper.__doc__, wrapper.__wrapped__ = fn.__name__, fn.__doc__, fn
+        return wrapper
+    return decorator
+
+
+class _InFlight:
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        with _lock:
+            _gauges[self.key] += 1
+        return self
+
+    def __exit__(self, *exc):
+        with _lock:
+            _gauges[self.key] -= 1
+        return False
+
+
+def in_flight(name, **labels):
+    """ 進行中數量 gauge ygo_{name}：進入時 +1，離開時 -1 """
+    if not METRICS_ENABLED:
+        return _NULL
+    return _InFlight((name, _labels(labels)))
+
+
+def bind(fn):
+    """
+    把 fn 綁定到目前請求的 context，送進執行緒池後各階段的耗時仍記入同一個請求。
+    沒有進行中的請求（或停用遙測）時原樣回傳 fn。
+    回傳的函式可同時在多個執行緒中執行（每次呼叫在執行緒自己的 context 中設定耗時清單）。
+    """
+    timings = _request_timings.get() if SERVER_TIMING else None
+    if timings is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        token = _request_timings.set(timings)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _request_timings.reset(token)
+    return bound
+
+
+# ---------- 輸出 ----------
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def _header(lines, name, kind):
+    lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+    lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+
+def render():
+    """ 所有指標的 Prometheus 文字格式（text/plain; version=0.0.4） """
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted(
+            (key, (h.buckets, list(h.counts), h.total, h.count)) for key, h in _histograms.items()
+        )
+
+    lines, seen = [], set()
+    for kind, items in (("counter", counters), ("gauge", gauges)):
+        for (name, labels), value in items:
+            if name not in seen:
+                seen.add(name)
+                _header(lines, name, kind)
+            lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value:g}")
+
+    for (name, labels), (buckets, counts, total, n) in histograms:
+        if name not in seen:
+            seen.add(name)
+            _header(lines, name, "histogram")
+        cumulative = 0
+        for bound, c in zip(buckets, counts):
+            cumulative += c
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+        lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {n}")
+        lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {total:g}")
+        lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {n}")
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(timings):
+    """ [(階段, 秒), ...] → Server-Timing 標頭（同一階段的耗時加總，dur 單位為毫秒） """
+    totals, counts = {}, defaultdict(int)
+    for name, elapsed in timings:
+        totals[name] = totals.get(name, 0.0) + elapsed
+        counts[name] += 1
+    return ", ".join(
+        f'{name};dur={total * 1000:.1f}' + (f';desc="x{counts[name]}"' if counts[name] > 1 else "")
+        for name, total in totals.items()
+    )
+
+
+def init_app(app):
+    """ 註冊 GET /metrics，並記錄每個路由的延遲、進行中的請求數與 Server-Timing 標頭 """
+    from flask import Response, request, g
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        return Response(render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _start_request():
+        g.ygo_start = time.perf_counter()
+        g.ygo_in_flight = in_flight("requests_in_flight")
+        g.ygo_in_flight.__enter__()
+        if SERVER_TIMING:
+            _request_timings.set([])
+
+    @app.after_request
+    def _finish_request(response):
+        start = g.pop("ygo_start", None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        observe("request_seconds", elapsed, TIME_BUCKETS,
+                route=route, method=request.method, status=response.status_code)
+        if SERVER_TIMING:
+            timings = _request_timings.get() or []
+            header = server_timing(timings + [("total", elapsed)])
+            response.headers["Server-Timing"] = header
+        return response
+
+    @app.teardown_request
+    def _teardown_request(exc):
+        gauge = g.pop("ygo_in_flight", None)
+        if gauge is not None:
+            gauge.__exit__(None, None, None)
+        if SERVER_TIMING:
+            _request_timings.set(None)
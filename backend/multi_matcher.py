@@ -1,123 +1,162 @@
 import os
-import cv2
 import numpy as np
-import faiss
-import re
 import html
-from tqdm import tqdm
 from collections import defaultdict
-from backend.image_processing import load_or_build_cache
-from backend.avg_price import get_average_price, to_fullwidth, convert_jpy_to_twd
-
-
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-INFO_DIR = os.path.join(BASE_DIR, "data", "cards_info")
-INDEX_PATH = os.path.join(BASE_DIR, "data", "cache", "all.index")
-
-
-def build_or_load_index(des_list, desc_dim):
-    if os.path.exists(INDEX_PATH):
-        return faiss.read_index(INDEX_PATH)
-    quantizer = faiss.IndexFlatL2(desc_dim)
-    index = faiss.IndexIVFPQ(quantizer, desc_dim, 500, 24, 8)
-    index.train(des_list)
-    index.add(des_list)
-    faiss.write_index(index, INDEX_PATH)
-    print("✅ 建立新索引完成")
-    return index
-
-
-def match_single_crop(des1, index, descs, names):
-    D, I = index.search(des1.astype('float32'), 2)
-    good_per_img = [[] for _ in descs]
-    boundaries = np.cumsum([len(d) for d in descs])
-    for qi in range(len(des1)):
-        d0, d1 = D[qi]
-        if d0 < 0.9 * d1:
-            tr = int(I[qi, 0])
-            idx = np.searchsorted(boundaries, tr, side='right')
-            start = boundaries[idx - 1] if idx > 0 else 0
-            local = tr - start
-            good_per_img[idx].append(cv2.DMatch(qi, local, d0))
-
-    best_idx = max(range(len(good_per_img)), key=lambda i: len(good_per_img[i]), default=None)
-    if best_idx is None or len(good_per_img[best_idx]) < 2:
+from concurrent.futures import wait, FIRST_COMPLETED
+from backend.feature_store import get_gallery
+from backend.index_registry import get_index
+from backend.voting import vote, vote_batched
+from backend.verification import GEOMETRIC_VERIFY, verify_candidates, keypoint_coords
+from backend.feature_extractor import submit_many
+from backend.price_service import record_recognition
+from backend.card_info import lookup as lookup_card
+from backend.result_cache import crop_results, image_key, gallery_tags
+from backend.crop import decode_image
+from backend import metrics
+
+
+def match_single_crop(des1, index, gallery, kp1=None):
+    with metrics.stage("index_search"):
+        D, I = index.search(des1.astype('float32'), 2)
+    with metrics.stage("voting"):
+        candidates = vote(D, I, gallery.image_ids, len(gallery.names))
+    if GEOMETRIC_VERIFY and kp1 is not None:
+        with metrics.stage("verify"):
+            candidates = verify_candidates(keypoint_coords(kp1), D, I, candidates, gallery)
+    if not candidates:
         return None
 
-    return names[best_idx]
+    return gallery.names[candidates[0][0]]
+
+
+def match_crops_batched(des_list, index, gallery, kp_list=None):
+    """ 將所有裁切圖的描述子疊成一個查詢矩陣，只呼叫一次 index.search """
+    offsets = np.concatenate([[0], np.cumsum([len(d) for d in des_list])])
+    with metrics.stage("index_search"):
+        D, I = index.search(np.vstack(des_list).astype('float32'), 2)
+    with metrics.stage("voting"):
+        per_crop = vote_batched(D, I, offsets, gallery.image_ids, len(gallery.names))
+    if GEOMETRIC_VERIFY and kp_list is not None:
+        with metrics.stage("verify"):
+            per_crop = [
+                verify_candidates(keypoint_coords(kp), D[start:end], I[start:end], candidates, gallery)
+                for kp, candidates, start, end in zip(kp_list, per_crop, offsets[:-1], offsets[1:])
+            ]
+    return [gallery.names[c[0][0]] if c else None for c in per_crop]
+
+
+def match_crops(results, index, gallery, batched=True):
+    """
+    [(kp, des), ...] → 每張裁切圖比對到的圖庫檔名，順序與輸入相同
+    （沒有特徵點或沒有匹配時為 None）；batched 時只呼叫一次 index.search
+    """
+    valid = [j for j, (kp, des) in enumerate(results) if des is not None and len(kp)]
+    names = [None] * len(results)
+    if not valid:
+        return names
+    kp_list = [results[j][0] for j in valid]
+    des_list = [results[j][1] for j in valid]
+    if batched:
+        found = match_crops_batched(des_list, index, gallery, kp_list)
+    else:
+        found = [match_single_crop(des, index, gallery, kp) for kp, des in zip(kp_list, des_list)]
+    for j, name in zip(valid, found):
+        names[j] = name
+    return names
 
 
 def read_info(matched_name):
     card_id = os.path.splitext(matched_name)[0].zfill(8)
-    matches = [
-        fname for fname in os.listdir(INFO_DIR)
-        if fname.startswith(card_id) and fname.lower().endswith(".txt")
-    ]
-    if not matches:
+    info = lookup_card(card_id)
+    if info is None:
         print(f"⚠️ 找到相似卡片 {matched_name}，但缺少對應資訊檔案")
         return None, card_id
 
-    info_file = os.path.join(INFO_DIR, matches[0])
-    print(f"🔍 匹配資訊檔案：{info_file}")
-
-    with open(info_file, encoding="utf-8") as f:
-        lines = f.readlines()
-
-    card_name_jp = ""
-    for line in lines:
-        if line.startswith("日文名:"):
-            card_name_jp = line.replace("日文名:", "").strip()
-            break
-
-    info = "".join(lines)
-    info = html.escape(info, quote=False).replace("圖片 URL:", "")
-    info = info.replace("\n", " <br>")
-    info = re.sub(r"(https?://[^\s]+)", r'<img src="\1" alt="圖片" />', info)
-
-    image_html_list = re.findall(r'<img src="[^"]+" alt="圖片" />', info)
-    images_html = "".join(image_html_list)
-
-    text_html = re.sub(r'<img src="[^"]+" alt="圖片" />', '', info)
-
-    # Get average price using correct Japanese name
-    # fullwidth_name = to_fullwidth(card_name_jp)
-    # average_price = get_average_price(fullwidth_name)
-
-    
-    # if average_price is not None:
-    #     from backend.avg_price import convert_jpy_to_twd  # add this if not already imported
-    #     price_twd = convert_jpy_to_twd(average_price)
-    #     if price_twd:
-    #         text_html += f"<br><b>平均價格:</b> {average_price} 円 (NT${price_twd})"
-    #     else:
-    #         text_html += f"<br><b>平均價格:</b> {average_price} 円 (TWD轉換失敗)"
-    # else:
-    #     text_html += "<br><b>平均價格:</b> 價格未找到"
-
-    return (text_html, images_html), card_id
-
-
-def process_multi_image(image_bytes_list):
-    paths, names, kp_attrs, descs, all_desc = load_or_build_cache("all")
-    index = build_or_load_index(all_desc, descs[0].shape[1])
-    sift = cv2.SIFT_create()
-
-    result_dict = defaultdict(lambda: [0, None])  # card_id: [count, info]
-
-    for img_data in tqdm(image_bytes_list, desc="處理每張裁切圖片"):
-        img = cv2.imdecode(np.frombuffer(img_data, np.uint8), cv2.IMREAD_COLOR)
+    print(f"🔍 匹配資訊檔案：{info.path}")
+    return (info.text_html, info.images_html, info.card_name_jp), card_id
+
+
+def _crop_event(index, done, total, matched_name):
+    """ 每張裁切圖完成時回報的進度內容 """
+    event = {"crop": index, "done": done, "total": total, "card_id": None, "card_name_jp": None}
+    if matched_name:
+        card_id = os.path.splitext(matched_name)[0].zfill(8)
+        info = lookup_card(card_id)
+        event.update(card_id=card_id, card_name_jp=info.card_name_jp if info else None)
+    return event
+
+
+def process_multi_image(image_bytes_list, batched=True, on_crop=None):
+    """
+    辨識多張裁切圖（位元組或 ndarray），回傳結果 HTML。
+    提供 on_crop 時，每張裁切圖完成就呼叫 on_crop(event)：每當有特徵擷取完成，
+    就把目前已完成的裁切圖合併成一次搜尋，再逐張回報進度。
+    """
+    total = len(image_bytes_list)
+    done = 0
+    metrics.observe("crops", total)
+
+    def report(index, matched_name):
+        nonlocal done
+        done += 1
+        if on_crop is not None:
+            on_crop(_crop_event(index, done, total, matched_name))
+
+    # 先查詢每張裁切圖的結果快取，只有未命中的裁切圖需要擷取特徵
+    pending, matched_names = [], []  # pending: (裁切圖編號, 圖, 快取鍵)
+    for i, image in enumerate(image_bytes_list):
+        img = decode_image(image)
         if img is None:
+            report(i, None)
             continue
-        kp, des = sift.detectAndCompute(img, None)
-        if des is None or len(kp) == 0:
-            continue
-
-        matched_name = match_single_crop(des, index, descs, names)
+        key = image_key(img, None if isinstance(image, np.ndarray) else image)
+        cached = crop_results.get(key)
+        if cached is not None:
+            matched_names.append(cached)
+            report(i, cached)
+        else:
+            pending.append((i, img, key))
+
+    # 送出未命中裁切圖的特徵擷取，與載入圖庫 / 索引重疊進行（順序與輸入相同）
+    futures = submit_many([img for _, img, _ in pending])
+
+    with metrics.stage("gallery_load"):
+        gallery = get_gallery("all")
+        if gallery is None:
+            raise ValueError("❌ 無法載入快取：all")
+        index = get_index("all", gallery.all_desc, gallery.live_ids)
+        tag = gallery_tags(["all"])
+
+    def finish(batch):
+        """ batch: [((裁切圖編號, 圖, 快取鍵), (kp, des)), ...] → 比對、寫入快取並回報 """
+        names = match_crops([features for _, features in batch], index, gallery, batched)
+        for ((i, _, key), _), matched_name in zip(batch, names):
+            if matched_name:
+                crop_results.put(key, matched_name, tag)
+            matched_names.append(matched_name)
+            report(i, matched_name)
+
+    if on_crop is None:
+        finish([(entry, future.result()) for entry, future in zip(pending, futures)])
+    else:
+        remaining = dict(zip(futures, pending))
+        while remaining:
+            completed, _ = wait(remaining, return_when=FIRST_COMPLETED)
+            finish([(remaining.pop(future), future.result()) for future in completed])
+    return render_multi_result(matched_names)
+
+
+@metrics.timed("render")
+def render_multi_result(matched_names):
+    """ 比對到的圖庫檔名清單 → 依卡號彙整張數的結果 HTML """
+    result_dict = defaultdict(lambda: [0, None])  # card_id: [count, info]
+    for matched_name in matched_names:
         if matched_name:
-            (info_text_html, images_html), card_id = read_info(matched_name)
-            if info_text_html:
+            info, card_id = read_info(matched_name)
+            if info and info[0]:
                 result_dict[card_id][0] += 1
-                result_dict[card_id][1] = (info_text_html, images_html)
+                result_dict[card_id][1] = info
+                record_recognition(info[2])
 
     if not result_dict:
         return "<p>❌ 沒有辨識出任何卡片</p>"
@@ -126,9 +165,9 @@ def process_multi_image(image_bytes_list):
     total_cards = sum([v[0] for _, v in sorted_items])
 
     result_html = f"<p id='cardSummary' style='padding: 0rem 0rem 1.5rem 2rem; font-size: large;'>辨識出 {total_cards} 張卡片（{len(sorted_items)} 種）：</p>\n<div class='card-list'>\n"
-    for card_id, (count, (text_html, images_html)) in sorted_items:
+    for card_id, (count, (text_html, images_html, card_name_jp)) in sorted_items:
         result_html += f"""
-        <div class="card-item">
+        <div class="card-item" data-card-name-jp="{html.escape(card_name_jp)}">
             <div class="card-images">
                 {images_html}
             </div>
@@ -140,11 +179,3 @@ def process_multi_image(image_bytes_list):
         """
     result_html += "</div>"
     return result_html
-
-
-def run_multi_match_from_crops(crop_paths):
-    image_bytes_list = []
-    for path in crop_paths:
-        with open(path, "rb") as f:
-            image_bytes_list.append(f.read())
-    return process_multi_image(image_bytes_list)
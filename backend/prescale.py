@@ -0,0 +1,131 @@
+"""
+上傳圖片的縮放正規化：手機照片常有 12~48 MP，但辨識精度只需要接近圖庫的解析度。
+
+- decode：只解碼一次；依 JPEG / PNG 檔頭的尺寸選擇 IMREAD_REDUCED_*，直接在解碼時縮小
+- resize_for_sift：把卡片圖縮到接近圖庫卡圖的高度再擷取 SIFT
+- detection_copy：送給 Roboflow 的縮小版本，偵測框再以 scale_predictions 換算回原圖座標
+
+所有尺寸都可用環境變數調整。
+"""
+import os
+import struct
+import cv2
+import numpy as np
+
+# 圖庫卡圖高度（ygoprodeck 卡圖為 421x614）；SIFT 前把卡片縮到此高度
+CARD_HEIGHT = int(os.environ.get("YGO_CARD_HEIGHT", "614"))
+# 送去 Roboflow 偵測 / 分類的圖片長邊上限
+DETECT_MAX_SIDE = int(os.environ.get("YGO_DETECT_MAX_SIDE", "1280"))
+# 多卡照片解碼後的長邊下限（裁切後每張卡仍需足夠的解析度）
+DECODE_MIN_SIDE = int(os.environ.get("YGO_DECODE_MIN_SIDE", "4096"))
+
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def image_size(data):
+    """ 由 JPEG / PNG 檔頭取得 (寬, 高)，不解碼像素；無法判斷時回傳 None """
+    data = bytes(data[:64 * 1024]) if len(data) > 64 * 1024 else bytes(data)
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:2] != b"\xff\xd8":
+        return None
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        if marker in _JPEG_SOF and pos + 9 <= len(data):
+            height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    return None
+
+
+def decode(image, min_side=None):
+    """
+    圖檔路徑、位元組或 ndarray → (BGR ndarray, factor)，factor = 原圖長邊 / 解碼後長邊。
+    指定 min_side 時，在解碼後長邊仍不小於 min_side 的前提下使用最大的縮小解碼倍率。
+    無法解碼時回傳 (None, 1.0)。
+    """
+    if isinstance(image, np.ndarray):
+        return image, 1.0
+    if not isinstance(image, (bytes, bytearray, memoryview)):
+        with open(image, "rb") as f:
+            image = f.read()
+
+    size = image_size(image) if min_side else None
+    flag, long_side = cv2.IMREAD_COLOR, None
+    if size is not None:
+        long_side = max(size)
+        for factor, reduced in _REDUCED_FLAGS:
+            if long_side / factor >= min_side:
+                flag = reduced
+                break
+
+    img = cv2.imdecode(np.frombuffer(image, np.uint8), flag)
+    if img is None:
+        return None, 1.0
+    return img, (long_side / max(img.shape[:2]) if long_side else 1.0)
+
+
+def downscale(img, max_side=None, max_height=None, interpolation=cv2.INTER_AREA):
+    """
+    等比例縮小（不放大），回傳 (圖, factor)，factor = 原尺寸 / 縮小後尺寸。
+    INTER_AREA 品質最好；只需要找邊緣的極小縮圖可改用較快的 INTER_LINEAR
+    """
+    height, width = img.shape[:2]
+    scale = 1.0
+    if max_side and max(height, width) > max_side:
+        scale = min(scale, max_side / max(height, width))
+    if max_height and height > max_height:
+        scale = min(scale, max_height / height)
+    if scale >= 1.0:
+        return img, 1.0
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(img, size, interpolation=interpolation), 1.0 / scale
+
+
+def resize_for_sift(img, card_height=CARD_HEIGHT):
+    """ 卡片圖 → 高度不超過圖庫卡圖高度的版本（SIFT 時間與像素數成正比） """
+    return downscale(img, max_height=card_height)[0]
+
+
+def detection_copy(image, max_side=DETECT_MAX_SIDE):
+    """
+    上傳的位元組或已解碼的圖 → (送給 Roboflow 的圖, factor)，factor 為原圖 / 縮小圖的比例。
+    原始位元組本身已夠小時直接回傳原始位元組（不重新編碼）。
+    """
+    if not isinstance(image, np.ndarray):
+        size = image_size(image)
+        if size is not None and max(size) <= max_side:
+            return bytes(image), 1.0
+    img, factor = decode(image, max_side)
+    if img is None:
+        return image, 1.0
+    small, shrink = downscale(img, max_side=max_side)
+    return small, factor * shrink
+
+
+def scale_predictions(predictions, factor):
+    """ 把偵測框座標乘上 factor（例如縮小圖座標 → 原圖座標） """
+    if factor == 1.0:
+        return predictions
+    scaled = []
+    for pred in predictions.get("predictions", []):
+        pred = dict(pred)
+        for k in ("x", "y", "width", "height"):
+            pred[k] = pred[k] * factor
+        scaled.append(pred)
+    return {**predictions, "predictions": scaled}
@@ -0,0 +1,72 @@
+"""
+批次卡價查詢與背景預取：
+
+- iter_price_html(names)：以有限的並行數查詢多張卡的價格，完成一張就產出一張
+- start_prefetch()：背景執行緒定期替辨識次數最多的卡片預先查價（YGO_PRICE_PREFETCH=1 時由 app 啟動）
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from backend import price_service
+from backend.avg_price import to_fullwidth
+from backend.matcher import get_price_html
+
+# 同時查詢的卡片數；實際開啟的瀏覽器數仍受 YGO_BROWSER_POOL 限制
+BATCH_WORKERS = int(os.environ.get("YGO_PRICE_BATCH_WORKERS", "4"))
+MAX_BATCH = 100
+PREFETCH_TOP_N = int(os.environ.get("YGO_PRICE_PREFETCH_TOP", "50"))
+PREFETCH_INTERVAL = int(os.environ.get("YGO_PRICE_PREFETCH_INTERVAL", "600"))
+
+_prefetch_thread = None
+_prefetch_lock = threading.Lock()
+
+
+def iter_price_html(names, workers=BATCH_WORKERS):
+    """ 依完成順序產出 (日文卡名, 價格 HTML)；重複的卡名只查一次 """
+    names = list(dict.fromkeys(n.strip() for n in names if n and n.strip()))[:MAX_BATCH]
+    if not names:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(names))),
+                            thread_name_prefix="price") as pool:
+        futures = {pool.submit(get_price_html, name): name for name in names}
+        for future in as_completed(futures):
+            try:
+                price_html = future.result()
+            except Exception as e:
+                print(f"❌ 查價失敗 {futures[future]}: {e}")
+                price_html = "<br><b>平均價格:</b> 價格未找到"
+            yield futures[future], price_html
+
+
+def prefetch_once(top_n=PREFETCH_TOP_N):
+    """ 替辨識次數最多、且快取已過期的卡片查價，回傳實際查詢的張數 """
+    stale = [
+        name for name in price_service.most_recognized(top_n)
+        if not price_service.cached_price(to_fullwidth(name))[0]
+    ]
+    for _ in iter_price_html(stale):
+        pass
+    return len(stale)
+
+
+def _prefetch_loop(interval, top_n):
+    while True:
+        try:
+            count = prefetch_once(top_n)
+            if count:
+                print(f"💴 已預取 {count} 張卡片的價格")
+        except Exception as e:
+            print(f"⚠️ 價格預取失敗: {e}")
+        time.sleep(interval)
+
+
+def start_prefetch(interval=PREFETCH_INTERVAL, top_n=PREFETCH_TOP_N):
+    """ 啟動背景預取執行緒（重複呼叫不會啟動第二個） """
+    global _prefetch_thread
+    with _prefetch_lock:
+        if _prefetch_thread is None:
+            _prefetch_thread = threading.Thread(
+                target=_prefetch_loop, args=(interval, top_n), name="price-prefetch", daemon=True)
+            _prefetch_thread.start()
+    return _prefetch_thread
@@ -0,0 +1,322 @@
+"""
+卡價查詢服務：
+
+- 保留少量常駐的 headless Chrome（chromedriver 只安裝一次），查詢時借用、用完歸還
+- 等待價格元素或「查無結果」的提示出現即解析，不再固定 sleep；頁面逾時不當作查無價格快取
+- 查詢結果存在 SQLite（data/cache/prices.sqlite3），以全形日文卡名為鍵並設有效期限
+- 匯率另有自己的有效期限；同一張卡的並行查詢只會實際抓取一次
+"""
+import os
+import re
+import time
+import atexit
+import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from contextlib import contextmanager
+import requests
+from bs4 import BeautifulSoup
+from backend import metrics
+from backend.image_processing import CACHE_DIR
+
+DB_PATH = os.path.join(CACHE_DIR, "prices.sqlite3")
+
+SEARCH_URL = "https://toreca.net/list?game=&name={name}"
+RATE_URL = "https://api.exchangerate-api.com/v4/latest/JPY"
+
+PRICE_TTL = int(os.environ.get("YGO_PRICE_TTL", str(6 * 3600)))
+# 查無價格也會快取，但有效期限較短
+MISS_TTL = int(os.environ.get("YGO_PRICE_MISS_TTL", "1800"))
+RATE_TTL = int(os.environ.get("YGO_RATE_TTL", "3600"))
+BROWSER_POOL_SIZE = int(os.environ.get("YGO_BROWSER_POOL", "2"))
+PAGE_TIMEOUT = float(os.environ.get("YGO_PRICE_PAGE_TIMEOUT", "8"))
+# 搜尋結果頁查無商品時顯示的文字（出現任一即視為查無價格，不必等到逾時）
+NO_RESULTS_TEXTS = ("該当する商品がありません", "見つかりませんでした", "検索結果：0件")
+# 每個瀏覽器處理一定頁數後重開，避免長時間執行的記憶體累積
+MAX_PAGES_PER_BROWSER = 200
+
+_db_lock = threading.Lock()
+_db_ready = None  # 已建立資料表的 DB_PATH
+_inflight = {}
+_inflight_lock = threading.Lock()
+_rate = None  # (匯率, 取得時間)
+_rate_lock = threading.Lock()
+_recognitions = Counter()
+_recognitions_lock = threading.Lock()
+
+
+# ---------- 持久快取 ----------
+
+def _connect():
+    """ 開啟 SQLite 連線（呼叫端需持有 _db_lock）；資料表只在第一次連線時建立 """
+    global _db_ready
+    if _db_ready == DB_PATH:
+        return sqlite3.connect(DB_PATH, timeout=10)
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=10)
+    with conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS prices (name TEXT PRIMARY KEY, price INTEGER, fetched REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS rates (pair TEXT PRIMARY KEY, rate REAL, fetched REAL)")
+    _db_ready = DB_PATH
+    return conn
+
+
+def cached_price(name):
+    """ 回傳 (是否命中, 價格)；過期的紀錄視為未命中 """
+    with _db_lock:
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT price, fetched FROM prices WHERE name = ?", (name,)).fetchone()
+        finally:
+            conn.close()
+    if row is None:
+        return False, None
+    price, fetched = row
+    ttl = PRICE_TTL if price is not None else MISS_TTL
+    if time.time() - fetched > ttl:
+        return False, None
+    return True, price
+
+
+def store_price(name, price):
+    with _db_lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO prices VALUES (?, ?, ?)", (name, price, time.time()))
+        finally:
+            conn.close()
+
+
+def _load_rate(pair):
+    with _db_lock:
+        conn = _connect()
+        try:
+            return conn.execute("SELECT rate, fetched FROM rates WHERE pair = ?", (pair,)).fetchone()
+        finally:
+            conn.close()
+
+
+def _store_rate(pair, rate, fetched):
+    with _db_lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO rates VALUES (?, ?, ?)", (pair, rate, fetched))
+        finally:
+            conn.close()
+
+
+# ---------- 瀏覽器池 ----------
+
+class BrowserPool:
+    """ 常駐 headless Chrome 池；第一次借用時才啟動，最多 size 個 """
+
+    def __init__(self, size=BROWSER_POOL_SIZE):
+        self.size = size
+        self._idle = []           # 閒置的瀏覽器（後進先出）
+        self._created = 0
+        self._available = threading.Condition()  # 有瀏覽器歸還或名額釋出時通知
+        self._lock = threading.Lock()
+        self._driver_path = None
+
+    def _new_driver(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+
+        with self._lock:
+            if self._driver_path is None:
+                from webdriver_manager.chrome import ChromeDriverManager
+                self._driver_path = ChromeDriverManager().install()
+        options = Options()
+        options.add_argument("--headless")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.page_load_strategy = "eager"
+        driver = webdriver.Chrome(service=Service(self._driver_path), options=options)
+        driver.pages_served = 0
+        return driver
+
+    def _acquire(self):
+        """ 取得閒置的瀏覽器，或保留一個新建名額（回傳 None）；都沒有時等待歸還或名額釋出 """
+        with self._available:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.size:
+                    self._created += 1
+                    return None
+                self._available.wait()
+
+    def _release_slot(self):
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    @contextmanager
+    def browser(self):
+        """ 借用一個瀏覽器；池已滿時等待其他查詢歸還。發生錯誤的瀏覽器直接關閉不歸還 """
+        driver = self._acquire()
+        if driver is None:
+            try:
+                driver = self._new_driver()
+            except Exception:
+                self._release_slot()
+                raise
+
+        try:
+            yield driver
+        except Exception:
+            self._discard(driver)
+            raise
+        driver.pages_served += 1
+        if driver.pages_served >= MAX_PAGES_PER_BROWSER:
+            self._discard(driver)
+        else:
+            with self._available:
+                self._idle.append(driver)
+                self._available.notify()
+
+    def _discard(self, driver):
+        """ 關閉瀏覽器並釋出名額，讓等待中的查詢可以建立新的瀏覽器 """
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        self._release_slot()
+
+    def close(self):
+        with self._available:
+            drivers, self._idle = self._idle, []
+        for driver in drivers:
+            self._discard(driver)
+
+
+_pool = BrowserPool()
+atexit.register(_pool.close)
+
+
+# ---------- 價格 ----------
+
+def parse_price(page_source):
+    """ 從搜尋結果頁取出第一個日圓價格，找不到時回傳 None """
+    soup = BeautifulSoup(page_source, "html.parser")
+    for td in soup.select("td.text-end"):
+        text = td.get_text(strip=True)
+        if "円" in text:
+            match = re.search(r"([\d,]+)", text)
+            if match:
+                return int(match.group(1).replace(",", ""))
+    return None
+
+
+def _results_loaded(driver):
+    """ 搜尋結果已顯示：出現日圓價格，或出現查無結果的提示 """
+    from selenium.webdriver.common.by import By
+    if any("円" in td.text for td in driver.find_elements(By.CSS_SELECTOR, "td.text-end")):
+        return True
+    body = driver.find_element(By.TAG_NAME, "body").text
+    return any(text in body for text in NO_RESULTS_TEXTS)
+
+
+def fetch_price(name):
+    """
+    以瀏覽器池實際抓取 Toreca 價格（不經過快取），查無價格時回傳 None；
+    頁面在 PAGE_TIMEOUT 內沒有顯示結果時丟出 TimeoutError（呼叫端不應當作查無價格快取）
+    """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    with metrics.in_flight("price_fetch_in_flight"), metrics.stage("price_fetch"), _pool.browser() as driver:
+        driver.get(SEARCH_URL.format(name=name))
+        try:
+            WebDriverWait(driver, PAGE_TIMEOUT, poll_frequency=0.2).until(_results_loaded)
+        except TimeoutException:
+            # 瀏覽器本身沒有問題，照常歸還；離開 with 後才回報逾時
+            page_source = None
+        else:
+            page_source = driver.page_source
+    if page_source is None:
+        raise TimeoutError(f"價格頁面在 {PAGE_TIMEOUT:g} 秒內沒有顯示結果：{name}")
+    return parse_price(page_source)
+
+
+def get_price(name):
+    """
+    全形日文卡名 → 日圓價格（int）或 None。
+    先查 SQLite 快取；未命中時同一卡名只有一個執行緒實際抓取，其餘等待同一結果。
+    抓取失敗或頁面逾時時回傳 None，但不寫入快取（下次仍會重新查詢）。
+    """
+    hit, price = cached_price(name)
+    metrics.count("price_cache", result="hit" if hit else "miss")
+    if hit:
+        return price
+
+    with _inflight_lock:
+        future = _inflight.get(name)
+        owner = future is None
+        if owner:
+            future = _inflight[name] = Future()
+    if not owner:
+        return future.result()
+
+    try:
+        price = fetch_price(name)
+        if price is not None:
+            print(f"💴 Found price: ¥{price}")
+        store_price(name, price)
+        future.set_result(price)
+    except Exception as e:
+        print("❌ Selenium scraping error:", e)
+        price = None
+        future.set_result(None)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(name, None)
+    return price
+
+
+# ---------- 匯率 ----------
+
+def get_jpy_to_twd_rate():
+    """ 日圓 → 新台幣匯率（記憶體與 SQLite 快取，RATE_TTL 內不重新查詢）；取得失敗時沿用舊匯率 """
+    global _rate
+    with _rate_lock:
+        if _rate is None:
+            _rate = _load_rate("JPY_TWD")
+        if _rate is not None and time.time() - _rate[1] <= RATE_TTL:
+            return _rate[0]
+        try:
+            r = requests.get(RATE_URL, timeout=10)
+            rate = r.json()["rates"].get("TWD") if r.status_code == 200 else None
+        except Exception as e:
+            print("❌ 匯率查詢失敗:", e)
+            rate = None
+        if rate:
+            _rate = (rate, time.time())
+            _store_rate("JPY_TWD", rate, _rate[1])
+        return _rate[0] if _rate is not None else None
+
+
+def convert_jpy_to_twd(jpy):
+    rate = get_jpy_to_twd_rate()
+    if not rate:
+        return None
+    return round(jpy * rate, 2)
+
+
+# ---------- 辨識次數（供背景預取使用） ----------
+
+def record_recognition(card_name_jp):
+    """ 記錄一次辨識結果的日文卡名 """
+    if card_name_jp:
+        with _recognitions_lock:
+            _recognitions[card_name_jp] += 1
+
+
+def most_recognized(n):
+    """ 辨識次數最多的 n 個日文卡名 """
+    with _recognitions_lock:
+        return [name for name, _ in _recognitions.most_common(n)]
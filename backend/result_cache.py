@@ -0,0 +1,185 @@
+"""
+辨識結果快取：使用者常重複上傳同一張截圖或同一張熱門卡。
+
+以圖片內容的 SHA-1 做完全比對，再以 64 位元感知雜湊（pHash 或 dHash）在
+漢明距離門檻內做近似比對（所有雜湊存在一個 uint64 陣列，以 numpy 一次算出 XOR / popcount）。
+每筆結果記錄辨識當下的圖庫 / 索引簽章，圖庫或索引重建後舊結果自動失效。容量以 LRU 控制。
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+import cv2
+import numpy as np
+from backend.feature_store import get_gallery
+from backend.index_registry import index_signature
+from backend import metrics
+
+RESULT_CACHE_SIZE = int(os.environ.get("YGO_RESULT_CACHE_SIZE", "4096"))
+# 64 位元雜湊的漢明距離門檻；0 表示只做完全比對
+HAMMING_THRESHOLD = int(os.environ.get("YGO_RESULT_CACHE_HAMMING", "4"))
+HASH_METHOD = os.environ.get("YGO_RESULT_CACHE_HASH", "phash")  # 或 "dhash"
+
+ImageKey = namedtuple("ImageKey", "sha1 phash")
+_Entry = namedtuple("_Entry", "phash tag value slot")  # slot：雜湊在 _hashes 陣列中的位置
+
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(values):
+    """ uint64 陣列每個元素的位元數 """
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(values)
+    return _BYTE_POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _gray(img):
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.reshape(-1)).tobytes(), "big")
+
+
+def phash(img):
+    """ 32x32 灰階 DCT 左上 8x8 低頻係數（去掉直流項）與中位數比較 → 64 位元整數 """
+    small = cv2.resize(_gray(img), (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].reshape(-1)
+    return _bits_to_int(low > np.median(low[1:]))
+
+
+def dhash(img):
+    """ 9x8 灰階縮圖相鄰像素的明暗梯度 → 64 位元整數 """
+    small = cv2.resize(_gray(img), (9, 8), interpolation=cv2.INTER_AREA)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def image_key(img, data=None):
+    """ 已解碼的圖片（與原始位元組，若有）→ ImageKey """
+    if data is None:
+        content = hashlib.sha1(str(img.shape).encode())
+        content.update(np.ascontiguousarray(img).data)
+    else:
+        content = hashlib.sha1(data)
+    perceptual = dhash(img) if HASH_METHOD == "dhash" else phash(img)
+    return ImageKey(content.hexdigest(), perceptual)
+
+
+def gallery_tag(category):
+    """
+    類別目前的圖庫與索引簽章；結果只在簽章相同時有效。
+    圖庫以快取檔的簽章與清單版本號判斷（只更新檔案指紋的清單不使結果失效）
+    """
+    gallery = get_gallery(category)
+    if gallery is None:
+        return None
+    return category, gallery.signature[0], gallery.cache_version, index_signature(category)
+
+
+def gallery_tags(categories):
+    """ 多個類別的簽章（分流搜尋比較過多個類別時，任一類別重建都使結果失效）；任一類別無法載入時回傳 None """
+    tags = tuple(gallery_tag(category) for category in categories)
+    return None if not tags or None in tags else tags
+
+
+class ResultCache:
+    """ SHA-1 完全比對 + 感知雜湊近似比對的 LRU 結果快取 """
+
+    def __init__(self, name, max_entries=RESULT_CACHE_SIZE, hamming_threshold=HAMMING_THRESHOLD):
+        self.name = name
+        self.max_entries = max_entries
+        self.hamming_threshold = hamming_threshold
+        self._entries = OrderedDict()  # sha1 → _Entry
+        # 近似比對用：每個 slot 的雜湊、是否使用中與對應的 sha1（空的 slot 為 None）
+        self._hashes = np.zeros(max_entries, dtype=np.uint64)
+        self._used = np.zeros(max_entries, dtype=bool)
+        self._owners = [None] * max_entries
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "perceptual_hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    def _nearest(self, perceptual):
+        """ 漢明距離在門檻內且最近的 sha1，沒有時回傳 None（呼叫端持有鎖） """
+        if not self._entries:
+            return None
+        dist = np.where(self._used, _popcount(self._hashes ^ np.uint64(perceptual)), 255)
+        slot = int(np.argmin(dist))
+        return self._owners[slot] if dist[slot] <= self.hamming_threshold else None
+
+    def _remove(self, sha1):
+        entry = self._entries.pop(sha1)
+        self._owners[entry.slot] = None
+        self._used[entry.slot] = False
+        self._free.append(entry.slot)
+
+    def get(self, key):
+        """ 回傳快取結果，沒有命中或結果已過期時回傳 None """
+        with self._lock:
+            sha1, kind = key.sha1, "exact_hits"
+            if sha1 not in self._entries:
+                sha1, kind = (self._nearest(key.phash) if self.hamming_threshold > 0 else None), "perceptual_hits"
+            if sha1 is None:
+                self._stats["misses"] += 1
+                metrics.count("result_cache", cache=self.name, result="miss")
+                return None
+            entry = self._entries[sha1]
+
+        # 檢查圖庫 / 索引是否已重建（會 stat 檔案，不在鎖內進行）
+        if entry.tag is None or gallery_tags([tag[0] for tag in entry.tag]) != entry.tag:
+            with self._lock:
+                if self._entries.get(sha1) is entry:
+                    self._remove(sha1)
+                self._stats["stale"] += 1
+                self._stats["misses"] += 1
+            metrics.count("result_cache", cache=self.name, result="stale")
+            return None
+
+        with self._lock:
+            if sha1 in self._entries:
+                self._entries.move_to_end(sha1)
+            self._stats[kind] += 1
+        metrics.count("result_cache", cache=self.name, result=kind[:-len("_hits")])
+        return entry.value
+
+    def put(self, key, value, tag):
+        """ tag 為 gallery_tags() 的結果 """
+        with self._lock:
+            if key.sha1 in self._entries:
+                self._remove(key.sha1)
+            elif len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+            if not self._free:  # max_entries 為 0
+                return
+            slot = self._free.pop()
+            self._hashes[slot] = key.phash
+            self._used[slot] = True
+            self._owners[slot] = key.sha1
+            self._entries[key.sha1] = _Entry(key.phash, tag, value, slot)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._used[:] = False
+            self._owners = [None] * self.max_entries
+            self._free = list(range(self.max_entries - 1, -1, -1))
+
+    def stats(self):
+        with self._lock:
+            hits = self._stats["exact_hits"] + self._stats["perceptual_hits"]
+            lookups = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+
+# 單張辨識（/match_one、/match_choice）與多卡模式的每張裁切圖各自一份
+image_results = ResultCache("image")
+crop_results = ResultCache("crop")
+
+
+def stats():
+    return {"image": image_results.stats(), "crop": crop_results.stats()}
@@ -0,0 +1,60 @@
+import os
+import cv2
+import numpy as np
+from backend.voting import RATIO, ratio_mask
+
+# 幾何驗證：只對投票前幾名做 RANSAC，內點數達門檻即提前結束
+GEOMETRIC_VERIFY = os.environ.get("YGO_GEOMETRIC_VERIFY", "1") == "1"
+GEOMETRY = "homography"  # 或 "affine"
+MIN_INLIERS = 12
+RANSAC_REPROJ_THRESHOLD = 5.0
+
+
+def keypoint_coords(kp):
+    """ cv2.KeyPoint 清單 → (N, 2) float32 座標 """
+    return cv2.KeyPoint_convert(kp).reshape(-1, 2).astype(np.float32)
+
+
+def count_inliers(src, dst, geometry=GEOMETRY):
+    """ 以 RANSAC 估計查詢圖 → 圖庫圖的幾何轉換，回傳內點數 """
+    if geometry == "affine":
+        if len(src) < 3:
+            return 0
+        _, inliers = cv2.estimateAffinePartial2D(
+            src, dst, method=cv2.RANSAC, ransacReprojThreshold=RANSAC_REPROJ_THRESHOLD)
+    else:
+        if len(src) < 4:
+            return 0
+        _, inliers = cv2.findHomography(src, dst, cv2.RANSAC, RANSAC_REPROJ_THRESHOLD)
+    return int(inliers.sum()) if inliers is not None else 0
+
+
+def verify_candidates(query_pts, D, I, candidates, gallery, ratio=RATIO,
+                      min_inliers=MIN_INLIERS, geometry=GEOMETRY):
+    """
+    依投票順序對候選 [(圖片編號, 票數), ...] 做幾何驗證，
+    使用快取中儲存的圖庫關鍵點座標。第一個內點數達 min_inliers 的候選即為結果；
+    都未達門檻時取內點數最多者（同數時保留投票順序）。
+    回傳 (圖片編號, 票數, 內點數) 清單，第一個為最終結果。
+    """
+    if not candidates:
+        return []
+
+    mask = ratio_mask(D, I, ratio)
+    query_rows = np.nonzero(mask)[0]
+    gallery_rows = I[mask, 0]
+    gallery_imgs = gallery.image_ids[gallery_rows]
+
+    checked = []
+    for image_idx, votes in candidates:
+        sel = gallery_imgs == image_idx
+        kp = gallery.keypoints[gallery_rows[sel]]
+        dst = np.stack([kp["x"], kp["y"]], axis=1).astype(np.float32)
+        src = query_pts[query_rows[sel]]
+        inliers = count_inliers(src, dst, geometry)
+        checked.append((image_idx, votes, inliers))
+        if inliers >= min_inliers:
+            return [checked[-1]] + checked[:-1]
+
+    order = sorted(range(len(checked)), key=lambda i: (-checked[i][2], i))
+    return [checked[i] for i in order]
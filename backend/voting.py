@@ -0,0 +1,44 @@
+import numpy as np
+
+# Lowe ratio test 門檻與判定為匹配所需的最少票數
+RATIO = 0.9
+MIN_VOTES = 2
+TOP_K = 5
+
+
+def ratio_mask(D, I, ratio=RATIO):
+    """ index.search(..., 2) 結果中通過 ratio test 的查詢描述子（D、I 形狀皆為 (查詢數, 2)） """
+    return (I[:, 0] >= 0) & (D[:, 0] < ratio * D[:, 1])
+
+
+def count_votes(D, I, image_ids, n_images, ratio=RATIO):
+    """ 以 ratio test 的結果回傳每張圖庫圖片的得票數 """
+    nearest = I[:, 0]
+    mask = ratio_mask(D, I, ratio)
+    return np.bincount(image_ids[nearest[mask]], minlength=n_images)
+
+
+def top_candidates(votes, k=TOP_K, min_votes=MIN_VOTES):
+    """ 依得票數由高到低回傳前 k 名 [(圖片編號, 票數), ...]，同票時編號小者優先 """
+    order = np.argsort(-votes, kind="stable")[:k]
+    return [(int(i), int(votes[i])) for i in order if votes[i] >= min_votes]
+
+
+def vote(D, I, image_ids, n_images, k=TOP_K, ratio=RATIO, min_votes=MIN_VOTES):
+    """ ratio test + 投票，回傳前 k 名候選 """
+    return top_candidates(count_votes(D, I, image_ids, n_images, ratio), k, min_votes)
+
+
+def vote_batched(D, I, offsets, image_ids, n_images, k=TOP_K, ratio=RATIO, min_votes=MIN_VOTES):
+    """
+    多張裁切圖合併成一次 search 後的投票。
+    offsets 為每張裁切圖在查詢矩陣中的起始列（長度為裁切圖數 + 1），
+    回傳每張裁切圖各自的前 k 名候選。
+    """
+    n_crops = len(offsets) - 1
+    crop_of_row = np.repeat(np.arange(n_crops), np.diff(offsets))
+    nearest = I[:, 0]
+    mask = ratio_mask(D, I, ratio)
+    flat = crop_of_row[mask] * n_images + image_ids[nearest[mask]]
+    votes = np.bincount(flat, minlength=n_crops * n_images).reshape(n_crops, n_images)
+    return [top_candidates(row, k, min_votes) for row in votes]
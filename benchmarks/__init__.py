@@ -0,0 +1,9 @@
+"""
+端到端效能測試：
+
+    python -m benchmarks.run --cards 60 --queries 120 --scenes 12 --output bench.json
+    python -m benchmarks.compare before.json after.json
+
+以 data/gallery 的卡圖（沒有時以程式產生的卡圖）在獨立的工作區建立合成圖庫與查詢集，
+Roboflow 以本機 stub 取代，分別量測各階段的耗時。結果以 JSON 輸出，方便比較不同 commit。
+"""
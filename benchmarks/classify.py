@@ -0,0 +1,69 @@
+"""
+本機卡框分類與 Roboflow 分類的準確率 / 延遲比較（合成的標註資料）：
+
+    python -m benchmarks.classify --output benchmarks/results/local_classifier.json
+    python -m benchmarks.classify --remote      # 同時呼叫 Roboflow（需要 ROBOFLOW_API_KEY 與網路）
+
+以 benchmarks.synthetic.frame_dataset 產生各框色的訓練卡圖與另一批拍成照片的標註卡，
+訓練 local_classifier 後以 local_classifier.compare 評估。
+後端模組在設定 YGO_DATA_DIR 指向工作區之後才載入，不會讀寫 data/ 下的正式模型。
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="本機卡框分類與 Roboflow 的比較")
+    parser.add_argument("--workdir", help="工作區目錄（預設為暫存目錄，結束後刪除）")
+    parser.add_argument("--per-category", type=int, default=40, help="每個類別的訓練卡圖數")
+    parser.add_argument("--photos", type=int, default=10, help="每個類別的標註照片數")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--remote", action="store_true", help="同時呼叫 Roboflow 比較")
+    parser.add_argument("--output", help="JSON 輸出路徑（預設印到標準輸出）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ygo-classify-")
+    os.environ["YGO_DATA_DIR"] = workdir
+    try:
+        from benchmarks import synthetic
+        from benchmarks.run import git_commit
+        labeled_dir = synthetic.frame_dataset(workdir, args.per_category, args.photos, args.seed)
+
+        from backend import local_classifier
+        with contextlib.redirect_stdout(sys.stderr):
+            local_classifier.train()
+            report, _ = local_classifier.compare(labeled_dir, remote=args.remote)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report["environment"] = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "per_category": args.per_category,
+        "photos": args.photos,
+        "seed": args.seed,
+        "remote": args.remote,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"💾 已寫入：{args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
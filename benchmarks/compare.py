@@ -0,0 +1,74 @@
+"""
+比較兩份 benchmarks.run 的 JSON 結果：
+
+    python -m benchmarks.compare before.json after.json
+
+列出延遲、吞吐量、準確率、峰值 RSS 與各階段 p50 的變化。
+"""
+import sys
+import json
+
+METRICS = [
+    ("build", "wall_s", "s"),
+    ("single", "latency.p50_ms", "ms"),
+    ("single", "latency.p95_ms", "ms"),
+    ("single", "latency.throughput_per_s", "/s"),
+    ("single", "top1_accuracy", ""),
+    ("multi", "latency.p50_ms", "ms"),
+    ("multi", "latency.p95_ms", "ms"),
+    ("multi", "cards_per_s", "/s"),
+    ("multi", "top1_accuracy", ""),
+    ("peak_rss_mb", "self", "MB"),
+]
+
+
+def _get(report, section, path):
+    value = report.get(section)
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _row(label, before, after, unit):
+    if before is None and after is None:
+        return None
+    fmt = lambda v: "-" if v is None else f"{v:.3f}{unit}"
+    change = ""
+    if before and after is not None:
+        change = f"{(after - before) / before * 100:+.1f}%"
+    return f"{label:<36} {fmt(before):>14} {fmt(after):>14} {change:>9}"
+
+
+def compare(before, after):
+    lines = [f"{'':<36} {before.get('commit') or 'before':>14} {after.get('commit') or 'after':>14}"]
+    for section, path, unit in METRICS:
+        row = _row(f"{section}.{path}", _get(before, section, path), _get(after, section, path), unit)
+        if row:
+            lines.append(row)
+    for section in ("build", "single", "multi"):
+        stages = sorted(set(_get(before, section, "stages") or {}) | set(_get(after, section, "stages") or {}))
+        for stage in stages:
+            row = _row(f"{section}.{stage}.p50",
+                       _get(before, section, f"stages.{stage}.p50_ms"),
+                       _get(after, section, f"stages.{stage}.p50_ms"), "ms")
+            if row:
+                lines.append(row)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("用法：python -m benchmarks.compare before.json after.json", file=sys.stderr)
+        sys.exit(2)
+    reports = []
+    for path in argv:
+        with open(path, encoding="utf-8") as f:
+            reports.append(json.load(f))
+    print(compare(*reports))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+端到端效能測試：建立合成圖庫 → build_cache / 建索引 → 單卡 process_image → 多卡辨識，
+輸出各階段 p50 / p95、吞吐量、峰值 RSS 與 top-1 準確率（JSON）。
+
+    python -m benchmarks.run --cards 60 --queries 120 --scenes 12 --output bench.json
+
+後端模組在解析參數、設定 YGO_DATA_DIR 指向工作區之後才載入，不會讀寫 data/ 下的正式快取。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+import contextlib
+from collections import Counter
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATEGORY = "all"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="YGO 卡片辨識端到端效能測試")
+    parser.add_argument("--source", default=os.path.join(BASE_DIR, "data", "gallery"),
+                        help="圖庫卡圖來源目錄（含子目錄）；沒有圖檔時以程式產生卡圖")
+    parser.add_argument("--workdir", help="工作區目錄（預設為暫存目錄，結束後刪除）")
+    parser.add_argument("--cards", type=int, default=60, help="圖庫卡片數")
+    parser.add_argument("--queries", type=int, default=120, help="單卡查詢數")
+    parser.add_argument("--scenes", type=int, default=12, help="多卡照片數")
+    parser.add_argument("--cards-per-scene", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warmup", type=int, default=3, help="不計入統計的暖機查詢數")
+    parser.add_argument("--factory", help="索引的 faiss factory 字串（預設使用 index_registry 的設定）")
+    parser.add_argument("--network-ms", type=float, default=0.0, help="Roboflow stub 的模擬網路延遲（毫秒）")
+    parser.add_argument("--multi-mode", choices=("batched", "stream"), default="batched",
+                        help="batched：單次批次搜尋；stream：逐張回報進度（jobs 使用的路徑）")
+    parser.add_argument("--keep-result-cache", action="store_true",
+                        help="不清除辨識結果快取（預設每次查詢前清除，量測完整流程）")
+    parser.add_argument("--phases", default="build,single,multi", help="要執行的階段（逗號分隔）")
+    parser.add_argument("--output", help="JSON 輸出路徑（預設印到標準輸出）")
+    return parser.parse_args(argv)
+
+
+def peak_rss_mb():
+    """ 本行程與已結束子行程（建快取的 process pool）的峰值 RSS（MB） """
+    # Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor
+    return {"self": round(own, 1), "children": round(children, 1)}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latency_report(latencies, wall):
+    from benchmarks.stages import summarize
+    report = summarize(latencies)
+    report["throughput_per_s"] = len(latencies) / wall if wall else None
+    return report
+
+
+def run_build(timer):
+    from backend import image_processing
+    from backend.feature_store import get_gallery
+    from backend.index_registry import get_index
+
+    timer.reset()
+    start = time.perf_counter()
+    image_processing.build_cache(CATEGORY)
+    gallery = get_gallery(CATEGORY)
+    get_index(CATEGORY, gallery.all_desc, gallery.live_ids)
+    wall = time.perf_counter() - start
+    return {
+        "wall_s": wall,
+        "images": len(gallery.names),
+        "descriptors": int(len(gallery.all_desc)),
+        "stages": timer.report(),
+    }
+
+
+def _clear_result_caches(args):
+    if not args.keep_result_cache:
+        from backend.result_cache import image_results, crop_results
+        image_results.clear()
+        crop_results.clear()
+
+
+def run_single(args, timer, queries, names):
+    from backend.matcher import process_image
+
+    for _, data in queries[:args.warmup]:
+        _clear_result_caches(args)
+        process_image(data)
+
+    timer.reset()
+    latencies, correct = [], 0
+    start = time.perf_counter()
+    for card_id, data in queries:
+        _clear_result_caches(args)
+        t0 = time.perf_counter()
+        try:
+            result = process_image(data)
+        except ValueError as e:
+            result = str(e)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if not isinstance(result, str) and result[1] == names[card_id]:
+            correct += 1
+    wall = time.perf_counter() - start
+    return {
+        "queries": len(queries),
+        "latency": latency_report(latencies, wall),
+        "top1_accuracy": correct / len(queries) if queries else None,
+        "stages": timer.report(),
+    }
+
+
+def run_multi(args, timer, stub, scenes):
+    from backend import multi_matcher
+    from backend.all_flow import recognize_multi_cards
+
+    # 攔截 render_multi_result 的輸入以計算每張卡的準確率（依卡號多重集合比對）
+    matched = []
+    render = multi_matcher.render_multi_result
+
+    def capture(matched_names):
+        matched.append([os.path.splitext(n)[0].zfill(8) for n in matched_names if n])
+        return render(matched_names)
+
+    multi_matcher.render_multi_result = capture
+    on_progress = (lambda event: None) if args.multi_mode == "stream" else None
+
+    def run_scene(data, size, truth):
+        stub.set_scene(size, [box for _, box in truth])
+        _clear_result_caches(args)
+        return recognize_multi_cards(data, on_progress=on_progress)
+
+    try:
+        for data, size, truth in scenes[:args.warmup]:
+            run_scene(data, size, truth)
+
+        timer.reset()
+        matched.clear()
+        latencies, correct, total, detected = [], 0, 0, 0
+        start = time.perf_counter()
+        for data, size, truth in scenes:
+            before = len(matched)
+            t0 = time.perf_counter()
+            run_scene(data, size, truth)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            predicted = Counter(matched[before] if len(matched) > before else [])
+            expected = Counter(card_id for card_id, _ in truth)
+            correct += sum((predicted & expected).values())
+            detected += sum(predicted.values())
+            total += len(truth)
+        wall = time.perf_counter() - start
+    finally:
+        multi_matcher.render_multi_result = render
+
+    return {
+        "scenes": len(scenes),
+        "cards": total,
+        "mode": args.multi_mode,
+        "latency": latency_report(latencies, wall),
+        "cards_per_s": total / wall if wall else None,
+        "top1_accuracy": correct / total if total else None,
+        "matched": detected,
+        "stages": timer.report(),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    phases = {p.strip() for p in args.phases.split(",") if p.strip()}
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ygo-bench-")
+    os.environ["YGO_DATA_DIR"] = workdir
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+
+    # 以下才載入後端模組（路徑常數在載入時由 YGO_DATA_DIR 決定）
+    from benchmarks import synthetic
+    from benchmarks.stages import Timer, RoboflowStub, instrument
+
+    # 後端的進度訊息改印到 stderr，未指定 --output 時 stdout 只有 JSON
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            print(f"🧪 建立合成圖庫：{workdir}")
+            t0 = time.perf_counter()
+            synthetic.reset_cache(workdir)
+            cards = synthetic.build_gallery(workdir, args.source, args.cards, CATEGORY, args.seed)
+            queries = synthetic.single_queries(cards, args.queries, args.seed)
+            scenes = synthetic.multi_scenes(cards, args.scenes, args.cards_per_scene, args.seed)
+            generate_s = time.perf_counter() - t0
+            names = {card_id: f"テストカード{i}" for i, card_id in enumerate(sorted(cards))}
+
+            timer = Timer()
+            stub = RoboflowStub(CATEGORY, args.network_ms)
+            instrument(timer, stub)
+
+            if args.factory:
+                from backend.index_registry import save_index_config
+                save_index_config(CATEGORY, {"factory": args.factory, "params": {}})
+
+            report = {
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "cpu_count": os.cpu_count(),
+                "config": {k: v for k, v in vars(args).items() if k not in ("output", "workdir")},
+                "env": {k: v for k, v in sorted(os.environ.items()) if k.startswith("YGO_") and k != "YGO_DATA_DIR"},
+                "generate_s": generate_s,
+            }
+            # 未執行 build 階段時，第一次查詢會透過 load_or_build_cache 建立快取
+            if "build" in phases:
+                report["build"] = run_build(timer)
+            if "single" in phases:
+                report["single"] = run_single(args, timer, queries, names)
+            if "multi" in phases:
+                report["multi"] = run_multi(args, timer, stub, scenes)
+            report["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"✅ 結果已寫入 {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+各階段計時與 Roboflow stub。
+
+instrument() 把 backend 模組中各階段使用的函式替換成計時包裝（直接替換模組屬性，
+呼叫端不需修改）；Roboflow 偵測與分類改由本機 stub 回應，偵測框由 set_scene() 指定。
+同一階段可能在多個執行緒同時執行（例如分類在網路執行緒池、SIFT 在本機），
+各階段的耗時分開記錄，總和不等於端到端延遲。
+"""
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+import numpy as np
+
+# 階段名稱 → [(模組, 屬性), ...]
+STAGES = {
+    "decode": [("backend.matcher", "decode"), ("backend.crop", "decode"),
+               ("backend.multi_matcher", "decode_image")],
+    "detect": [("backend.crop", "detect_scaled")],
+    "local_detect": [("backend.local_detector", "detect")],
+    "classify": [("backend.matcher", "get_card_classes")],
+    "sift": [("backend.matcher", "detect_and_compute"), ("backend.feature_extractor", "detect_and_compute")],
+    "index_load": [("backend.category_router", "get_index"), ("backend.multi_matcher", "get_index")],
+    "voting": [("backend.category_router", "vote"), ("backend.multi_matcher", "vote"),
+               ("backend.multi_matcher", "vote_batched")],
+    "verify": [("backend.category_router", "verify_candidates"),
+               ("backend.multi_matcher", "verify_candidates")],
+    "info_lookup": [("backend.matcher", "lookup_card"), ("backend.multi_matcher", "lookup_card")],
+    "render": [("backend.multi_matcher", "render_multi_result")],
+    "build_cache": [("backend.image_processing", "build_cache")],
+    "build_index": [("backend.index_registry", "build_index")],
+}
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def summarize(values):
+    """ 毫秒數列 → 次數、p50 / p95 / 平均 / 總和 """
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "mean_ms": float(np.mean(values)) if values else None,
+        "total_ms": float(np.sum(values)) if values else 0.0,
+    }
+
+
+class Timer:
+    """ 各階段的耗時（毫秒），多執行緒共用 """
+
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, stage, ms):
+        with self._lock:
+            self._samples[stage].append(ms)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        timed.__wrapped__ = fn
+        return timed
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def report(self):
+        with self._lock:
+            return {name: summarize(values) for name, values in sorted(self._samples.items())}
+
+
+class _TimedIndex:
+    """ FAISS 索引的代理：search 計入 index_search 階段，其餘屬性直接轉交 """
+
+    def __init__(self, index, timer):
+        self._index = index
+        self._timer = timer
+
+    def search(self, *args, **kwargs):
+        with self._timer.stage("index_search"):
+            return self._index.search(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._index, name)
+
+
+class RoboflowStub:
+    """
+    本機取代 Roboflow：分類一律回傳 category（信心 0.99）；偵測回傳 set_scene() 指定的偵測框，
+    並依收到的圖片尺寸（可能是縮小版本）換算座標。latency_ms 模擬網路往返時間。
+    """
+
+    def __init__(self, category, latency_ms=0.0):
+        self.category = category
+        self.latency = latency_ms / 1000
+        self._scene = ((1, 1), [])
+        self._lock = threading.Lock()
+
+    def set_scene(self, size, boxes):
+        """ size 為場景原圖 (寬, 高)；boxes 為原圖座標的偵測框（中心點 x, y 與寬高） """
+        with self._lock:
+            self._scene = (size, list(boxes))
+
+    def classify(self, image, *args, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return [(self.category, 0.99)]
+
+    def detect(self, image, *args, **kwargs):
+        from backend.prescale import image_size
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            (width, _), boxes = self._scene
+        if isinstance(image, np.ndarray):
+            received = image.shape[1]
+        else:
+            received = (image_size(image) or (width, None))[0]
+        scale = received / width
+        return {"predictions": [
+            {**{k: box[k] * scale for k in ("x", "y", "width", "height")},
+             "class": "card", "confidence": 0.99}
+            for box in boxes
+        ]}
+
+
+def instrument(timer, stub):
+    """ 替換 backend 模組屬性：各階段計時，Roboflow 改為 stub """
+    import importlib
+    importlib.import_module("backend.crop").get_roboflow_predictions = stub.detect
+    importlib.import_module("backend.matcher").get_card_classes = stub.classify
+
+    for name, targets in STAGES.items():
+        for module_name, attr in targets:
+            module = importlib.import_module(module_name)
+            fn = getattr(module, attr)
+            if name == "index_load":
+                setattr(module, attr, _timed_get_index(timer, fn))
+            else:
+                setattr(module, attr, timer.wrap(name, fn))
+
+
+def _timed_get_index(timer, get_index):
+    def timed(*args, **kwargs):
+        with timer.stage("index_load"):
+            index = get_index(*args, **kwargs)
+        return _TimedIndex(index, timer)
+    return timed
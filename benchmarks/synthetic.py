@@ -0,0 +1,224 @@
+"""
+可重現的合成圖庫與查詢集。
+
+圖庫卡圖取自 data/gallery/{category}（依 seed 抽樣），沒有可用的圖片時以程式產生。
+查詢圖對卡圖做旋轉、透視、模糊、反光與 JPEG 壓縮後放到背景上；
+多卡場景把多張卡排在同一張照片中，並記錄每張卡的實際位置供 stub 偵測使用。
+"""
+import os
+import shutil
+import hashlib
+import cv2
+import numpy as np
+
+CARD_SIZE = (421, 614)  # (寬, 高)，與 ygoprodeck 卡圖相同
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def _procedural_card(rng):
+    img = np.full((CARD_SIZE[1], CARD_SIZE[0], 3), rng.integers(120, 220), np.uint8)
+    for _ in range(60):
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        if rng.random() < 0.5:
+            center = tuple(int(v) for v in rng.integers(0, min(CARD_SIZE), 2))
+            cv2.circle(img, center, int(rng.integers(5, 45)), color, -1)
+        else:
+            p1 = tuple(int(v) for v in rng.integers(0, CARD_SIZE[0], 2))
+            p2 = tuple(int(v) for v in rng.integers(0, CARD_SIZE[1], 2))
+            cv2.rectangle(img, p1, p2, color, int(rng.integers(1, 4)))
+    cv2.putText(img, str(int(rng.integers(0, 10 ** 6))), (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 0), 3)
+    return img
+
+
+def source_images(source_dir):
+    """
+    source_dir 底下（含子目錄，例如 data/gallery/{category}）所有圖檔的路徑；
+    同一張卡圖常同時出現在多個類別目錄，內容相同的檔案只保留一個
+    """
+    paths, seen = [], set()
+    if source_dir and os.path.isdir(source_dir):
+        for root, _, files in sorted(os.walk(source_dir)):
+            for f in sorted(files):
+                if not f.lower().endswith(IMAGE_EXTS):
+                    continue
+                path = os.path.join(root, f)
+                with open(path, "rb") as fh:
+                    digest = hashlib.sha1(fh.read()).hexdigest()
+                if digest not in seen:
+                    seen.add(digest)
+                    paths.append(path)
+    return sorted(paths)
+
+
+def build_gallery(workdir, source_dir, n_cards, category, seed=0):
+    """
+    在 workdir/gallery/{category} 建立 n_cards 張卡圖與對應的 cards_info，
+    回傳 {卡號: 卡圖 ndarray}
+    """
+    rng = np.random.default_rng(seed)
+    gallery_dir = os.path.join(workdir, "gallery", category)
+    info_dir = os.path.join(workdir, "cards_info")
+    for d in (gallery_dir, info_dir, os.path.join(workdir, "cache")):
+        os.makedirs(d, exist_ok=True)
+
+    sources = source_images(source_dir)
+    if len(sources) > n_cards:
+        sources = [sources[i] for i in sorted(rng.choice(len(sources), n_cards, replace=False))]
+
+    cards = {}
+    for i in range(n_cards):
+        card_id = f"{90000000 + i:08d}"
+        img = None
+        if i < len(sources):
+            img = cv2.imread(sources[i])
+        if img is None:
+            img = _procedural_card(rng)
+        img = cv2.resize(img, CARD_SIZE, interpolation=cv2.INTER_AREA)
+        cv2.imwrite(os.path.join(gallery_dir, f"{card_id}.jpg"), img)
+        with open(os.path.join(info_dir, f"{card_id}_bench.txt"), "w", encoding="utf-8") as f:
+            f.write(f"中文名: 測試卡{i}\n日文名: テストカード{i}\n類型: 效果怪獸\n"
+                    f"圖片 URL: https://example.com/{card_id}.jpg\n")
+        cards[card_id] = img
+    return cards
+
+
+# 卡框顏色（BGR），與實際卡片的外框色相近
+FRAME_COLORS = {
+    "normal": (60, 200, 230), "effect": (40, 120, 220), "fusion": (160, 80, 150), "synchro": (235, 235, 235),
+    "xyz": (25, 25, 25), "link": (180, 90, 30), "spell": (130, 150, 40), "trap": (120, 50, 170),
+}
+
+
+def frame_card(rng, color):
+    """ 指定外框顏色的卡圖：外框與卡名列為框色（加上些微色差），中間為插圖與效果欄 """
+    art = _procedural_card(rng)
+    frame = np.clip(np.array(color) + rng.normal(0, 12, 3), 0, 255)
+    card = np.empty_like(art)
+    card[:] = frame
+    card[90:430, 45:376] = art[90:430, 45:376]
+    card[450:585, 30:391] = (200, 220, 225)
+    cv2.rectangle(card, (25, 20), (396, 70), tuple(int(v * 0.9) for v in frame), -1)
+    return card
+
+
+def frame_dataset(workdir, per_category, photos, seed=0):
+    """
+    分類用的合成資料：workdir/gallery/{類別} 放 per_category 張卡圖（訓練用），
+    workdir/labeled/{類別} 放 photos 張另外產生、拍成照片的卡（評估用）。回傳標註目錄
+    """
+    rng = np.random.default_rng(seed)
+    labeled_dir = os.path.join(workdir, "labeled")
+    for category, color in FRAME_COLORS.items():
+        gallery_dir = os.path.join(workdir, "gallery", category)
+        photo_dir = os.path.join(labeled_dir, category)
+        os.makedirs(gallery_dir, exist_ok=True)
+        os.makedirs(photo_dir, exist_ok=True)
+        for i in range(per_category):
+            cv2.imwrite(os.path.join(gallery_dir, f"{category}{i}.jpg"), frame_card(rng, color))
+        for i in range(photos):
+            warped, mask = warp_card(frame_card(rng, color), rng)
+            canvas = _background(mask.shape[0] + 60, mask.shape[1] + 60, rng)
+            _paste(canvas, warped, mask, 30, 30)
+            with open(os.path.join(photo_dir, f"{i}.jpg"), "wb") as f:
+                f.write(augment_photo(canvas, rng))
+    return labeled_dir
+
+
+def reset_cache(workdir):
+    """ 清空工作區的快取（特徵、索引與價格） """
+    cache_dir = os.path.join(workdir, "cache")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.makedirs(cache_dir, exist_ok=True)
+
+
+# ---------- 擴增 ----------
+
+def _glare(img, rng):
+    h, w = img.shape[:2]
+    cx, cy = rng.uniform(0.2, 0.8) * w, rng.uniform(0.2, 0.8) * h
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    sigma = rng.uniform(0.1, 0.3) * max(h, w)
+    mask = np.exp(-((xx - cx) ** 2 + (yy - cy) ** 2) / (2 * sigma ** 2)) * rng.uniform(60, 140)
+    return np.clip(img.astype(np.float32) + mask[..., None], 0, 255).astype(np.uint8)
+
+
+def warp_card(card, rng, scale=1.0):
+    """ 旋轉 + 透視 + 縮放後的卡片與其 alpha 遮罩 """
+    h, w = card.shape[:2]
+    out_w, out_h = int(w * scale * 1.4), int(h * scale * 1.4)
+    jitter = 0.06 * np.array([w, h])
+    src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    dst = (src + rng.uniform(-1, 1, (4, 2)) * jitter) * scale
+    angle = np.deg2rad(rng.uniform(-8, 8))
+    rot = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    dst = (dst - dst.mean(0)) @ rot.T + [out_w / 2, out_h / 2]
+    M = cv2.getPerspectiveTransform(src, dst.astype(np.float32))
+    warped = cv2.warpPerspective(card, M, (out_w, out_h))
+    mask = cv2.warpPerspective(np.full((h, w), 255, np.uint8), M, (out_w, out_h))
+    return warped, mask
+
+
+def augment_photo(img, rng, jpeg_range=(40, 90)):
+    """ 模糊、反光與 JPEG 壓縮 → JPEG 位元組 """
+    sigma = rng.uniform(0, 1.5)
+    if sigma > 0.3:
+        img = cv2.GaussianBlur(img, (0, 0), sigma)
+    if rng.random() < 0.5:
+        img = _glare(img, rng)
+    quality = int(rng.integers(*jpeg_range))
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def _background(h, w, rng):
+    bg = np.empty((h, w, 3), np.uint8)
+    bg[:] = rng.integers(30, 90, 3)
+    noise = rng.normal(0, 6, (h, w, 1))
+    return np.clip(bg + noise, 0, 255).astype(np.uint8)
+
+
+def _paste(canvas, warped, mask, x, y):
+    h, w = mask.shape
+    region = canvas[y:y + h, x:x + w]
+    m = (mask[:region.shape[0], :region.shape[1]] > 0)[..., None]
+    region[:] = np.where(m, warped[:region.shape[0], :region.shape[1]], region)
+    ys, xs = np.nonzero(mask[:region.shape[0], :region.shape[1]])
+    return {"x": x + (xs.min() + xs.max()) / 2, "y": y + (ys.min() + ys.max()) / 2,
+            "width": float(xs.max() - xs.min()), "height": float(ys.max() - ys.min())}
+
+
+def single_queries(cards, n_queries, seed=0, photo_scale=2.0):
+    """ [(卡號, JPEG 位元組), ...]：每張查詢圖是一張卡佔大部分畫面的照片 """
+    rng = np.random.default_rng(seed + 1)
+    ids = sorted(cards)
+    queries = []
+    for q in range(n_queries):
+        card_id = ids[int(rng.integers(len(ids)))]
+        warped, mask = warp_card(cards[card_id], rng, photo_scale)
+        canvas = _background(mask.shape[0] + 40, mask.shape[1] + 40, rng)
+        _paste(canvas, warped, mask, 20, 20)
+        queries.append((card_id, augment_photo(canvas, rng)))
+    return queries
+
+
+def multi_scenes(cards, n_scenes, cards_per_scene, seed=0, card_scale=1.2):
+    """
+    [(JPEG 位元組, (寬, 高), [(卡號, 偵測框), ...]), ...]：
+    多張卡排成格狀的照片，偵測框為實際位置（中心點 x, y 與寬高）
+    """
+    rng = np.random.default_rng(seed + 2)
+    ids = sorted(cards)
+    cols = int(np.ceil(np.sqrt(cards_per_scene)))
+    rows = int(np.ceil(cards_per_scene / cols))
+    cell_w, cell_h = int(CARD_SIZE[0] * card_scale * 1.5), int(CARD_SIZE[1] * card_scale * 1.5)
+    scenes = []
+    for s in range(n_scenes):
+        canvas = _background(rows * cell_h, cols * cell_w, rng)
+        truth = []
+        for k in range(cards_per_scene):
+            card_id = ids[int(rng.integers(len(ids)))]
+            warped, mask = warp_card(cards[card_id], rng, card_scale)
+            x = (k % cols) * cell_w + max(0, (cell_w - mask.shape[1]) // 2)
+            y = (k // cols) * cell_h + max(0, (cell_h - mask.shape[0]) // 2)
+            truth.append((card_id, _paste(canvas, warped, mask, x, y)))
+        scenes.append((augment_photo(canvas, rng, (60, 95)), (canvas.shape[1], canvas.shape[0]), truth))
+    return scenes
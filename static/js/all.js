@@ -20,26 +20,104 @@ window.onload = () => {
     const formData = new FormData();
     formData.append('image', file);
 
-    fetch('/match_all', {
+    const result = document.getElementById('cardResult');
+    const showResult = html => {
+        if (result) {
+            result.innerHTML = html;
+            updateCardListLayout();
+            loadPrices();
+        }
+    };
+
+    // 送出背景工作，再以 SSE 接收每張裁切圖的進度與最終結果
+    fetch('/jobs', {
         method: 'POST',
         body: formData
     })
-        .then(response => response.text())
-        .then(html => {
-            const result = document.getElementById('cardResult');
-            if (result) {
-                result.innerHTML = html;
-                sessionStorage.removeItem('uploadedImage');
-                updateCardListLayout();
-            }
+        .then(async response => {
+            const data = await response.json();
+            if (!response.ok) throw new Error(data.error || response.statusText);
+            sessionStorage.removeItem('uploadedImage');
+
+            const source = new EventSource(data.stream_url);
+            source.addEventListener('progress', e => {
+                const event = JSON.parse(e.data);
+                if (!result) return;
+                if (event.stage === 'detected') {
+                    result.innerHTML = `🔍 偵測到 ${event.total} 張卡片，辨識中...`;
+                } else if (event.stage === 'crop') {
+                    result.innerHTML = `🔍 已辨識 ${event.done} / ${event.total} 張卡片...`;
+                }
+            });
+            source.addEventListener('done', e => {
+                source.close();
+                showResult(JSON.parse(e.data).result_html);
+            });
+            source.addEventListener('error', e => {
+                source.close();
+                const message = e.data ? JSON.parse(e.data).error : '❌ 連線中斷';
+                if (result) result.innerHTML = message;
+            });
         })
         .catch(err => {
             console.error('❌ 發送資料失敗', err);
-            const result = document.getElementById('cardResult');
-            if (result) result.innerHTML = '❌ 發送資料失敗';
+            if (result) result.innerHTML = `❌ 發送資料失敗：${err.message}`;
         });
 };
 
+// 批次查詢所有卡片的價格，伺服器每完成一張就回傳一行 JSON
+function loadPrices() {
+    const items = Array.from(document.querySelectorAll('.card-item[data-card-name-jp]'))
+        .filter(el => el.dataset.cardNameJp);
+    if (items.length === 0) return;
+
+    const byName = {};
+    items.forEach(el => {
+        const loading = document.createElement('i');
+        loading.className = 'priceLoading';
+        loading.style.color = 'gray';
+        loading.textContent = '🔍 正在查詢價格...';
+        el.querySelector('.card-text').appendChild(loading);
+        (byName[el.dataset.cardNameJp] ||= []).push(el);
+    });
+
+    const showPrice = line => {
+        if (!line.trim()) return;
+        const priceData = JSON.parse(line);
+        (byName[priceData.card_name_jp] || []).forEach(el => {
+            el.querySelector('.priceLoading')?.remove();
+            el.querySelector('.card-text').insertAdjacentHTML('beforeend', priceData.price_html);
+        });
+    };
+
+    fetch('/get_prices', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ card_names_jp: Object.keys(byName) })
+    })
+        .then(async response => {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                lines.forEach(showPrice);
+            }
+            showPrice(buffer);
+        })
+        .catch(err => {
+            console.warn("⚠️ 價格查詢失敗", err);
+            document.querySelectorAll('.priceLoading').forEach(el => {
+                el.textContent = "⚠️ 價格查詢失敗";
+                el.style.color = "orange";
+            });
+        });
+}
+
 // 萃取主分類
 function parseCategory(text) {
     const lines = text.split('<br>').map(line => line.trim());
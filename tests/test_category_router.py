@@ -0,0 +1,80 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backend import category_router
+
+
+class _Index:
+    """ 每個查詢描述子的最近鄰都是第 0 張圖（全部通過 ratio test） """
+
+    def search(self, des, k):
+        n = len(des)
+        return np.tile([0.1, 1.0], (n, 1)).astype("float32"), np.zeros((n, 2), dtype="int64")
+
+
+def _gallery(category):
+    return SimpleNamespace(category=category, all_desc=None, live_ids=None,
+                           image_ids=np.arange(4), names=["a", "b", "c", "d"])
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(category_router, "GEOMETRIC_VERIFY", False)
+    indexed = []
+
+    def get_index(category, all_desc, live_ids):
+        indexed.append(category)
+        return _Index()
+
+    monkeypatch.setattr(category_router, "get_index", get_index)
+    pool = ThreadPoolExecutor(max_workers=3)
+    monkeypatch.setattr(category_router, "_pool", pool)
+    yield indexed
+    pool.shutdown(wait=True)
+
+
+def test_category_without_gallery_is_skipped(router, monkeypatch):
+    def get_gallery(category):
+        if category == "normal":
+            raise FileNotFoundError("圖片目錄不存在")
+        return _gallery(category)
+
+    monkeypatch.setattr(category_router, "get_gallery", get_gallery)
+    des = np.zeros((3, 128), dtype="float32")  # 票數不足以成為決定性結果，兩個類別都會等到
+    match = category_router.route([("effect", 0.6), ("normal", 0.4)], None, des)
+
+    assert match.category == "effect"
+    assert match.searched == ("effect",)
+
+
+def test_only_missing_galleries_raise(router, monkeypatch):
+    def get_gallery(category):
+        raise FileNotFoundError("圖片目錄不存在")
+
+    monkeypatch.setattr(category_router, "get_gallery", get_gallery)
+    with pytest.raises(ValueError):
+        category_router.route([("normal", 0.95)], None, np.zeros((3, 128), dtype="float32"))
+
+
+def test_decisive_result_cancels_remaining_categories(router, monkeypatch):
+    released = threading.Event()
+
+    def get_gallery(category):
+        if category != "effect":
+            released.wait(timeout=5)  # 其餘類別在載入圖庫時卡住，直到 effect 已決定結果
+        return _gallery(category)
+
+    monkeypatch.setattr(category_router, "get_gallery", get_gallery)
+    des = np.zeros((20, 128), dtype="float32")
+    shards, outcome = category_router._fan_out(["effect", "normal", "fusion"], None, des)
+    released.set()
+    category_router._pool.shutdown(wait=True)
+
+    assert outcome == "decisive"
+    assert shards[0].candidates == [(0, 20)]
+    assert shards[1:] == [None, None]
+    assert router == ["effect"]  # 取消後不再搜尋其他類別的索引
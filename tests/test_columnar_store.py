@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from backend import columnar_store
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar_store, "CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _images(n, rows, value, dtype="float32"):
+    descs = [np.full((rows, 128), value, dtype=dtype) for _ in range(n)]
+    attrs = [[(1.0, 2.0, 3.0, 4.0)] * rows for _ in range(n)]
+    names = [f"{i}.jpg" for i in range(n)]
+    return names, names, attrs, descs
+
+
+def test_rebuild_keeps_open_memmap_intact(cache_dir):
+    columnar_store.write_store("effect", *_images(3, 10, 7))
+    old = columnar_store.open_store("effect")
+
+    columnar_store.write_store("effect", *_images(1, 2, 9))
+
+    assert old["descriptors"].shape == (30, 128)
+    assert np.all(old["descriptors"] == 7)
+    new = columnar_store.open_store("effect")
+    assert new["descriptors"].shape == (2, 128)
+    assert np.all(new["descriptors"] == 9)
+
+
+def test_append_rejects_descriptors_the_store_dtype_cannot_hold(cache_dir):
+    columnar_store.write_store("effect", *_images(2, 5, 7), dtype="uint8")
+    paths, names, attrs, descs = _images(1, 5, 0.25)
+
+    with pytest.raises(ValueError):
+        columnar_store.append_store("effect", paths, names, attrs, descs)
+    assert columnar_store.read_meta("effect")["count"] == 10
@@ -0,0 +1,89 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from backend import columnar_store, image_processing, incremental_update, index_registry
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    cache, gallery = tmp_path / "cache", tmp_path / "gallery"
+    (gallery / "effect").mkdir(parents=True)
+    cache.mkdir()
+    for module in (columnar_store, image_processing, incremental_update, index_registry):
+        monkeypatch.setattr(module, "CACHE_DIR", str(cache))
+    for module in (image_processing, incremental_update):
+        monkeypatch.setattr(module, "GALLERY_DIR", str(gallery))
+    return gallery / "effect"
+
+
+def _features(n):
+    return [(1.0, 2.0, 3.0, 4.0)] * n, np.full((n, 128), 5, dtype="float32")
+
+
+def test_new_images_use_the_store_extraction_settings(data_dir, monkeypatch):
+    (data_dir / "old.jpg").write_bytes(b"old")
+    attrs, des = _features(4)
+    columnar_store.write_store("effect", [str(data_dir / "old.jpg")], ["old.jpg"], [attrs], [des],
+                               extra={"max_keypoints": 300, "grid": 4, "root_sift": False})
+    incremental_update.save_manifest("effect", incremental_update._bootstrap_manifest(
+        "effect", [str(data_dir / "old.jpg")], ["old.jpg"]))
+    (data_dir / "new.jpg").write_bytes(b"new")
+
+    calls = []
+
+    def fake_extract(paths, desc=None, **settings):
+        calls.append(settings)
+        return [_features(3) for _ in paths]
+
+    monkeypatch.setattr(incremental_update, "extract_paths", fake_extract)
+    incremental_update.update_category("effect")
+
+    assert calls == [{"max_keypoints": 300, "grid": 4, "use_root_sift": False}]
+    assert columnar_store.read_meta("effect")["count"] == 7
+
+
+def _two_image_cache(data_dir):
+    paths = []
+    for name in ("a.jpg", "b.jpg"):
+        (data_dir / name).write_bytes(name.encode())
+        paths.append(str(data_dir / name))
+    attrs, des = _features(4)
+    columnar_store.write_store("effect", paths, ["a.jpg", "b.jpg"], [attrs, attrs], [des, des])
+    incremental_update.save_manifest("effect", incremental_update._bootstrap_manifest(
+        "effect", paths, ["a.jpg", "b.jpg"]))
+    return np.vstack([des, des])
+
+
+def test_touched_files_do_not_bump_the_version(data_dir):
+    _two_image_cache(data_dir)
+    st = (data_dir / "a.jpg").stat()
+    os.utime(data_dir / "a.jpg", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    assert incremental_update.update_category("effect") == 0
+    manifest = incremental_update.load_manifest("effect")
+    assert manifest["files"]["a.jpg"]["mtime_ns"] == st.st_mtime_ns + 10**9
+
+
+def test_index_with_explicit_ids_is_patched(data_dir):
+    vectors = _two_image_cache(data_dir)
+    index = index_registry.create_index("Flat", vectors, np.arange(len(vectors), dtype="int64"))
+    faiss.write_index(index, index_registry.index_path("effect"))
+    (data_dir / "a.jpg").unlink()
+
+    assert incremental_update.update_category("effect") == 1
+    index = faiss.read_index(index_registry.index_path("effect"))
+    assert faiss.vector_to_array(index.id_map).tolist() == [4, 5, 6, 7]
+
+
+def test_index_without_ids_is_rebuilt(data_dir):
+    vectors = _two_image_cache(data_dir)
+    index = faiss.IndexFlatL2(128)
+    index.add(vectors)  # id 即儲存順序，移除 a 的列會讓 b 的描述子重新編號
+    faiss.write_index(index, index_registry.index_path("effect"))
+    (data_dir / "a.jpg").unlink()
+
+    assert incremental_update.update_category("effect") == 1
+    assert not os.path.exists(index_registry.index_path("effect"))
@@ -0,0 +1,85 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from backend import inference_client
+
+PREDICTIONS = {"predictions": [{"class": "effect", "confidence": 0.9}]}
+
+
+class _Stub(BaseHTTPRequestHandler):
+    """ 本機的 Roboflow stub：/ok 正常回應、/flaky 第一次回 503、/slow 超過讀取逾時才回應 """
+    hits = {}
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.split("?")[0]
+        _Stub.hits[path] = _Stub.hits.get(path, 0) + 1
+        if path == "/flaky" and _Stub.hits[path] == 1:
+            self._reply(503, {"error": "busy"})
+        elif path == "/slow":
+            time.sleep(1.0)
+            self._reply(200, PREDICTIONS)
+        else:
+            self._reply(200, PREDICTIONS)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    _Stub.hits = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(inference_client, "ROBOFLOW_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(inference_client, "READ_TIMEOUT", 0.2)
+    monkeypatch.setattr(inference_client, "MAX_RETRIES", 2)
+    monkeypatch.setattr(inference_client, "BACKOFF_FACTOR", 0)
+    monkeypatch.setattr(inference_client, "_session", None)
+    yield _Stub.hits
+    server.shutdown()
+    server.server_close()
+
+
+def test_infer_returns_predictions(stub):
+    assert inference_client.infer("ok", b"jpeg", 0.5) == PREDICTIONS
+    assert inference_client.infer("ok", b"jpeg", 0.5) == PREDICTIONS
+    assert stub["/ok"] == 2
+
+
+def test_infer_retries_503(stub):
+    assert inference_client.infer("flaky", b"jpeg", 0.5) == PREDICTIONS
+    assert stub["/flaky"] == 2
+
+
+def test_infer_read_timeout_raises(stub):
+    start = time.perf_counter()
+    with pytest.raises(requests.RequestException):
+        inference_client.infer("slow", b"jpeg", 0.5)
+    assert time.perf_counter() - start < 2.0  # 每次嘗試在讀取逾時後放棄，不等到 stub 回應
+
+
+def test_infer_connection_refused_raises(monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    monkeypatch.setattr(inference_client, "ROBOFLOW_URL", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(inference_client, "BACKOFF_FACTOR", 0)
+    monkeypatch.setattr(inference_client, "_session", None)
+    with pytest.raises(requests.ConnectionError):
+        inference_client.infer("ok", b"jpeg", 0.5)
@@ -0,0 +1,106 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from backend import jobs
+
+
+@pytest.fixture
+def recognize(monkeypatch):
+    """ 假的多卡辨識：送出一筆進度後等待 release，再送出第二筆並回傳結果 """
+    started, release = threading.Event(), threading.Event()
+
+    def fake(image_data, on_progress=None):
+        on_progress({"index": 0, "matched": "1.jpg"})
+        started.set()
+        release.wait(timeout=5)
+        if image_data == b"bad":
+            raise ValueError("無法讀取圖片")
+        on_progress({"index": 1, "matched": "2.jpg"})
+        return "<p>ok</p>"
+
+    monkeypatch.setattr(jobs, "recognize_multi_cards", fake)
+    return started, release
+
+
+def test_job_runs_to_completion(recognize):
+    started, release = recognize
+    job = jobs.submit(b"image")
+    assert started.wait(timeout=5)
+    snap = job.snapshot()
+    assert snap["status"] == "running"
+    assert [e["index"] for e in snap["events"]] == [0]
+
+    release.set()
+    snap = job.wait(1, timeout=5)
+    while snap["status"] != "done":
+        snap = job.wait(snap["next"], timeout=5)
+    assert job.snapshot(1)["events"] == [{"index": 1, "matched": "2.jpg"}]
+    assert snap["result_html"] == "<p>ok</p>"
+    assert jobs.get(job.id) is job
+
+
+def test_status_change_wakes_waiters():
+    job = jobs.Job(b"image")
+    woke = threading.Event()
+
+    def waiter():
+        with job._cond:
+            if job._cond.wait_for(lambda: job.status == "running", timeout=5):
+                woke.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    job._start()
+    thread.join(timeout=5)
+    assert woke.is_set()
+
+
+def test_full_queue_rejects_new_jobs(monkeypatch):
+    monkeypatch.setattr(jobs, "_start_workers", lambda: None)
+    monkeypatch.setattr(jobs, "_queue", queue.Queue(maxsize=1))
+    first = jobs.submit(b"1")
+    with pytest.raises(jobs.QueueFull):
+        jobs.submit(b"2")
+    assert jobs.get(first.id) is first
+    assert jobs.stats()["queued"] == 1
+
+
+def test_finished_jobs_expire(monkeypatch):
+    job = jobs.Job(b"image")
+    job._finish("done", result_html="<p>ok</p>")
+    with jobs._lock:
+        jobs._jobs[job.id] = job
+    assert jobs.get(job.id) is job
+
+    job.finished = time.time() - jobs.JOB_TTL - 1
+    assert jobs.get(job.id) is None
+
+
+@pytest.fixture
+def client():
+    from app import app
+    return app.test_client()
+
+
+def test_stream_sends_progress_then_result(recognize, client):
+    started, release = recognize
+    release.set()
+    job = jobs.submit(b"image")
+
+    body = client.get(f"/jobs/{job.id}/stream").get_data(as_text=True)
+    assert body.count("event: progress") == 2
+    assert body.rstrip().splitlines()[-2:] == ["event: done", 'data: {"result_html": "<p>ok</p>"}']
+
+
+def test_stream_reports_errors(recognize, client):
+    started, release = recognize
+    release.set()
+    job = jobs.submit(b"bad")
+
+    body = client.get(f"/jobs/{job.id}/stream").get_data(as_text=True)
+    assert "event: error" in body
+    assert "無法讀取圖片" in body
+    assert client.get("/jobs/unknown").status_code == 404
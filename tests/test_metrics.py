@@ -0,0 +1,32 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import metrics
+
+
+def test_bind_runs_concurrently_and_records_into_request(monkeypatch):
+    monkeypatch.setattr(metrics, "SERVER_TIMING", True)
+    timings = []
+    token = metrics._request_timings.set(timings)
+    try:
+        barrier = threading.Barrier(4)
+
+        def work(i):
+            barrier.wait(timeout=5)  # 四個工作同時執行，確認不會共用同一個 Context
+            with metrics.stage("sift"):
+                return i
+
+        bound = metrics.bind(work)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = [f.result() for f in [pool.submit(bound, i) for i in range(8)]]
+    finally:
+        metrics._request_timings.reset(token)
+
+    assert results == list(range(8))
+    assert [name for name, _ in timings] == ["sift"] * 8
+
+
+def test_bind_without_request_returns_fn():
+    def work():
+        return 1
+    assert metrics.bind(work) is work
@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+import pytest
+
+from backend import multi_matcher
+
+
+@pytest.fixture
+def gallery(monkeypatch):
+    monkeypatch.setattr(multi_matcher, "GEOMETRIC_VERIFY", False)
+    rng = np.random.default_rng(2)
+    all_desc = rng.random((10 * 50, 128)).astype("float32")
+    index = faiss.IndexFlatL2(128)
+    index.add(all_desc)
+    gallery = SimpleNamespace(all_desc=all_desc, image_ids=np.repeat(np.arange(10), 50),
+                              names=[f"{i}.jpg" for i in range(10)])
+    return index, gallery
+
+
+def _crop(gallery, image_idx, n, rng):
+    """ 取某張圖庫圖片的描述子加上雜訊，模擬拍到同一張卡 """
+    des = gallery.all_desc[image_idx * 50:image_idx * 50 + n]
+    return [object()] * n, des + rng.normal(0, 0.01, des.shape).astype("float32")
+
+
+def test_batched_search_matches_per_crop_search(gallery):
+    index, gallery = gallery
+    rng = np.random.default_rng(3)
+    results = [_crop(gallery, 3, 30, rng), ([], None), _crop(gallery, 7, 20, rng), _crop(gallery, 0, 1, rng)]
+
+    batched = multi_matcher.match_crops(results, index, gallery, batched=True)
+    single = multi_matcher.match_crops(results, index, gallery, batched=False)
+    assert batched == single == ["3.jpg", None, "7.jpg", None]
@@ -0,0 +1,112 @@
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from backend import price_service
+
+
+class _Driver:
+    def __init__(self):
+        self.pages_served = 0
+
+    def quit(self):
+        pass
+
+
+def test_waiter_gets_new_browser_after_discard(monkeypatch):
+    pool = price_service.BrowserPool(size=1)
+    monkeypatch.setattr(pool, "_new_driver", _Driver)
+    got = []
+
+    def waiter():
+        with pool.browser() as driver:
+            got.append(driver)
+
+    def failing_borrower():
+        with pool.browser():
+            thread.start()
+            while not pool._available._waiters:  # 等到 waiter 進入等待
+                time.sleep(0.01)
+            raise RuntimeError("page crashed")
+
+    thread = threading.Thread(target=waiter)
+    with pytest.raises(RuntimeError):
+        failing_borrower()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert len(got) == 1
+    assert pool._created == 1
+
+
+class _Page(_Driver):
+    """ 假的搜尋結果頁：cells 為價格欄位文字，body 為整頁文字 """
+
+    def __init__(self, cells=(), body=""):
+        super().__init__()
+        self.cells, self.body = cells, body
+        self.page_source = "".join(f'<td class="text-end">{c}</td>' for c in cells)
+
+    def get(self, url):
+        pass
+
+    def find_elements(self, by, selector):
+        return [SimpleNamespace(text=c) for c in self.cells]
+
+    def find_element(self, by, selector):
+        return SimpleNamespace(text=self.body)
+
+
+@pytest.fixture
+def prices(tmp_path, monkeypatch):
+    monkeypatch.setattr(price_service, "DB_PATH", str(tmp_path / "prices.sqlite3"))
+    monkeypatch.setattr(price_service, "_db_ready", None)
+    monkeypatch.setattr(price_service, "PAGE_TIMEOUT", 0.5)
+
+    def serve(page):
+        pool = price_service.BrowserPool(size=1)
+        monkeypatch.setattr(pool, "_new_driver", lambda: page)
+        monkeypatch.setattr(price_service, "_pool", pool)
+    return serve
+
+
+def test_price_found(prices):
+    prices(_Page(cells=["1,280円"]))
+    assert price_service.get_price("カード") == 1280
+    assert price_service.cached_price("カード") == (True, 1280)
+
+
+def test_no_results_marker_is_cached_as_miss_without_waiting(prices):
+    prices(_Page(body=f"トレカ {price_service.NO_RESULTS_TEXTS[0]}"))
+    start = time.perf_counter()
+    assert price_service.get_price("カード") is None
+    assert time.perf_counter() - start < price_service.PAGE_TIMEOUT
+    assert price_service.cached_price("カード") == (True, None)
+
+
+def test_timeout_is_not_cached(prices):
+    page = _Page(body="読み込み中")
+    prices(page)
+    with pytest.raises(TimeoutError):
+        price_service.fetch_price("カード")
+    assert price_service.get_price("カード") is None
+    assert price_service.cached_price("カード") == (False, None)
+    assert price_service._pool._idle == [page]  # 逾時不是瀏覽器的問題，照常歸還
+
+
+def test_tables_are_created_once(prices, monkeypatch):
+    statements = []
+    connect = price_service.sqlite3.connect
+
+    def traced(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(price_service.sqlite3, "connect", traced)
+    for i in range(3):
+        price_service.store_price(f"カード{i}", i)
+        price_service.cached_price(f"カード{i}")
+    assert sum("CREATE TABLE" in s for s in statements) == 2
@@ -0,0 +1,42 @@
+import numpy as np
+
+from backend import result_cache
+
+
+def test_entry_goes_stale_when_any_searched_category_changes(monkeypatch):
+    signatures = {"effect": 1, "normal": 1}
+    monkeypatch.setattr(result_cache, "gallery_tag", lambda category: (category, signatures[category], None))
+    cache = result_cache.ResultCache("test")
+    key = result_cache.image_key(np.zeros((8, 8, 3), np.uint8))
+
+    cache.put(key, "card", result_cache.gallery_tags(["effect", "normal"]))
+    assert cache.get(key) == "card"
+
+    signatures["normal"] = 2  # 只重建了非最佳結果所在的類別
+    assert cache.get(key) is None
+
+
+def _key(sha1, phash):
+    return result_cache.ImageKey(sha1, phash)
+
+
+def test_perceptual_lookup_finds_nearest_within_threshold(monkeypatch):
+    monkeypatch.setattr(result_cache, "gallery_tags", lambda categories: ("tag",))
+    cache = result_cache.ResultCache("test", max_entries=3, hamming_threshold=4)
+    cache.put(_key("a", 0), "a", ("tag",))
+    cache.put(_key("b", 0xFF), "b", ("tag",))
+
+    assert cache.get(_key("x", 0b111)) == "a"          # 距離 3
+    assert cache.get(_key("y", 0xFF | 1 << 63)) == "b"  # 距離 1
+    assert cache.get(_key("z", 0xF0F0)) is None         # 都超過門檻
+
+
+def test_evicted_entries_are_not_matched_perceptually(monkeypatch):
+    monkeypatch.setattr(result_cache, "gallery_tags", lambda categories: ("tag",))
+    cache = result_cache.ResultCache("test", max_entries=2, hamming_threshold=4)
+    for i, phash in enumerate((0, 0xFFFF << 40, 0xFFFF << 20)):
+        cache.put(_key(str(i), phash), i, ("tag",))
+
+    assert cache.get(_key("q", 1)) is None  # 最舊的 0 已被淘汰
+    assert cache.get(_key("r", 0xFFFF << 20 | 1)) == 2
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from backend import verification
+from backend.columnar_store import KEYPOINT_DTYPE
+
+
+def _scene(rng, votes):
+    """
+    votes[i] 個查詢描述子的最近鄰落在圖庫第 i 張圖；第 0 張圖的關鍵點位置隨機，
+    其餘為查詢點平移後的位置（幾何一致）
+    """
+    query_pts, kps, image_ids = [], [], []
+    for image_idx, n in enumerate(votes):
+        pts = rng.uniform(0, 400, (n, 2)).astype("float32")
+        dst = rng.uniform(0, 400, (n, 2)) if image_idx == 0 else pts + (15, -8)
+        kp = np.zeros(n, dtype=KEYPOINT_DTYPE)
+        kp["x"], kp["y"] = dst[:, 0], dst[:, 1]
+        query_pts.append(pts)
+        kps.append(kp)
+        image_ids += [image_idx] * n
+    rows = len(image_ids)
+    D = np.tile([0.1, 1.0], (rows, 1)).astype("float32")
+    I = np.stack([np.arange(rows), np.arange(rows)], axis=1)
+    gallery = SimpleNamespace(keypoints=np.concatenate(kps), image_ids=np.array(image_ids))
+    return np.concatenate(query_pts), D, I, gallery
+
+
+def test_stops_at_first_verified_candidate(monkeypatch):
+    query_pts, D, I, gallery = _scene(np.random.default_rng(4), [30, 25, 20])
+    checked = []
+    count_inliers = verification.count_inliers
+
+    def spy(src, dst, geometry=verification.GEOMETRY):
+        checked.append(len(src))
+        return count_inliers(src, dst, geometry)
+
+    monkeypatch.setattr(verification, "count_inliers", spy)
+    result = verification.verify_candidates(query_pts, D, I, [(0, 30), (1, 25), (2, 20)], gallery)
+
+    assert checked == [30, 25]  # 第 2 名通過後不再驗證第 3 名
+    assert result[0][:2] == (1, 25) and result[0][2] >= verification.MIN_INLIERS
+    assert result[1][:2] == (0, 30) and result[1][2] < verification.MIN_INLIERS
+    assert len(result) == 2
+
+
+def test_min_inliers_cutoff(monkeypatch):
+    query_pts, D, I, gallery = _scene(np.random.default_rng(5), [30, 25, 20])
+    candidates = [(0, 30), (1, 25), (2, 20)]
+    below = verification.MIN_INLIERS - 1
+
+    inliers = iter([5, below, below])
+    monkeypatch.setattr(verification, "count_inliers", lambda src, dst, geometry: next(inliers))
+    # 都未達門檻：全部驗證，依內點數排序，同數時保留投票順序
+    assert verification.verify_candidates(query_pts, D, I, candidates, gallery) == [
+        (1, 25, below), (2, 20, below), (0, 30, 5)]
+
+    inliers = iter([verification.MIN_INLIERS, 99])
+    monkeypatch.setattr(verification, "count_inliers", lambda src, dst, geometry: next(inliers))
+    # 剛好達門檻即採用，不再驗證後面的候選
+    assert verification.verify_candidates(query_pts, D, I, candidates, gallery) == [
+        (0, 30, verification.MIN_INLIERS)]
@@ -0,0 +1,59 @@
+import numpy as np
+
+from backend import voting
+
+
+def _search_result(rng, n_queries, n_rows):
+    """ 模擬 index.search(..., 2)：距離遞增，部分查詢找不到鄰居（FAISS 以 -1 表示） """
+    D = np.sort(rng.random((n_queries, 2)).astype("float32"), axis=1)
+    I = rng.integers(0, n_rows, size=(n_queries, 2))
+    I[rng.random(n_queries) < 0.1, 0] = -1
+    return D, I
+
+
+def _loop_votes(D, I, descs_per_image, ratio=voting.RATIO):
+    """ 原本的逐列迴圈：通過 ratio test 的最近鄰以 searchsorted 找出所屬圖片後計票 """
+    boundaries = np.cumsum(descs_per_image)
+    votes = {}
+    for qi in range(len(D)):
+        d0, d1 = D[qi]
+        tr = int(I[qi, 0])
+        if tr >= 0 and d0 < ratio * d1:
+            idx = int(np.searchsorted(boundaries, tr, side="right"))
+            votes[idx] = votes.get(idx, 0) + 1
+    return votes
+
+
+def test_ratio_mask_rejects_missing_neighbours():
+    D = np.array([[1.0, 2.0], [1.0, 1.05], [1.0, 2.0], [0.0, 0.0]], dtype="float32")
+    I = np.array([[3, 4], [3, 4], [-1, -1], [5, 6]])
+    assert voting.ratio_mask(D, I).tolist() == [True, False, False, False]
+
+
+def test_bincount_votes_match_the_loop():
+    rng = np.random.default_rng(0)
+    descs_per_image = rng.integers(1, 40, size=25)
+    image_ids = np.repeat(np.arange(len(descs_per_image)), descs_per_image)
+    D, I = _search_result(rng, 500, len(image_ids))
+
+    votes = voting.count_votes(D, I, image_ids, len(descs_per_image))
+    expected = _loop_votes(D, I, descs_per_image)
+    assert {i: int(v) for i, v in enumerate(votes) if v} == expected
+
+
+def test_top_candidates_order_and_min_votes():
+    votes = np.array([3, 7, 1, 7, 0, 2])
+    assert voting.top_candidates(votes, k=4) == [(1, 7), (3, 7), (0, 3), (5, 2)]
+    assert voting.top_candidates(votes, k=5, min_votes=3) == [(1, 7), (3, 7), (0, 3)]
+
+
+def test_vote_batched_matches_per_crop_vote():
+    rng = np.random.default_rng(1)
+    image_ids = np.repeat(np.arange(12), 30)
+    sizes = [40, 0, 75, 12]  # 包含沒有描述子的裁切圖
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    D, I = _search_result(rng, offsets[-1], len(image_ids))
+
+    batched = voting.vote_batched(D, I, offsets, image_ids, 12)
+    per_crop = [voting.vote(D[s:e], I[s:e], image_ids, 12) for s, e in zip(offsets[:-1], offsets[1:])]
+    assert batched == per_crop